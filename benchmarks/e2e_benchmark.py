@@ -0,0 +1,178 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+from time import perf_counter
+import yaml
+
+from benchmarks.mock_servers import FakeListener, MockSourceServer, MockSourceSettings
+from src.config.ConfigReader import ConfigReader
+from src.manager.TaskManager import TaskManager
+
+SOURCES = ["graph", "cloudflare", "cloudflare_logs", "onepassword", "google"]
+
+logger = logging.getLogger(__name__)
+
+
+def build_source_config(source, source_url):
+    """
+    Creates the API input config of the given source, pointed to the mock source server.
+    :param source: the source name (one of SOURCES)
+    :param source_url: the mock source server URL
+    :return: the input config
+    """
+    data_url = f"{source_url}/{source}/data"
+    name = f"benchmark {source}"
+    if source == "graph":
+        return {"name": name, "type": "azure_graph", "azure_ad_tenant_id": "tenant", "azure_ad_client_id": "client",
+                "azure_ad_secret_value": "secret", "data_request": {"url": data_url}}
+    if source == "cloudflare":
+        return {"name": name, "type": "cloudflare", "cloudflare_account_id": "account",
+                "cloudflare_bearer_token": "token", "url": data_url, "days_back_fetch": 1,
+                "next_url": f"{data_url}?since={{res.result.[0].sent}}"}
+    if source == "cloudflare_logs":
+        return {"name": name, "type": "cloudflare_logs", "cloudflare_account_id": "account",
+                "cloudflare_bearer_token": "token", "url": data_url, "days_back_fetch": 1}
+    if source == "onepassword":
+        return {"name": name, "type": "1password", "onepassword_bearer_token": "token", "url": data_url,
+                "onepassword_limit": 1000}
+    if source == "google":
+        # Google Workspace authenticates with a service account through the Google libraries, hence its pageToken
+        # pagination is emulated with a general input
+        return {"name": name, "type": "general", "url": data_url, "response_data_path": "items",
+                "pagination": {"type": "url", "url_format": f"{data_url}?pageToken={{res.nextPageToken}}",
+                               "stop_indication": {"field": "nextPageToken", "condition": "empty"}}}
+    raise ValueError(f"Unknown source '{source}', expected one of {SOURCES}.")
+
+
+def percentile(values, percent):
+    """
+    :param values: the values
+    :param percent: the percentile (0 to 100)
+    :return: the nearest-rank percentile of the values, or 0 if there are no values
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _prepare_cycle(api, source_url, backlog_hours):
+    """
+    Points the API at the mock server before a cycle, for the parts that are not set by the config.
+    :param api: the API instance
+    :param source_url: the mock source server URL
+    :param backlog_hours: hours of logs for Cloudflare Logs to fetch in every cycle
+    """
+    if hasattr(api, "token_request"):
+        api.token_request.url = f"{source_url}/graph/token"
+    if hasattr(api, "next_start_time"):
+        # Cloudflare Logs only fetches windows that ended, every cycle re-fetches the backlog hours instead
+        api.next_start_time = datetime.now(timezone.utc) - timedelta(hours=backlog_hours)
+
+
+def run_benchmark(sources=SOURCES, cycles=3, settings=None, backlog_hours=6):
+    """
+    Runs the given sources against the mock source servers and the fake listener, every cycle runs the task of all the
+    sources concurrently (as the scheduler does) through TaskManager.
+    :param sources: the sources to run
+    :param cycles: the amount of cycles to run
+    :param settings: MockSourceSettings of the mock source responses
+    :param backlog_hours: hours of logs for Cloudflare Logs to fetch in every cycle
+    :return: dictionary of the results
+    """
+    settings = settings or MockSourceSettings()
+    task_durations = {}
+    task_records = {}
+
+    def collect_task_stats(api_name, logs_count, duration, succeeded):
+        task_durations.setdefault(api_name, []).append(duration)
+        task_records[api_name] = task_records.get(api_name, 0) + logs_count
+
+    with MockSourceServer(settings) as source_server, FakeListener() as listener, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        conf_path = os.path.join(tmp_dir, "config.yaml")
+        with open(conf_path, "w") as conf_file:
+            yaml.safe_dump({"apis": [build_source_config(source, source_server.url) for source in sources],
+                            "logzio": {"url": listener.url, "token": "benchmark"}}, conf_file)
+
+        apis = ConfigReader(conf_path).api_instances
+        task_manager = TaskManager(apis=apis, stats_callback=collect_task_stats)
+
+        start_time = perf_counter()
+        for _ in range(cycles):
+            threads = []
+            for api in apis:
+                _prepare_cycle(api, source_server.url, backlog_hours)
+                threads.append(threading.Thread(target=task_manager._run_api_task, args=(api,)))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = perf_counter() - start_time
+        listener_stats = listener.stats
+
+    all_durations = [duration for durations in task_durations.values() for duration in durations]
+    return {
+        "sources": list(sources),
+        "cycles": cycles,
+        "elapsed_seconds": round(elapsed, 3),
+        "records": listener_stats["records"],
+        "bytes": listener_stats["bytes"],
+        "compressed_bytes": listener_stats["compressed_bytes"],
+        "bulks": listener_stats["bulks"],
+        "records_per_second": round(listener_stats["records"] / elapsed, 1),
+        "bytes_per_second": round(listener_stats["bytes"] / elapsed, 1),
+        "p50_cycle_seconds": round(percentile(all_durations, 50), 4),
+        "p99_cycle_seconds": round(percentile(all_durations, 99), 4),
+        "records_per_source": task_records,
+        "p99_cycle_seconds_per_source": {name: round(percentile(durations, 99), 4)
+                                         for name, durations in task_durations.items()},
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def __get_args():
+    parser = argparse.ArgumentParser(description="Logzio API Fetcher end-to-end throughput benchmark")
+    parser.add_argument("--sources", type=str, default=",".join(SOURCES),
+                        help=f"Comma separated sources to run (default: all of {', '.join(SOURCES)})")
+    parser.add_argument("--cycles", type=int, default=3, help="Amount of cycles to run (default: 3)")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per request chain or window (default: 5)")
+    parser.add_argument("--records-per-page", type=int, default=100, help="Records in every page (default: 100)")
+    parser.add_argument("--record-size", type=int, default=512, help="Approximate record size in bytes (default: 512)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay of every source response (default: 0)")
+    parser.add_argument("--error-rate-429", type=float, default=0, help="Fraction of 429 responses (default: 0)")
+    parser.add_argument("--error-rate-5xx", type=float, default=0, help="Fraction of 503 responses (default: 0)")
+    parser.add_argument("--backlog-hours", type=int, default=6,
+                        help="Hours of 1-hour windows Cloudflare Logs fetches in every cycle (default: 6)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the errors injection (default: 0)")
+    parser.add_argument("--output", type=str, default=None, help="Path to write the results JSON to")
+    parser.add_argument("--level", type=str, default="ERROR", help="Logging level of the fetcher (default: ERROR)")
+    return parser.parse_args()
+
+
+def main():
+    args = __get_args()
+    logging.basicConfig(level=args.level, format="%(asctime)s [%(levelname)s]: %(message)s")
+
+    settings = MockSourceSettings(pages=args.pages, records_per_page=args.records_per_page,
+                                  record_size=args.record_size, latency_ms=args.latency_ms,
+                                  error_rate_429=args.error_rate_429, error_rate_5xx=args.error_rate_5xx,
+                                  seed=args.seed)
+    results = run_benchmark(sources=[source.strip() for source in args.sources.split(",") if source.strip()],
+                            cycles=args.cycles, settings=settings, backlog_hours=args.backlog_hours)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
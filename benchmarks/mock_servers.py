@@ -0,0 +1,215 @@
+from datetime import datetime, UTC
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+from time import sleep
+from urllib.parse import urlparse, parse_qs
+
+
+class MockSourceSettings:
+    """
+    Settings of the mock source APIs responses.
+    :param pages: the amount of pages every request chain (or Cloudflare Logs window) returns
+    :param records_per_page: the amount of records in every page
+    :param record_size: the approximate size of every record in bytes
+    :param latency_ms: delay to add to every response
+    :param error_rate_429: the fraction of requests to answer with 429 (Too Many Requests)
+    :param error_rate_5xx: the fraction of requests to answer with 503 (Service Unavailable)
+    :param seed: seed of the errors injection, for reproducible runs
+    """
+    def __init__(self, pages=5, records_per_page=100, record_size=512, latency_ms=0, error_rate_429=0.0,
+                 error_rate_5xx=0.0, seed=0):
+        self.pages = pages
+        self.records_per_page = records_per_page
+        self.record_size = record_size
+        self.latency_ms = latency_ms
+        self.error_rate_429 = error_rate_429
+        self.error_rate_5xx = error_rate_5xx
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def get_error_status(self):
+        """
+        :return: the status code of an injected error, or None to answer normally
+        """
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.error_rate_429:
+            return 429
+        if draw < self.error_rate_429 + self.error_rate_5xx:
+            return 503
+        return None
+
+
+class _MockSourceHandler(BaseHTTPRequestHandler):
+    """
+    Emulates the responses and pagination of the supported source APIs, by the first part of the request path:
+    - /graph: Azure Graph 'value' pages linked with '@odata.nextLink' (and /graph/token for the OAuth token)
+    - /cloudflare: Cloudflare 'result' pages by the 'page' param, until an empty page
+    - /cloudflare_logs: Cloudflare Logs NDJSON for every 'start' and 'end' window
+    - /onepassword: 1Password 'items' pages by the body 'cursor', with 'has_more'
+    - /google: Google Workspace 'items' pages linked with 'nextPageToken'
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def _create_records(self, page, date_key, date_format="%Y-%m-%dT%H:%M:%S.%fZ"):
+        """
+        :param page: the page number
+        :param date_key: the name of the record date field
+        :param date_format: the format of the record date
+        :return: the records of the page
+        """
+        date = datetime.now(UTC).strftime(date_format)
+        padding = "x" * max(self.settings.record_size - 150, 0)
+        return [{"id": f"{page}-{i}", date_key: date, "page": page,
+                 "action": "benchmark", "message": padding} for i in range(self.settings.records_per_page)]
+
+    def _send(self, status, body, content_type="application/json"):
+        """
+        Sends the response (body is JSON encoded if not bytes).
+        """
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, body=None):
+        if self.settings.latency_ms:
+            sleep(self.settings.latency_ms / 1000)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        source = url.path.strip("/").split("/")[0]
+        base_url = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}/{source}/data"
+        pages = self.settings.pages
+
+        if url.path == "/graph/token":
+            return self._send(200, {"access_token": "benchmark-token", "expires_in": 3600})
+
+        error_status = self.settings.get_error_status()
+        if error_status:
+            return self._send(error_status, {"error": "injected"})
+
+        if source == "graph":
+            page = int(query.get("page", [0])[0])
+            res = {"value": self._create_records(page, "createdDateTime", "%Y-%m-%dT%H:%M:%SZ") if page < pages else []}
+            if page + 1 < pages:
+                res["@odata.nextLink"] = f"{base_url}?page={page + 1}"
+            return self._send(200, res)
+
+        if source == "cloudflare":
+            page = int(query.get("page", [1])[-1])
+            records = self._create_records(page, "sent") if page <= pages else []
+            return self._send(200, {"result": records, "result_info": {"page": page}})
+
+        if source == "cloudflare_logs":
+            lines = b"".join(json.dumps(record).encode() + b"\n"
+                             for page in range(pages) for record in self._create_records(page, "EdgeStartTimestamp"))
+            return self._send(200, lines, content_type="application/x-ndjson")
+
+        if source == "onepassword":
+            cursor = (json.loads(body or b"{}") or {}).get("cursor")
+            page = int(cursor) if cursor else 0
+            return self._send(200, {"items": self._create_records(page, "timestamp"), "cursor": str(page + 1),
+                                    "has_more": page + 1 < pages})
+
+        if source == "google":
+            page = int(query.get("pageToken", [0])[0])
+            res = {"items": self._create_records(page, "time")}
+            if page + 1 < pages:
+                res["nextPageToken"] = str(page + 1)
+            return self._send(200, res)
+
+        return self._send(404, {"error": f"Unknown mock source path {url.path}"})
+
+    def do_GET(self):
+        # Some sources (such as 1Password) send a body with GET requests
+        self._handle(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+    do_POST = do_GET
+
+
+class _FakeListenerHandler(BaseHTTPRequestHandler):
+    """
+    Accepts the gzip bulks of the Logz.io shipper and counts their records and bytes.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        data = gzip.decompress(body) if self.headers.get("Content-Encoding") == "gzip" else body
+        records = data.count(b"\n") + 1 if data else 0
+
+        stats = self.server.stats
+        with self.server.lock:
+            stats["bulks"] += 1
+            stats["records"] += records
+            stats["bytes"] += len(data)
+            stats["compressed_bytes"] += len(body)
+
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class _MockServer:
+    """
+    Runs an HTTP server with the given handler on a free local port, in a background thread.
+    """
+    def __init__(self, handler):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MockSourceServer(_MockServer):
+    """
+    Local server of the mock source APIs.
+    :param settings: MockSourceSettings of the responses
+    """
+    def __init__(self, settings):
+        super().__init__(_MockSourceHandler)
+        self.server.settings = settings
+
+
+class FakeListener(_MockServer):
+    """
+    Local fake Logz.io listener, which counts the received records and bytes.
+    """
+    def __init__(self):
+        super().__init__(_FakeListenerHandler)
+        self.server.lock = threading.Lock()
+        self.server.stats = {"bulks": 0, "records": 0, "bytes": 0, "compressed_bytes": 0}
+
+    @property
+    def stats(self):
+        with self.server.lock:
+            return dict(self.server.stats)
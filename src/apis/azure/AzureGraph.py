@@ -1,41 +1,68 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, UTC
 import logging
+from pydantic import Field
 import re
 
 from src.apis.azure.AzureApi import AzureApi
 from src.apis.general.Api import ApiFetcher
+from src.apis.general.BackfillPlanner import BackfillPlanner, MAX_BACKFILL_SLICES
 from src.apis.general.PaginationSettings import PaginationSettings
 from src.apis.general.StopPaginationSettings import StopPaginationSettings
+from src.utils.processing_functions import substitute_vars
 
 
 DATE_FROM_END_PATTERN = re.compile(r'(\S+)$')
 DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+NEXT_LINK_KEY = "@odata.nextLink"
+DELTA_LINK_KEY = "@odata.deltaLink"
+DELTA_MAX_CALLS = 1000
 
 logger = logging.getLogger(__name__)
 
 
 class AzureGraph(AzureApi):
+    """
+    :param delta_query: True to track changes with a Graph delta query (data_request.url should point to a '/delta'
+                        endpoint) instead of polling with a date filter.
+    :param backfill_slices: The amount of time slices to split the first request 'days_back_fetch' range to, and fetch
+                            concurrently.
+    """
+    delta_query: bool = Field(default=False, frozen=True)
+    backfill_slices: int = Field(default=1, frozen=True, ge=1, le=MAX_BACKFILL_SLICES)
+    _backfill_planner: BackfillPlanner = None
 
     def __init__(self, **data):
         """
         Initialize request for Azure Graph API.
         """
         # Initializing the data requests
-        data_request = ApiFetcher(**data.pop("data_request"),
-                                  pagination=PaginationSettings(
-                                      type="url",
-                                      url_format="{res.@odata\\.nextLink}",
-                                      stop_indication=StopPaginationSettings(field="value",
-                                                                             condition="empty")),
-                                  response_data_path="value")
+        if data.get("delta_query"):
+            # Delta query pages are followed by the class itself, to be able to save the delta link of the last page
+            data_request = ApiFetcher(**data.pop("data_request"), response_data_path="value")
+        else:
+            data_request = ApiFetcher(**data.pop("data_request"),
+                                      pagination=PaginationSettings(
+                                          type="url",
+                                          url_format="{res.@odata\\.nextLink}",
+                                          stop_indication=StopPaginationSettings(field="value",
+                                                                                 condition="empty")),
+                                      response_data_path="value")
         super().__init__(data_request=data_request, **data)
 
+        if self.delta_query:
+            return
+
         # Initialize date filter in the first data request
         self._initialize_url_date()
 
         # Initialize data request next_url format
         self._initialize_next_url()
 
+        if self.backfill_slices > 1:
+            self._backfill_planner = BackfillPlanner(self.name,
+                                                     datetime.now(UTC) - timedelta(days=self.days_back_fetch),
+                                                     self.backfill_slices)
+
     def _initialize_url_date(self):
         """
         initializing the data request url to be in format:
@@ -60,15 +87,115 @@ class AzureGraph(AzureApi):
         """
         return re.sub(DATE_FROM_END_PATTERN, req_val, self.data_request.url)
 
+    def _create_backfill_request(self, start, end):
+        """
+        Creates a data request for a single backfill slice, in format:
+        https://url/from/input?$filter=createdDateTime gt 2024-05-28T13:08:54Z and createdDateTime le 2024-05-28T19:08:54Z
+        :param start: the slice start time
+        :param end: the slice end time
+        :return: ApiFetcher instance of the slice
+        """
+        slice_filter = f"{start.strftime(DATE_FORMAT)} and {self.date_filter_key} le {end.strftime(DATE_FORMAT)}"
+        return self.data_request.model_copy(update={"url": self._replace_url_date(slice_filter),
+                                                    "headers": dict(self.data_request.headers),
+                                                    "next_url": None})
+
+    def _complete_backfill(self, end):
+        """
+        Updates the date filter to continue from the end of the backfill.
+        :param end: the backfill end time
+        """
+        self.data_request.url = self._replace_url_date(end.strftime(DATE_FORMAT))
+
+    def _update_url_date(self, res):
+        """
+        Updates the date filter of the data request URL according to the given first response of a run, and adds 1
+        second to it to avoid duplicates in the next call.
+        Used when the data request is not sent by the data request itself (such as in a Graph batch call).
+        :param res: the first response of the run
+        """
+        try:
+            self.data_request.url = substitute_vars(self.data_request.next_url, self.data_request.url_vars, res)
+        except ValueError as e:
+            logger.warning(f"Failed to update the {self.name} date filter due to error: {e}")
+            return
+        if not self.dedup:
+            self.data_request.add_seconds_to_url_date_filter(1, DATE_FORMAT, DATE_FROM_END_PATTERN)
+
+    def _update_delta_url(self, res):
+        """
+        Moves the data request URL to the next page of the delta query, or to the delta link once the last page was
+        reached, so the next cycle only requests the changes made since.
+        :param res: the delta query response
+        :return: True if there are more pages to fetch, False otherwise.
+        """
+        if not isinstance(res, dict):
+            return False
+
+        next_link = res.get(NEXT_LINK_KEY)
+        if next_link:
+            self.data_request.url = next_link
+            return True
+
+        delta_link = res.get(DELTA_LINK_KEY)
+        if delta_link:
+            self.data_request.url = delta_link
+        else:
+            logger.warning(f"Did not find '{NEXT_LINK_KEY}' or '{DELTA_LINK_KEY}' in the {self.name} delta response. "
+                           f"Next request will be sent to the same URL.")
+        return False
+
+    def _send_delta_request(self):
+        """
+        Follows the delta query pages until reaching the delta link.
+        If a page fails (or DELTA_MAX_CALLS or the cycle deadline is reached, or there is no room in the memory budget),
+        the URL stays on the last page link to resume from it.
+        :return: all the responses that were received
+        """
+        data = []
+        call_count = 0
+        self.data_request.start_cycle()
+
+        while call_count < DELTA_MAX_CALLS:
+            if call_count and (self.data_request.is_cycle_deadline_passed()
+                               or not self.data_request.has_memory_room()):
+                break
+
+            res = self.data_request._make_call()
+            call_count += 1
+
+            if not res:
+                # Had issue with sending request to the API, resuming from the same page in the next run
+                break
+
+            data.extend(self.data_request._extract_data_from_path(res))
+
+            if not self._update_delta_url(res):
+                break
+
+        if not data:
+            logger.info(f"No new data available from api {self.name}.")
+        return data
+
     def send_request(self):
         """
-        1. Sends request using the super class
-        2. Add 1 second to the date from the end of the URL to avoid duplicates in the next call
+        1. Sends request using the super class (or follows the delta query if 'delta_query' is on)
+        2. Add 1 second to the date from the end of the URL to avoid duplicates in the next call (if 'dedup' is not set)
         :return: all the responses that were received
         """
+        if self.delta_query:
+            self._update_token()
+            return self._send_delta_request()
+
+        if self._backfill_planner and not self._backfill_planner.done:
+            self._update_token()
+            return self._backfill_planner.run(self._create_backfill_request, self._complete_backfill)
+
         data = super().send_request()
 
-        # Add 1s to the time we took from the response to avoid duplicates
-        self.data_request.add_seconds_to_url_date_filter(1, DATE_FORMAT, DATE_FROM_END_PATTERN)
+        # Add 1s to the time we took from the response to avoid duplicates, unless they are dropped by the dedup (or the
+        # date filter was not updated since the pagination continues in the next run)
+        if not self.dedup and not self.data_request.pagination_resume:
+            self.data_request.add_seconds_to_url_date_filter(1, DATE_FORMAT, DATE_FROM_END_PATTERN)
 
         return data
@@ -0,0 +1,191 @@
+import logging
+from pydantic import Field
+from urllib.parse import urlsplit
+
+from src.apis.azure.AzureApi import AzureApi
+from src.apis.azure.AzureGraph import AzureGraph, DELTA_MAX_CALLS, NEXT_LINK_KEY
+from src.apis.general.Api import ApiFetcher, ReqMethod, SUCCESS_CODES
+from src.utils import json_codec
+from src.utils.LogPreview import LogPreview
+
+MAX_BATCH_REQUESTS = 20  # Graph limit of requests in a single JSON batch
+BATCH_PATH = "/$batch"
+
+logger = logging.getLogger(__name__)
+
+
+class AzureGraphBatch(AzureApi):
+    """
+    Combines the requests of several Azure Graph endpoints, which share the same token, into Graph JSON batch calls.
+    :param data_requests: List of Azure Graph data requests. Each one requires 'url' and supports 'date_filter_key'
+                          and 'delta_query' as in Azure Graph.
+    :param graph_apis: Not passed to the class, AzureGraph instance per data request that holds its URL and date filter.
+                       They share the dedup settings of the batch, which drops the duplicates of all their logs.
+    :param chains_resume: Not passed to the class, the pages chains state (by the data request index) of the date filter
+                          requests that stopped on the memory budget, to continue them from their next page in the next
+                          run.
+    """
+    name: str = Field(default="azure graph batch")
+    data_requests: list = Field(frozen=True, min_length=1)
+    graph_apis: list = Field(default=[], init=False, init_var=True)
+    chains_resume: dict = Field(default={}, init=False, init_var=True)
+
+    def __init__(self, **data):
+        """
+        Initialize the Graph batch request and an AzureGraph instance per data request.
+        """
+        data_request = ApiFetcher(name="Graph batch",
+                                  url=BATCH_PATH,
+                                  headers={"Content-Type": "application/json"},
+                                  method=ReqMethod.POST)
+        super().__init__(data_request=data_request, **data)
+
+        for graph_request in self.data_requests:
+            graph_request = dict(graph_request)
+            self.graph_apis.append(AzureGraph(name=f"{self.name} ({graph_request.get('url')})",
+                                              azure_ad_tenant_id=self.azure_ad_tenant_id,
+                                              azure_ad_client_id=self.azure_ad_client_id,
+                                              azure_ad_secret_value=self.azure_ad_secret_value,
+                                              days_back_fetch=self.days_back_fetch,
+                                              dedup=self.dedup,
+                                              date_filter_key=graph_request.pop("date_filter_key",
+                                                                                self.date_filter_key),
+                                              delta_query=graph_request.pop("delta_query", False),
+                                              data_request=graph_request))
+
+    @staticmethod
+    def _split_graph_url(url):
+        """
+        Splits a Graph URL to the service root (including the version) and the URL relative to it, as needed for a
+        batch request.
+        Example: https://graph.microsoft.com/v1.0/auditLogs/signIns?$top=1 >> https://graph.microsoft.com/v1.0,
+                 /auditLogs/signIns?$top=1
+        :param url: the full Graph URL
+        :return: the service root and the relative URL
+        """
+        split_url = urlsplit(url)
+        version = split_url.path.lstrip("/").split("/")[0]
+        service_root = f"{split_url.scheme}://{split_url.netloc}/{version}"
+        return service_root, url[len(service_root):]
+
+    def _send_batch(self, service_root, requests_urls):
+        """
+        Sends a single Graph JSON batch request. The request is built per call from the batch data request (sharing its
+        headers and session), so the shared data request is not changed.
+        :param service_root: the Graph service root to send the batch to (such as https://graph.microsoft.com/v1.0)
+        :param requests_urls: dictionary of the sub request id and its full URL
+        :return: dictionary of the sub request id and its response, or None if the batch request failed.
+        """
+        batch_body = {"requests": [{"id": req_id, "method": ReqMethod.GET.value,
+                                    "url": self._split_graph_url(url)[1]}
+                                   for req_id, url in requests_urls.items()]}
+        batch_request = self.data_request.model_copy(update={"url": service_root + BATCH_PATH,
+                                                             "body": json_codec.dumps(batch_body)})
+
+        res = batch_request._make_call()
+        if not isinstance(res, dict):
+            return None
+        return {sub_res.get("id"): sub_res for sub_res in res.get("responses", [])}
+
+    @staticmethod
+    def _handle_page(graph_api, state, res):
+        """
+        Extracts the data from a sub response and updates the state of its pages chain.
+        :param graph_api: the AzureGraph instance the sub response belongs to
+        :param state: the pages chain state of the AzureGraph instance in the current run
+        :param res: the sub response body
+        """
+        data = graph_api.data_request._extract_data_from_path(res)
+        state["data"].extend(data)
+
+        if graph_api.delta_query:
+            # The delta query moves the data request URL along the pages, up to the delta link
+            state["page_url"] = graph_api.data_request.url if graph_api._update_delta_url(res) else None
+            return
+
+        if state["first_res"] is None:
+            state["first_res"] = res
+        next_link = res.get(NEXT_LINK_KEY) if isinstance(res, dict) else None
+        state["page_url"] = next_link if data else None
+
+    @staticmethod
+    def _max_calls(graph_api):
+        """
+        Returns the max amount of calls the given AzureGraph instance can make in a single run.
+        :param graph_api: the AzureGraph instance
+        :return: the max amount of calls, including the first request
+        """
+        if graph_api.delta_query:
+            return DELTA_MAX_CALLS
+        return graph_api.data_request.pagination_settings.max_calls + 1
+
+    def send_request(self):
+        """
+        1. Makes sure the token expiration is not passed
+        2. Sends the current request of every AzureGraph instance (first request or next page) in batch calls of up
+           to MAX_BATCH_REQUESTS, until all the pages chains ended (or there is no room in the memory budget)
+        3. Updates the date filter of every AzureGraph instance according to its first response, or keeps the next page
+           of the chains that were stopped by the memory budget to continue from it in the next run
+        :return: all the responses that were received
+        """
+        self._update_token()
+        states = {}
+        for idx, graph_api in enumerate(self.graph_apis):
+            resume = self.chains_resume.pop(str(idx), None)
+            states[str(idx)] = dict(resume, data=[]) if resume else {"page_url": graph_api.data_request.url,
+                                                                      "first_res": None, "data": [], "calls": 0}
+
+        stopped = False
+        batches_count = 0
+        while True:
+            # Group the requests which are due by their Graph service root (such as v1.0 and beta)
+            due_requests = {}
+            for req_id, state in states.items():
+                if state["page_url"] and state["calls"] < self._max_calls(self.graph_apis[int(req_id)]):
+                    service_root = self._split_graph_url(state["page_url"])[0]
+                    due_requests.setdefault(service_root, {})[req_id] = state["page_url"]
+            if not due_requests:
+                break
+            if batches_count and not self.data_request.has_memory_room():
+                stopped = True
+                break
+
+            for service_root, requests_urls in due_requests.items():
+                req_ids = list(requests_urls)
+                for i in range(0, len(req_ids), MAX_BATCH_REQUESTS):
+                    batch_urls = {req_id: requests_urls[req_id] for req_id in req_ids[i:i + MAX_BATCH_REQUESTS]}
+                    logger.debug(f"Sending batch of {len(batch_urls)} requests for api {self.name}")
+                    responses = self._send_batch(service_root, batch_urls)
+                    batches_count += 1
+
+                    for req_id in batch_urls:
+                        graph_api, state = self.graph_apis[int(req_id)], states[req_id]
+                        state["calls"] += 1
+                        sub_res = (responses or {}).get(req_id)
+
+                        if not sub_res or sub_res.get("status") not in SUCCESS_CODES:
+                            # Stopping this chain, the request will be sent again in the next run
+                            logger.error("Failed to get data from %s in batch request (id: %s, status: %s). "
+                                         "Response: %s", graph_api.name, req_id,
+                                         sub_res.get("status") if sub_res else None, LogPreview(sub_res))
+                            state["page_url"] = None
+                            continue
+                        self._handle_page(graph_api, state, sub_res.get("body"))
+
+        data = []
+        for req_id, state in states.items():
+            graph_api = self.graph_apis[int(req_id)]
+            data.extend(state["data"])
+            first_res = state["first_res"] if isinstance(state["first_res"], dict) else {}
+            if stopped and not graph_api.delta_query and state["page_url"] and first_res \
+                    and state["calls"] < self._max_calls(graph_api):
+                # Not moving the date filter until the chain completes, only the first record of the first response
+                # is kept for it
+                self.chains_resume[req_id] = {"page_url": state["page_url"], "calls": state["calls"],
+                                              "first_res": {"value": first_res.get("value", [])[:1]}}
+                continue
+            if not state["data"]:
+                logger.info(f"No new data available from api {graph_api.name}.")
+            if not graph_api.delta_query and first_res.get("value"):
+                graph_api._update_url_date(first_res)
+        return data
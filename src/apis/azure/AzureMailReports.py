@@ -1,20 +1,27 @@
 import re
-from datetime import datetime, UTC
+from datetime import datetime, timedelta, UTC
 from pydantic import Field
 
 from src.apis.azure.AzureApi import AzureApi
 from src.apis.general.Api import ApiFetcher
+from src.apis.general.BackfillPlanner import BackfillPlanner, MAX_BACKFILL_SLICES
 from src.apis.general.PaginationSettings import PaginationSettings
 from src.apis.general.StopPaginationSettings import StopPaginationSettings
 
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
 
 class AzureMailReports(AzureApi):
     """
     :param date_filter_key: The name of key to use for the start date filter in the request URL params.
     :param end_date_filter_key: The name of key to use for the end date filter in the request URL params.
+    :param backfill_slices: The amount of time slices to split the first request 'days_back_fetch' range to, and fetch
+                            concurrently.
     """
     date_filter_key: str = Field(default="StartDate", alias="start_date_filter_key")  # Overwrite parent default value
     end_date_filter_key: str = Field(default="EndDate")
+    backfill_slices: int = Field(default=1, frozen=True, ge=1, le=MAX_BACKFILL_SLICES)
+    _backfill_planner: BackfillPlanner = None
 
     def __init__(self, **data):
         """
@@ -39,14 +46,28 @@ class AzureMailReports(AzureApi):
         fetch_end_date = self._get_end_date()
         self._initialize_url_date(fetch_start_date, fetch_end_date)
 
+        if self.backfill_slices > 1:
+            self._backfill_planner = BackfillPlanner(self.name,
+                                                     datetime.now(UTC) - timedelta(days=self.days_back_fetch),
+                                                     self.backfill_slices)
+
     def _initialize_url_date(self, fetch_start_date, fetch_end_date):
         """
         initializing the data request url to be in format:
         https://url/from/input?$filter=StartDate eq datetime '2024-05-28T13:08:54Z' and EndDate eq datetime '2024-05-29T13:08:54Z'
         """
-        self.data_request.url = (self.data_request.next_url
-                                 .replace(f"{{res.d.results.[0].{self.end_date_filter_key}}}", fetch_start_date)
-                                 .replace("NOW_DATE", fetch_end_date))
+        self.data_request.url = self._get_url_with_dates(fetch_start_date, fetch_end_date)
+
+    def _get_url_with_dates(self, fetch_start_date, fetch_end_date):
+        """
+        Returns the data request next URL with the given start and end dates instead of its variables.
+        :param fetch_start_date: the start date
+        :param fetch_end_date: the end date
+        :return: the URL with the given dates
+        """
+        return (self.data_request.next_url
+                .replace(f"{{res.d.results.[0].{self.end_date_filter_key}}}", fetch_start_date)
+                .replace("NOW_DATE", fetch_end_date))
 
     def _initialize_next_url(self):
         """
@@ -58,7 +79,26 @@ class AzureMailReports(AzureApi):
 
     @staticmethod
     def _get_end_date():
-        return datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return datetime.now(UTC).strftime(DATE_FORMAT)
+
+    def _create_backfill_request(self, start, end):
+        """
+        Creates a data request for a single backfill slice.
+        :param start: the slice start time
+        :param end: the slice end time
+        :return: ApiFetcher instance of the slice
+        """
+        return self.data_request.model_copy(update={"url": self._get_url_with_dates(start.strftime(DATE_FORMAT),
+                                                                                    end.strftime(DATE_FORMAT)),
+                                                    "headers": dict(self.data_request.headers),
+                                                    "next_url": None})
+
+    def _complete_backfill(self, end):
+        """
+        Updates the date filter to continue from the end of the backfill (the end date is updated before each request).
+        :param end: the backfill end time
+        """
+        self.data_request.url = self._get_url_with_dates(end.strftime(DATE_FORMAT), "NOW_DATE")
 
     def send_request(self):
         """
@@ -67,6 +107,10 @@ class AzureMailReports(AzureApi):
         2. Sends request using the super class.
         :return: all the responses that were received
         """
+        if self._backfill_planner and not self._backfill_planner.done:
+            self._update_token()
+            return self._backfill_planner.run(self._create_backfill_request, self._complete_backfill)
+
         # Update the end date in the URL before sending a request
         self.data_request.url = self.data_request.url.replace("NOW_DATE", self._get_end_date())
 
@@ -4,6 +4,7 @@ from pydantic import Field
 import re
 
 from src.apis.general.Api import ApiFetcher
+from src.apis.general.BackfillPlanner import BackfillPlanner, MAX_BACKFILL_SLICES
 from src.apis.general.PaginationSettings import PaginationSettings
 from src.apis.general.StopPaginationSettings import StopPaginationSettings
 
@@ -21,11 +22,15 @@ class Cloudflare(ApiFetcher):
     :param cloudflare_bearer_token: The cloudflare Bearer token
     :param pagination_off: True if pagination should be off, False otherwise
     :param days_back_fetch: Amount of days to fetch back in the first request, Optional (adds a filter on 'since')
+    :param backfill_slices: The amount of time slices to split the first request 'days_back_fetch' range to, and fetch
+                            concurrently (requires 'days_back_fetch').
     """
     cloudflare_account_id: str = Field(frozen=True)
     cloudflare_bearer_token: str = Field(frozen=True)
     pagination_off: bool = Field(default=False)
     days_back_fetch: int = Field(default=-1, frozen=True)
+    backfill_slices: int = Field(default=1, frozen=True, ge=1, le=MAX_BACKFILL_SLICES)
+    _backfill_planner: BackfillPlanner = None
 
     def __init__(self, **data):
         res_data_path = "result"
@@ -35,7 +40,8 @@ class Cloudflare(ApiFetcher):
         }
         pagination = None
         if not data.get("pagination_off"):
-            if "?" in data.get("url"):
+            # The 'since' filter is added to the URL params if 'days_back_fetch' is set
+            if "?" in data.get("url") or data.get("days_back_fetch", -1) > 0:
                 url_format = "&page={res.result_info.page+1}"
             else:
                 url_format = "?page={res.result_info.page+1}"
@@ -55,6 +61,11 @@ class Cloudflare(ApiFetcher):
         if self.days_back_fetch > 0:
             self._initialize_url_date()
 
+            if self.backfill_slices > 1:
+                self._backfill_planner = BackfillPlanner(self.name,
+                                                         datetime.now(timezone.utc) - timedelta(days=self.days_back_fetch),
+                                                         self.backfill_slices)
+
     def _initialize_url_date(self):
         if "?" in self.url:
             self.url += f"&since={self._generate_start_fetch_date()}"
@@ -64,11 +75,44 @@ class Cloudflare(ApiFetcher):
     def _generate_start_fetch_date(self):
         return (datetime.now(timezone.utc) - timedelta(days=self.days_back_fetch)).strftime(DATE_FORMAT)
 
+    def _replace_url_since(self, since):
+        """
+        Replaces the 'since' filter value in the URL.
+        :param since: the new since time
+        :return: the URL with the new since time
+        """
+        org_date = re.search(FIND_DATE_PATTERN, self.url).group(1)
+        return self.url.replace(f"{DATE_FILTER_PARAMETER}{org_date}",
+                                f"{DATE_FILTER_PARAMETER}{since.strftime(DATE_FORMAT)}")
+
+    def _create_backfill_request(self, start, end):
+        """
+        Creates a request for a single backfill slice, filtered with 'since' and 'before'.
+        :param start: the slice start time
+        :param end: the slice end time
+        :return: ApiFetcher instance of the slice
+        """
+        return self.model_copy(update={"url": f"{self._replace_url_since(start)}&before={end.strftime(DATE_FORMAT)}",
+                                       "headers": dict(self.headers),
+                                       "next_url": None,
+                                       "outputs": []})
+
+    def _complete_backfill(self, end):
+        """
+        Updates the date filter to continue from the end of the backfill.
+        :param end: the backfill end time
+        """
+        self.url = self._replace_url_since(end)
+
     def send_request(self):
+        if self._backfill_planner and not self._backfill_planner.done:
+            return self._backfill_planner.run(self._create_backfill_request, self._complete_backfill)
+
         data = super().send_request()
 
-        # Add 1 second to a known date filter to avoid duplicates in the logs
-        if DATE_FILTER_PARAMETER in self.url:
+        # Add 1 second to a known date filter to avoid duplicates in the logs, unless they are dropped by the dedup (or
+        # the date filter was not updated since the pagination continues in the next run)
+        if DATE_FILTER_PARAMETER in self.url and not self.dedup and not self.pagination_resume:
             self.add_seconds_to_url_date_filter(1, DATE_FORMAT, FIND_DATE_PATTERN)
 
         return data
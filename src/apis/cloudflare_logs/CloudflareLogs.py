@@ -1,14 +1,22 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-import json
+from itertools import chain
 import logging
 from pydantic import Field
+import requests
+from time import perf_counter
 from typing import Optional
 
 from src.apis.general.Api import ApiFetcher
+from src.utils import json_codec, memory_budget, tracing
+from src.utils.LogPreview import LogPreview
 
 DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 MAX_WINDOW = timedelta(hours=1)
 END_BUFFER = timedelta(minutes=5)
+STREAM_CHUNK_SIZE = 64 * 1024  # 64 KB
+MAX_CONCURRENT_WINDOWS = 24
 
 logger = logging.getLogger(__name__)
 
@@ -18,14 +26,25 @@ class CloudflareLogs(ApiFetcher):
     Cloudflare Logs Received API integration.
     Supports the /zones/{zone_id}/logs/received endpoint which requires
     start and end query parameters and returns newline-delimited JSON (NDJSON).
+    The response body is streamed and decoded line by line, so only a chunk of each time window is held in memory.
+    A response which is a single JSON document is decoded as a whole, same as other APIs responses.
 
     :param cloudflare_account_id: The CloudFlare Account ID
     :param cloudflare_bearer_token: The Cloudflare Bearer token
     :param days_back_fetch: Amount of days to fetch back in the first request (default: 1, max: 7)
+    :param raw_passthrough: True to forward the raw NDJSON lines to the outputs without parsing them (default: False)
+    :param max_concurrent_windows: Amount of time windows to fetch in parallel (default: 1, max: 24). When above 1, each
+                                   window is read as a whole and the windows are still delivered in order.
+    :param fields: List of the log fields to request (Cloudflare 'fields' parameter), Optional (default: API default fields)
+    :param sample: Sample rate of the logs to request (Cloudflare 'sample' parameter, 0.001 to 1), Optional
     """
     cloudflare_account_id: str = Field(frozen=True)
     cloudflare_bearer_token: str = Field(frozen=True)
     days_back_fetch: int = Field(default=1, frozen=True, ge=1, le=7)
+    raw_passthrough: bool = Field(default=False, frozen=True)
+    max_concurrent_windows: int = Field(default=1, frozen=True, ge=1, le=MAX_CONCURRENT_WINDOWS)
+    fields: Optional[list[str]] = Field(default=None, frozen=True, min_length=1)
+    sample: Optional[float] = Field(default=None, frozen=True, ge=0.001, le=1)
 
     next_start_time: Optional[datetime] = Field(default=None, init=False, init_var=True)
 
@@ -41,32 +60,245 @@ class CloudflareLogs(ApiFetcher):
         self.next_start_time = datetime.now(timezone.utc) - timedelta(days=self.days_back_fetch)
 
     @staticmethod
-    def _build_url(base_url, start, end):
-        """Build the full URL with start and end parameters."""
+    def _build_url(base_url, start, end, fields=None, sample=None):
+        """Build the full URL with start and end parameters, and the fields and sample parameters if given."""
         separator = "&" if "?" in base_url else "?"
         start_str = start.strftime(DATE_FORMAT)
         end_str = end.strftime(DATE_FORMAT)
-        return f"{base_url}{separator}start={start_str}&end={end_str}"
+        url = f"{base_url}{separator}start={start_str}&end={end_str}"
+        if fields:
+            url += f"&fields={','.join(fields)}"
+        if sample is not None and sample < 1:
+            url += f"&sample={sample}"
+        return url
+
+    def _window_url(self, start, end):
+        """
+        Builds the request URL of a single time window.
+        :param start: the window start time
+        :param end: the window end time
+        :return: the time window request URL
+        """
+        return self._build_url(self.url, start, end, self.fields, self.sample)
 
     @staticmethod
-    def _parse_ndjson(text):
-        """Parse newline-delimited JSON response into a list of dicts."""
-        logs = []
-        for line in text.strip().split("\n"):
+    def _raw_ndjson(lines):
+        """
+        Yields the newline-delimited JSON lines as they are, without parsing them.
+        :param lines: iterable of the response lines (bytes)
+        :return: generator of the raw logs
+        """
+        for line in lines:
             line = line.strip()
             if line:
-                try:
-                    logs.append(json.loads(line))
-                except json.JSONDecodeError:
-                    logger.debug(f"Failed to parse NDJSON line: {line[:200]}")
-        return logs
+                yield line
+
+    @staticmethod
+    def _parse_ndjson(lines):
+        """
+        Parses newline-delimited JSON lines one by one.
+        :param lines: iterable of the response lines (str or bytes)
+        :return: generator of the parsed logs
+        """
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                log = json_codec.loads(line)
+            except json_codec.JSONDecodeError:
+                logger.debug("Failed to parse NDJSON line: %s", LogPreview(line, 200))
+                continue
+            if isinstance(log, list):
+                yield from log
+            else:
+                yield log
+
+    def _parse_response(self, lines):
+        """
+        Parses the response lines as NDJSON, or as a single JSON document if the response is one (such as an object
+        with the logs under 'response_data_path', or a document that spans several lines).
+        :param lines: iterable of the response lines (bytes)
+        :return: generator of the parsed logs
+        """
+        lines = (line for line in lines if line.strip())
+        first_line = next(lines, None)
+        if first_line is None:
+            return
+        second_line = next(lines, None)
+        if second_line is None:
+            lines = [first_line]
+        else:
+            try:
+                first_log = json_codec.loads(first_line)
+            except json_codec.JSONDecodeError:
+                # The response is read as a whole only if it does not start with a JSON line
+                lines = [first_line, second_line, *lines]
+            else:
+                # NDJSON, parsed line by line
+                if isinstance(first_log, list):
+                    yield from first_log
+                else:
+                    yield first_log
+                yield from self._parse_ndjson(chain([second_line], lines))
+                return
+
+        try:
+            response = json_codec.loads(b"\n".join(lines))
+        except json_codec.JSONDecodeError:
+            yield from self._parse_ndjson(lines)
+            return
+        if isinstance(response, list):
+            yield from response
+        elif isinstance(response, dict):
+            yield from self._extract_data_from_path(response)
+        else:
+            yield response
+
+    def _record_lines(self, lines):
+        """
+        Yields the response lines, and records their size in the memory budget (if set) once they were read, as the
+        logs are held until they are shipped.
+        :param lines: iterable of the response lines (bytes)
+        :return: generator of the response lines
+        """
+        budget = memory_budget.get_budget()
+        if budget is None:
+            yield from lines
+            return
+        size = 0
+        try:
+            for line in lines:
+                size += len(line)
+                yield line
+        finally:
+            budget.record(self.get_metrics_input(), size)
+
+    def _stream_window(self, url):
+        """
+        Sends the request of a single time window and yields its logs while the response body is being read.
+        :param url: the time window request URL
+        :return: generator of the window logs, returns True if the whole window was read, False otherwise.
+        """
+        start_time = perf_counter()
+        try:
+            with tracing.span("fetch window", "source", input=self.name) as fetch_span, \
+                    self.get_requester().request(method=self.method.value, url=url, headers=self.get_request_headers(),
+                                                 data=self.body, stream=True, timeout=self.get_timeout()) as r:
+                r.raise_for_status()
+                lines = self._record_lines(r.iter_lines(chunk_size=STREAM_CHUNK_SIZE))
+                yield from self._raw_ndjson(lines) if self.raw_passthrough else self._parse_response(lines)
+                # The response is read while it is streamed, so the duration includes reading all of it
+                self._record_request_metrics(start_time, r.status_code, r.raw.tell())
+                fetch_span.set(status=r.status_code, bytes=r.raw.tell())
+        except requests.Timeout:
+            self._record_request_metrics(start_time, "timeout")
+            logger.error(f"Timed out waiting for the {self.name} API (connect timeout: {self.connect_timeout}s, read "
+                         f"timeout: {self.read_timeout}s).")
+            return False
+        except requests.ConnectionError:
+            self._record_request_metrics(start_time, "error")
+            logger.error(f"Failed to establish connection to the {self.name} API.")
+            return False
+        except requests.HTTPError as e:
+            self._record_request_metrics(start_time, e.response.status_code if e.response is not None else "error")
+            logger.error(f"Failed to get data from {self.name} API due to error {e}")
+            return False
+        except requests.RequestException as e:
+            self._record_request_metrics(start_time, "error")
+            logger.error(f"Failed to read response from {self.name} API due to error {e}")
+            return False
+        return True
+
+    def _read_window(self, url):
+        """
+        Reads all the logs of a single time window, to allow fetching several windows in parallel.
+        :param url: the time window request URL
+        :return: list of the window logs, or None if the window failed.
+        """
+        logs = []
+        window = self._stream_window(url)
+        while True:
+            try:
+                logs.append(next(window))
+            except StopIteration as window_end:
+                return logs if window_end.value else None
+
+    @staticmethod
+    def _split_windows(start, end_limit):
+        """
+        Splits the given time range to windows of up to MAX_WINDOW.
+        :param start: the start time of the range
+        :param end_limit: the end time of the range
+        :return: generator of the windows (start, end) in order
+        """
+        while start < end_limit:
+            end = min(start + MAX_WINDOW, end_limit)
+            yield start, end
+            start = end
+
+    def _windows_until_deadline(self, windows):
+        """
+        Stops the given windows once the cycle deadline passed (or there is no room in the memory budget), so the rest
+        of them are fetched in the next run.
+        :param windows: iterable of the windows (start, end) in order
+        :return: generator of the windows until the cycle deadline
+        """
+        for window in windows:
+            if self.is_cycle_deadline_passed() or not self.has_memory_room():
+                return
+            yield window
+
+    def _fetch_windows_concurrently(self, windows):
+        """
+        Fetches up to 'max_concurrent_windows' windows in parallel and yields their logs in the windows order.
+        next_start_time only advances past the last contiguous window that was completed, so if a window fails, it and
+        the windows after it are fetched again in the next run.
+        :param windows: iterable of the windows (start, end) in order
+        :return: generator of the windows logs
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrent_windows,
+                                      thread_name_prefix=f"{self.name} windows")
+        pending = deque()
+        windows = iter(windows)
+
+        def submit_next_window():
+            window = next(windows, None)
+            if window:
+                pending.append((window, executor.submit(self._read_window, self._window_url(*window))))
+
+        try:
+            for _ in range(self.max_concurrent_windows):
+                submit_next_window()
+
+            while pending:
+                (start, end), future = pending.popleft()
+                logs = future.result()
+
+                if logs is None:
+                    logger.warning(f"Failed to fetch {self.name} logs for window "
+                                   f"{start.strftime(DATE_FORMAT)} -> {end.strftime(DATE_FORMAT)}, stopping.")
+                    break
+
+                submit_next_window()
+                yield from logs
+                self.next_start_time = end
+        finally:
+            executor.shutdown(cancel_futures=True)
 
     def send_request(self):
         """
         Fetches logs using time-windowed requests.
-        Loops through 1-hour windows (Cloudflare max) from next_start_time up to now - 5 minutes.
+        Loops through 1-hour windows (Cloudflare max) from next_start_time up to now - 5 minutes, and yields the logs
+        of every window while streaming its response (or fetches the windows in parallel if 'max_concurrent_windows'
+        is above 1).
+        next_start_time only advances past windows that were fully read. If a window fails after some of its logs were
+        yielded, the next run reads the whole window again, as Cloudflare does not guarantee the same logs order on
+        every request, so these logs are sent again unless they are dropped by the dedup (by 'RayID'). No new windows
+        are started once the cycle deadline passed or the memory budget is exhausted.
+        :return: generator of all the logs that were received
         """
-        all_responses = []
+        self.start_cycle()
         now = datetime.now(timezone.utc)
         end_limit = now - END_BUFFER
 
@@ -74,36 +306,37 @@ class CloudflareLogs(ApiFetcher):
             logger.debug(f"No new time window to fetch for {self.name}. "
                          f"Next start: {self.next_start_time.strftime(DATE_FORMAT)}, "
                          f"end limit: {end_limit.strftime(DATE_FORMAT)}")
-            return all_responses
+            return
 
-        original_url = self.url
-        start = self.next_start_time
+        windows = self._windows_until_deadline(self._split_windows(self.next_start_time, end_limit))
+        if self.max_concurrent_windows > 1:
+            yield from self._fetch_windows_concurrently(windows)
+            return
 
-        while start < end_limit:
-            end = min(start + MAX_WINDOW, end_limit)
-
-            self.url = self._build_url(original_url, start, end)
+        for start, end in windows:
             logger.debug(f"Fetching {self.name} logs window: {start.strftime(DATE_FORMAT)} -> {end.strftime(DATE_FORMAT)}")
 
-            response = self._make_call()
+            logs_count = 0
+            window = self._stream_window(self._window_url(start, end))
+            try:
+                while True:
+                    try:
+                        log = next(window)
+                    except StopIteration as window_end:
+                        window_completed = window_end.value
+                        break
+                    logs_count += 1
+                    yield log
+            finally:
+                window.close()
 
-            if response is None:
+            if not window_completed:
                 logger.warning(f"Failed to fetch {self.name} logs for window "
                                f"{start.strftime(DATE_FORMAT)} -> {end.strftime(DATE_FORMAT)}, stopping.")
+                if logs_count and not self.dedup:
+                    logger.warning(f"{logs_count} logs of the failed window of {self.name} were already sent, and will "
+                                   f"be sent again when the window is fetched in the next run. Set 'dedup' (with "
+                                   f"'id_path: RayID') to drop them.")
                 break
 
-            if isinstance(response, str):
-                logs = self._parse_ndjson(response)
-            elif isinstance(response, list):
-                logs = response
-            elif isinstance(response, dict):
-                logs = self._extract_data_from_path(response)
-            else:
-                logs = [response]
-
-            all_responses.extend(logs)
-            start = end
-
-        self.url = original_url
-        self.next_start_time = start
-        return all_responses
+            self.next_start_time = end
@@ -58,7 +58,7 @@ class DockerHub(ApiFetcher):
         }
         headers = {"Content-Type": "application/json"}
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = requests.post(url, json=payload, headers=headers, timeout=self.get_timeout())
             response.raise_for_status()
             token_response = response.json()
             self._jwt_token = token_response.get("token")
@@ -1,17 +1,31 @@
 from enum import Enum
-import json
 import logging
 from pydantic import BaseModel, Field
 import requests
 from typing import Union, Optional
+from urllib3 import response as urllib3_response
 from re import search
 from datetime import datetime, timedelta
+from time import perf_counter, time
 
+from src.utils import json_codec, memory_budget, metrics, tracing
+from src.utils.LogPreview import LogPreview
 from src.utils.processing_functions import extract_vars, substitute_vars
+from src.apis.general.DedupSettings import DedupSettings
+from src.apis.general.ProcessingSettings import ProcessingSettings
+from src.apis.general.QuotaSettings import QuotaSettings
 from src.apis.general.PaginationSettings import PaginationSettings, PaginationType
 from src.utils.processing_functions import break_key_name, get_nested_value
 
 SUCCESS_CODES = [200, 204]
+
+# Content encodings that can be decompressed while the response is read (br and zstd require optional packages)
+SUPPORTED_ENCODINGS = ["identity", "gzip", "deflate"]
+if urllib3_response.brotli is not None:
+    SUPPORTED_ENCODINGS.append("br")
+if urllib3_response.HAS_ZSTD:
+    SUPPORTED_ENCODINGS.append("zstd")
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,9 +50,25 @@ class ApiFetcher(BaseModel):
     :param response_data_path: Optional, The path to find the data within the response.
     :param additional_fields: Optional, 'key: value' pairs that should be added to the API logs.
     :param scrape_interval_minutes: the interval between scraping jobs.
+    :param dedup: Optional, DedupSettings object that defines how to drop logs that were already received
+    :param processing: Optional, ProcessingSettings object that defines which fields and logs to send
+    :param quota: Optional, QuotaSettings object that limits the volume of the logs to send
+    :param accept_encoding: Optional, the content encodings to accept for the responses, in order of preference. The
+                            responses are decompressed in full, other than streamed responses (such as Cloudflare Logs).
+    :param connect_timeout: Seconds to wait for the connection to the API to be established.
+    :param read_timeout: Seconds to wait for the API to send data (between bytes, not for the whole response).
+    :param cycle_deadline_seconds: Optional, max seconds for a single run. Once passed, the pagination stops and the
+                                   next run continues from the next page.
     :param url_vars: Not passed to the class, array of params that is generated based on next_url.
     :param body_vars: Not passed to the class, array of params that is generated based on next_body.
     :param outputs: Not passed to the class, array of outputs to export the returned data to.
+    :param request_failed: Not passed to the class, True if the first request of the last send_request failed.
+    :param cycle_deadline_reached: Not passed to the class, True if the last send_request stopped on the cycle deadline
+                                   (or on the memory budget).
+    :param pagination_resume: Not passed to the class, the next page request (and the cursor to move to once the
+                              pagination completes) if the last send_request stopped in the middle of the pagination.
+    :param _metrics_input: Not passed to the class, the input name to record the metrics under (if this is a request of
+                           another input, such as the data request of an OAuth input). Defaults to the name.
     """
     name: str = Field(default="")
     url: str
@@ -51,9 +81,23 @@ class ApiFetcher(BaseModel):
     response_data_path: str = Field(default=None, frozen=True)
     additional_fields: dict = Field(default={})
     scrape_interval_minutes: int = Field(default=1, alias="scrape_interval", ge=1)
+    dedup: Optional[DedupSettings] = Field(default=None, frozen=True)
+    processing: Optional[ProcessingSettings] = Field(default=None, frozen=True)
+    quota: Optional[QuotaSettings] = Field(default=None, frozen=True)
+    accept_encoding: Union[str, list[str]] = Field(default=None, frozen=True)
+    connect_timeout: float = Field(default=10, frozen=True, gt=0)
+    read_timeout: float = Field(default=60, frozen=True, gt=0)
+    cycle_deadline_seconds: Optional[float] = Field(default=None, frozen=True, gt=0)
     url_vars: list = Field(default=[], init=False, init_var=True)
     body_vars: list = Field(default=[], init=False, init_var=True)
     outputs: list = Field(default=[], init=False, init_var=True)
+    request_failed: bool = Field(default=False, init=False, init_var=True)
+    cycle_deadline_reached: bool = Field(default=False, init=False, init_var=True)
+    pagination_resume: Optional[dict] = Field(default=None, init=False, init_var=True)
+    _cycle_deadline: float = None
+    _session: requests.Session = None
+    _metrics_input: str = None
+    _accept_encoding_header: str = None
 
     def __init__(self, **data):
         """
@@ -69,6 +113,39 @@ class ApiFetcher(BaseModel):
             self.name = self.url
         if not self.additional_fields.get("type"):
             self.additional_fields["type"] = "api-fetcher"
+        if self.accept_encoding:
+            self._accept_encoding_header = self._get_accept_encoding_header()
+
+    def _get_accept_encoding_header(self):
+        """
+        Generates the 'Accept-Encoding' header value from the configured encodings, without the encodings which can
+        not be decompressed in this environment.
+        :return: the 'Accept-Encoding' header value
+        """
+        encodings = self.accept_encoding
+        if isinstance(encodings, str):
+            encodings = encodings.split(",")
+
+        accepted_encodings = []
+        for encoding in encodings:
+            encoding = encoding.strip().lower()
+            if encoding in SUPPORTED_ENCODINGS:
+                accepted_encodings.append(encoding)
+            else:
+                logger.warning(f"Content encoding '{encoding}' of api {self.name} is not supported, supported "
+                               f"encodings: {SUPPORTED_ENCODINGS}. ('br' requires the 'brotli' package and 'zstd' "
+                               f"requires the 'zstandard' package)")
+        return ", ".join(accepted_encodings) or "identity"
+
+    def get_request_headers(self):
+        """
+        Returns the headers to send the request with. The 'Accept-Encoding' header is added to every request rather
+        than to 'headers', so it is kept when the pagination replaces the headers.
+        :return: the request headers
+        """
+        if not self._accept_encoding_header:
+            return self.headers
+        return {**self.headers, "Accept-Encoding": self._accept_encoding_header}
 
     @staticmethod
     def _format_body(body):
@@ -78,7 +155,7 @@ class ApiFetcher(BaseModel):
         :return: body in format for a request.
         """
         if isinstance(body, dict) or isinstance(body, list):
-            return json.dumps(body)
+            return json_codec.dumps(body)
         return body
 
     def _extract_data_from_path(self, response):
@@ -89,14 +166,16 @@ class ApiFetcher(BaseModel):
         :return: array with the logs to send from the response.
         """
         if self.response_data_path:
-            data_path_value = get_nested_value(response, break_key_name(self.response_data_path))
+            with tracing.span("extract data", input=self.get_metrics_input()):
+                data_path_value = get_nested_value(response, break_key_name(self.response_data_path))
             if data_path_value and isinstance(data_path_value, list):
                 return data_path_value
             if data_path_value:
                 return [data_path_value]
             else:
                 # This is set to debug and not error since it could be expected (no new data)
-                logger.debug(f"Did not find data in given '{self.response_data_path}' path. Response: {response}")
+                logger.debug("Did not find data in given '%s' path. Response: %s", self.response_data_path,
+                             LogPreview(response))
                 return []
         return [response]
 
@@ -105,30 +184,133 @@ class ApiFetcher(BaseModel):
         Sends the request and returns the response, or None if there was an issue.
         :return: the response of the request.
         """
-        logger.debug(f"Sending API call with details:\nURL: {self.url}\nHeaders: {self.headers}\nBody: {self.body}")
+        headers = self.get_request_headers()
+        logger.debug("Sending API call with details:\nURL: %s\nHeaders: %s\nBody: %s", self.url, headers,
+                     LogPreview(self.body))
 
+        start_time = perf_counter()
         try:
-            r = requests.request(method=self.method.value, url=self.url, headers=self.headers, data=self.body)
+            with tracing.span("fetch page", "source", input=self.get_metrics_input()) as fetch_span:
+                r = self.get_requester().request(method=self.method.value, url=self.url, headers=headers,
+                                                 data=self.body, timeout=self.get_timeout())
+                fetch_span.set(status=r.status_code, bytes=len(r.content))
             r.raise_for_status()
+        except requests.Timeout:
+            self._record_request_metrics(start_time, "timeout")
+            logger.error(f"Timed out waiting for the {self.name} API (connect timeout: {self.connect_timeout}s, read "
+                         f"timeout: {self.read_timeout}s).")
+            return None
         except requests.ConnectionError:
+            self._record_request_metrics(start_time, "error")
             logger.error(f"Failed to establish connection to the {self.name} API.")
             return None
         except requests.HTTPError as e:
+            self._record_request_metrics(start_time, e.response.status_code if e.response is not None else "error")
             logger.error(f"Failed to get data from {self.name} API due to error {e}")
             return None
         except Exception as e:
+            self._record_request_metrics(start_time, "error")
             logger.error(f"Failed to send request to {self.name} API due to error {e}")
             return None
 
+        self._record_request_metrics(start_time, r.status_code, len(r.content))
+        budget = memory_budget.get_budget()
+        if budget:
+            budget.record(self.get_metrics_input(), len(r.content))
         if r.status_code in SUCCESS_CODES:
             try:
-                return json.loads(r.text)
-            except json.decoder.JSONDecodeError:
+                # Decoding the response bytes directly, the text is decoded only if the response is not JSON
+                return json_codec.loads(r.content)
+            except ValueError:
                 return r.text
         else:
-            logger.warning(f"Issue with fetching data from {self.name} API: %s", r.text)
+            logger.warning("Issue with fetching data from %s API: %s", self.name, LogPreview(r.text))
         return None
 
+    def _record_request_metrics(self, start_time, status, response_size=0):
+        """
+        Records the metrics of a request to the API (if the metrics are enabled).
+        :param start_time: the perf_counter time the request started at
+        :param status: the response status code, or the error type if there was no response
+        :param response_size: the size of the response body in bytes
+        """
+        if not metrics.is_enabled():
+            return
+        input_name = self.get_metrics_input()
+        metrics.REQUEST_DURATION.observe(perf_counter() - start_time, input=input_name)
+        metrics.REQUESTS.inc(input=input_name, status=status)
+        if status == 429:
+            metrics.RATE_LIMITED_REQUESTS.inc(input=input_name)
+        if response_size:
+            metrics.FETCHED_BYTES.inc(response_size, input=input_name)
+
+    def set_metrics_input(self, input_name):
+        """
+        Sets the input name to record the request metrics under, for requests of another input (such as the data
+        request of an OAuth input).
+        :param input_name: the input name
+        """
+        self._metrics_input = input_name
+
+    def get_metrics_input(self):
+        """
+        :return: the input name to record the request metrics under
+        """
+        return self._metrics_input or self.name
+
+    def set_session(self, session):
+        """
+        Sets a session to send the requests with, to reuse its connections (such as between the inputs of a fan-out
+        group).
+        :param session: requests.Session instance
+        """
+        self._session = session
+
+    def get_requester(self):
+        """
+        :return: the session to send the requests with if set, the requests module otherwise
+        """
+        return self._session or requests
+
+    def get_timeout(self):
+        """
+        :return: the connect and read timeouts for the requests library
+        """
+        return self.connect_timeout, self.read_timeout
+
+    def start_cycle(self):
+        """
+        Starts the cycle deadline timer (if 'cycle_deadline_seconds' is configured).
+        """
+        self.cycle_deadline_reached = False
+        self._cycle_deadline = time() + self.cycle_deadline_seconds if self.cycle_deadline_seconds else None
+
+    def is_cycle_deadline_passed(self):
+        """
+        Checks if the cycle deadline passed, and marks the cycle as stopped on the deadline if so.
+        :return: True if the cycle deadline passed, False otherwise.
+        """
+        if self._cycle_deadline is not None and time() > self._cycle_deadline:
+            if not self.cycle_deadline_reached:
+                logger.warning(f"Reached the {self.cycle_deadline_seconds}s cycle deadline of api {self.name}. Stopping "
+                               f"and continuing from the next page in the next run.")
+            self.cycle_deadline_reached = True
+        return self.cycle_deadline_reached
+
+    def has_memory_room(self):
+        """
+        Waits for room in the memory budget (if set) before fetching more data, and marks the cycle as stopped if there
+        is no room for this API.
+        :return: True if the API may fetch more data, False otherwise.
+        """
+        budget = memory_budget.get_budget()
+        if budget is None or budget.wait_for_room(self.get_metrics_input()):
+            return True
+        logger.warning(f"The memory budget is exhausted, api {self.name} stops fetching pages and continues from the "
+                       f"next page in the next run.")
+        self.cycle_deadline_reached = True
+        return False
+
     def _prepare_pagination_next_call(self, res, first_url):
         """
         Updates the next pagination call according to the response from the last call.
@@ -142,7 +324,7 @@ class ApiFetcher(BaseModel):
             if new_url:
                 self.url = new_url
             else:
-                logger.debug(f"Stopping pagination due to issue with replacing the URL.")
+                logger.debug("Stopping pagination due to issue with replacing the URL.")
                 return False
 
         # Body Pagination
@@ -151,7 +333,7 @@ class ApiFetcher(BaseModel):
             if new_body:
                 self.body = new_body
             else:
-                logger.debug(f"Stopping pagination due to issue with replacing the Body.")
+                logger.debug("Stopping pagination due to issue with replacing the Body.")
                 return False
 
         # Headers Pagination
@@ -160,10 +342,32 @@ class ApiFetcher(BaseModel):
             if new_headers:
                 self.headers = new_headers
             else:
-                logger.debug(f"Stopping pagination due to issue with replacing the Headers.")
+                logger.debug("Stopping pagination due to issue with replacing the Headers.")
                 return False
         return True
 
+    def _get_pagination_request(self):
+        """
+        :return: the part of the request that the pagination updates (the URL, body or headers)
+        """
+        if self.pagination_settings.pagination_type == PaginationType.URL:
+            return self.url
+        if self.pagination_settings.pagination_type == PaginationType.BODY:
+            return self.body
+        return dict(self.headers)
+
+    def _set_pagination_request(self, page):
+        """
+        Sets the part of the request that the pagination updates (the URL, body or headers).
+        :param page: the value from _get_pagination_request
+        """
+        if self.pagination_settings.pagination_type == PaginationType.URL:
+            self.url = page
+        elif self.pagination_settings.pagination_type == PaginationType.BODY:
+            self.body = page
+        else:
+            self.headers = page
+
     def _revert_pagination_changes(self, org_url, org_headers, org_body):
         """
         The pagination changes the original request information.
@@ -181,34 +385,81 @@ class ApiFetcher(BaseModel):
         else:
             self.headers = org_headers
 
-    def _perform_pagination(self, res):
+    def _perform_pagination(self, res, resume=None):
         """
         Performs pagination calls until reaches stop condition or the max allowed calls.
-        :param res: the response of the first call
+        If the cycle deadline is reached (or there is no room in the memory budget), or a page request fails, the next
+        page request is kept in 'pagination_resume' to continue from it in the next run.
+        :param res: the response of the first call (None if resuming)
+        :param resume: Optional, the 'pagination_resume' of the last run to continue the pagination from
         """
-        logger.debug(f"Starting pagination for {self.name}")
-        call_count = 0
+        logger.debug("Starting pagination for %s", self.name)
+        call_count = resume["call_count"] if resume else 0
         first_url = self.url
         org_headers = self.headers
         org_body = self.body
+        if resume:
+            # The next page request was already prepared in the last run
+            self._set_pagination_request(resume["page"])
 
-        while not self.pagination_settings.did_pagination_end(res, call_count):
+        while resume or not self.pagination_settings.did_pagination_end(res, call_count):
 
             # Prepare the next call, if fails >> stop pagination
-            if not self._prepare_pagination_next_call(res, first_url):
+            if not resume and not self._prepare_pagination_next_call(res, first_url):
                 break
 
-            logger.debug(f"Sending pagination call {call_count + 1} for api {self.name} in path '{self.url}'")
+            if self.is_cycle_deadline_passed() or not self.has_memory_room():
+                self.pagination_resume = {"page": self._get_pagination_request(), "call_count": call_count}
+                break
+
+            logger.debug("Sending pagination call %s for api %s in path '%s'", call_count + 1, self.name, self.url)
             res = self._make_call()
             call_count += 1
 
             if not res:
-                # Had issue with sending request to the API, stopping the pagination
+                if resume:
+                    # The first call of this run failed
+                    self.request_failed = True
+                # Had issue with sending request to the API, continuing the pagination from this page in the next run
+                self.pagination_resume = {"page": self._get_pagination_request(), "call_count": call_count - 1}
+                logger.warning(f"Failed to get page {call_count + 1} of api {self.name}. Stopping and continuing from "
+                               f"this page in the next run.")
                 break
+            resume = None
 
             yield self._extract_data_from_path(res)
 
+        # Including the first call
+        metrics.PAGES_PER_CYCLE.observe(call_count + 1, input=self.get_metrics_input())
         self._revert_pagination_changes(first_url, org_headers, org_body)
+        if self.pagination_resume:
+            # Not moving the cursor until the pagination completes
+            self.url = first_url
+
+    def _resume_pagination(self):
+        """
+        Continues the pagination that was stopped in the last run from its next page, and moves the cursor (per
+        'next_url' and 'next_body' of the first response of the pagination) once it completes.
+        :return: all the responses that were received
+        """
+        resume = self.pagination_resume
+        self.pagination_resume = None
+        logger.info(f"Continuing the pagination of api {self.name} from the page it stopped at in the last run.")
+
+        responses = []
+        for data in self._perform_pagination(None, resume):
+            responses.extend(data)
+
+        if self.pagination_resume:
+            # Stopped again, keeping the cursor to move to once the pagination completes
+            self.pagination_resume["next_url"] = resume["next_url"]
+            self.pagination_resume["next_body"] = resume["next_body"]
+        else:
+            if resume["next_url"] is not None:
+                self.url = resume["next_url"]
+            if resume["next_body"] is not None:
+                self.body = resume["next_body"]
+        return responses
 
     def update_next_url(self, new_next_url):
         """
@@ -249,11 +500,18 @@ class ApiFetcher(BaseModel):
         Manages the request:
         - Calls _make_call() function to send request
         - If Pagination is configured, calls _perform_pagination
-        - Updates the URL for the next request per 'next_url' if defined
+        - Updates the URL for the next request per 'next_url' if defined (once the pagination completes, it may continue
+          over several runs if the cycle deadline is reached)
         :return: all the responses that were received
         """
         responses = []
+        self.start_cycle()
+        self.request_failed = False
+        if self.pagination_resume:
+            return self._resume_pagination()
+
         r = self._make_call()
+        self.request_failed = r is None
         if r:
             r_data_path = self._extract_data_from_path(r)
 
@@ -269,6 +527,14 @@ class ApiFetcher(BaseModel):
                 for data in self._perform_pagination(r):
                     responses.extend(data)
 
+            if self.pagination_resume:
+                # The cursor of the first response is moved to once the pagination completes
+                self.pagination_resume["next_url"] = substitute_vars(self.next_url, self.url_vars, r) \
+                    if self.next_url else None
+                self.pagination_resume["next_body"] = substitute_vars(self.next_body, self.body_vars, r) \
+                    if self.next_body else None
+                return responses
+
             # Update the url if needed
             if self.next_url:
                 self.url = substitute_vars(self.next_url, self.url_vars, r)
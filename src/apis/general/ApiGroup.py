@@ -0,0 +1,125 @@
+from itertools import product
+import logging
+import requests
+from time import time
+
+from src.apis.general.DedupSettings import DedupSettings
+from src.apis.oauth.OAuth import OAuthApi
+
+FAN_OUT_FIELD = "fan_out"
+
+logger = logging.getLogger(__name__)
+
+
+class ApiGroup:
+    """
+    Expands a single input config to an input per target, by the values of the fan-out parameters (such as several
+    Cloudflare accounts or Azure tenants).
+    The inputs of the group run one after the other in the same scheduled task, share one session (to reuse its
+    connections), one dedup settings instance and the access tokens of inputs with the same token request.
+    Every input keeps its own state (such as its date filter).
+    :param api_cls: the class of the inputs
+    :param fan_out: dictionary of the parameter names and their values. Every parameter replaces its '{name}'
+                    placeholders in the config, and sets the config field of the same name (if exists).
+                    Several parameters create an input per combination of their values.
+    :param name: Optional, the name of the group (defaults to the URL or the class name). The inputs are named
+                 '<name> (<values>)', with their index added if several targets have the same values.
+    :param api_conf: the config of the inputs
+    """
+    def __init__(self, api_cls, fan_out, name=None, **api_conf):
+        if not isinstance(fan_out, dict) or not fan_out:
+            raise ValueError(f"'{FAN_OUT_FIELD}' should be a dictionary of the parameters names and their values.")
+        for param, values in fan_out.items():
+            if not isinstance(values, list) or not values:
+                raise ValueError(f"'{FAN_OUT_FIELD}' parameter '{param}' should have a list of values.")
+
+        self.name = name or api_conf.get("url") or api_cls.__name__
+        self.session = requests.Session()
+        self._tokens = {}
+        self._outputs = []
+
+        if isinstance(api_conf.get("dedup"), dict):
+            # One dedup for the whole group, to keep a single IDs cache and persist file
+            api_conf["dedup"] = DedupSettings(**api_conf["dedup"])
+
+        fields = {field.alias or field_name for field_name, field in api_cls.model_fields.items()}
+        self.apis = []
+        target_names = set()
+        for index, values in enumerate(product(*fan_out.values())):
+            params = dict(zip(fan_out.keys(), values))
+            target_conf = self._substitute_params(api_conf, params)
+            target_conf.update({param: value for param, value in params.items() if param in fields})
+            # Every input gets a unique name, as the inputs are told apart by their name (such as in the metrics)
+            target_name = f"{self.name} ({', '.join(str(value) for value in values)})"
+            if target_name in target_names:
+                target_name = f"{target_name} #{index}"
+            target_names.add(target_name)
+            target_conf["name"] = target_name
+
+            api = api_cls(**target_conf)
+            api.set_session(self.session)
+            api.outputs = self._outputs
+            self.apis.append(api)
+
+        logger.debug(f"Created {len(self.apis)} inputs for {self.name}.")
+
+    @classmethod
+    def _substitute_params(cls, value, params):
+        """
+        Replaces the '{param}' placeholders of the given parameters in the given config value.
+        :param value: the config value (dictionary, list or string)
+        :param params: dictionary of the parameters names and values
+        :return: a copy of the config value with the parameters values
+        """
+        if isinstance(value, dict):
+            return {key: cls._substitute_params(val, params) for key, val in value.items()}
+        if isinstance(value, list):
+            return [cls._substitute_params(val, params) for val in value]
+        if isinstance(value, str):
+            for param, param_value in params.items():
+                value = value.replace(f"{{{param}}}", str(param_value))
+        return value
+
+    @property
+    def scrape_interval_minutes(self):
+        return self.apis[0].scrape_interval_minutes
+
+    @property
+    def outputs(self):
+        return self._outputs
+
+    @outputs.setter
+    def outputs(self, outputs):
+        """
+        Sets the outputs of all the inputs of the group.
+        :param outputs: the outputs list
+        """
+        self._outputs = outputs
+        for api in self.apis:
+            api.outputs = outputs
+
+    @staticmethod
+    def _get_token_key(api):
+        """
+        :param api: an input of the group
+        :return: a key of the input token request, or None if the input does not use the general OAuth token flow
+        """
+        if not isinstance(api, OAuthApi) or type(api)._update_token is not OAuthApi._update_token:
+            return None
+        return api.token_request.url, api.token_request.body
+
+    def iterate_apis(self):
+        """
+        Iterates the inputs of the group, and shares the access token between the inputs with the same token request.
+        :return: generator of the inputs
+        """
+        for api in self.apis:
+            token_key = self._get_token_key(api)
+            shared_token = self._tokens.get(token_key) if token_key else None
+            if shared_token and shared_token[0] != api.token and shared_token[1] - 60 > time():
+                api.set_token(*shared_token)
+
+            yield api
+
+            if token_key and api.token:
+                self._tokens[token_key] = (api.token, api.token_expire)
@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, UTC
+import logging
+
+from src.apis.general.Api import ApiFetcher
+
+MAX_BACKFILL_SLICES = 32
+
+logger = logging.getLogger(__name__)
+
+
+class BackfillPlanner:
+    """
+    Splits the initial fetch range of an API (its 'days_back_fetch') into time slices and fetches them concurrently,
+    each slice with its own request and pagination chain.
+    Slices that fail are kept and fetched again in the next run, and slices that stop in the middle of their pagination
+    (on the cycle deadline, the memory budget or a failed page) continue from their next page in the next run. Once all
+    the slices are completed, the API steady state date filter is handed over to continue from the end of the
+    backfill.
+    :param name: the name of the API
+    :param start: the start time of the backfill
+    :param slices_amount: the amount of time slices to split the backfill to
+    :param end: the end time of the backfill, set on the first run.
+    :param pending_slices: the time slices (start, end) that were not completed yet, set on the first run.
+    :param slices_resume: the 'pagination_resume' of the pending slices that stopped in the middle of their pagination.
+    """
+    def __init__(self, name, start, slices_amount):
+        self.name = name
+        self.start = start
+        self.slices_amount = slices_amount
+        self.end = None
+        self.pending_slices = []
+        self.slices_resume = {}
+
+    @property
+    def done(self):
+        """
+        :return: True if the backfill ran and all its slices were completed, False otherwise.
+        """
+        return self.end is not None and not self.pending_slices
+
+    @staticmethod
+    def split_time_range(start, end, slices_amount):
+        """
+        Splits the given time range to equal consecutive slices.
+        :param start: the start time of the range
+        :param end: the end time of the range
+        :param slices_amount: the amount of slices
+        :return: list of the slices (start, end) ordered from the oldest
+        """
+        slice_duration = (end - start) / slices_amount
+        slices = []
+        for i in range(slices_amount):
+            slice_end = end if i == slices_amount - 1 else start + slice_duration * (i + 1)
+            slices.append((start + slice_duration * i, slice_end))
+        return slices
+
+    @staticmethod
+    def _fetch_slice(slice_request):
+        """
+        Sends the request of a single slice, including its pagination.
+        The API specific logic of the request class (such as updating its date filter) is not needed for a slice, hence
+        the general ApiFetcher logic is used.
+        :param slice_request: ApiFetcher instance of the slice
+        :return: the slice data (partial if its pagination stopped in the middle)
+        """
+        return ApiFetcher.send_request(slice_request)
+
+    def run(self, create_slice_request, complete_backfill):
+        """
+        Fetches the pending slices concurrently.
+        :param create_slice_request: function that receives a slice start and end and returns an ApiFetcher instance
+                                     to fetch the slice with.
+        :param complete_backfill: function that receives the backfill end time and updates the API date filter to
+                                  continue from it, called once all the slices are completed.
+        :return: the data of all the slices that were completed in this run
+        """
+        if self.end is None:
+            self.end = datetime.now(UTC)
+            self.pending_slices = self.split_time_range(self.start, self.end, self.slices_amount)
+
+        logger.info(f"Fetching {len(self.pending_slices)} backfill slices for api {self.name}.")
+        slice_requests = []
+        for time_slice in self.pending_slices:
+            slice_request = create_slice_request(*time_slice)
+            slice_request.pagination_resume = self.slices_resume.pop(time_slice, None)
+            slice_requests.append(slice_request)
+        with ThreadPoolExecutor(max_workers=len(slice_requests), thread_name_prefix=f"{self.name} backfill") as executor:
+            results = list(executor.map(self._fetch_slice, slice_requests))
+
+        data = []
+        failed_slices = []
+        for time_slice, slice_request, slice_data in zip(self.pending_slices, slice_requests, results):
+            # The fetched pages are sent, also of slices that did not complete
+            data.extend(slice_data)
+            if slice_request.pagination_resume:
+                self.slices_resume[time_slice] = slice_request.pagination_resume
+                failed_slices.append(time_slice)
+            elif slice_request.request_failed:
+                failed_slices.append(time_slice)
+        self.pending_slices = failed_slices
+
+        if failed_slices:
+            logger.warning(f"Did not complete {len(failed_slices)} backfill slices for api {self.name}, they will be "
+                           f"continued in the next run.")
+        else:
+            logger.info(f"Backfill completed for api {self.name}.")
+            complete_backfill(self.end)
+        return data
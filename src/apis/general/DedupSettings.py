@@ -0,0 +1,141 @@
+from collections import OrderedDict
+import logging
+import os
+from pydantic import BaseModel, Field
+import threading
+from time import time
+
+from src.utils import json_codec
+from src.utils.processing_functions import break_key_name, get_nested_value
+
+logger = logging.getLogger(__name__)
+
+
+class DedupSettings(BaseModel):
+    """
+    Class that initialize API logs de-duplication settings.
+    Keeps the IDs of the logs that were already received within the time window (up to 'max_ids' IDs, oldest evicted
+    first), and drops logs with a known ID.
+    :param id_path: The path to the log unique ID field. Example: id, uuid, id.uniqueQualifier
+    :param window_minutes: The amount of minutes to keep a log ID for. Should cover the overlap of the API date filter.
+    :param max_ids: The max amount of IDs to keep.
+    :param persist_file: Optional, path to a file to save the kept IDs to after every run and load them from on start,
+                         to keep de-duplicating across restarts.
+    """
+    id_path: str = Field(frozen=True, min_length=1)
+    window_minutes: int = Field(default=60, frozen=True, ge=1)
+    max_ids: int = Field(default=100000, frozen=True, ge=1)
+    persist_file: str = Field(default=None, frozen=True)
+    _seen_ids: OrderedDict = None
+    _lock: threading.Lock = None
+
+    def __init__(self, **data):
+        """
+        Initializes the kept IDs, from the persist file if configured.
+        :param data: the fields for creation of the class.
+        """
+        super().__init__(**data)
+        self._seen_ids = OrderedDict()
+        self._lock = threading.Lock()
+        if self.persist_file:
+            self._load()
+
+    def _load(self):
+        """
+        Loads the kept IDs from the persist file, if exists.
+        """
+        try:
+            with open(self.persist_file, "rb") as ids_file:
+                saved_ids = json_codec.loads(ids_file.read())
+            for log_id, seen_time in saved_ids:
+                self._seen_ids[log_id] = seen_time
+            self._evict(time())
+            logger.debug(f"Loaded {len(self._seen_ids)} log IDs from {self.persist_file}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Failed to load log IDs from {self.persist_file} due to error: {e}")
+
+    def save(self):
+        """
+        Saves the kept IDs to the persist file, if configured.
+        The file is replaced only once fully written, to not lose the IDs on a crash in the middle.
+        """
+        if not self.persist_file:
+            return
+        tmp_file = f"{self.persist_file}.tmp"
+        try:
+            with self._lock:
+                saved_ids = list(self._seen_ids.items())
+            with open(tmp_file, "wb") as ids_file:
+                ids_file.write(json_codec.dumps_bytes(saved_ids))
+            os.replace(tmp_file, self.persist_file)
+        except OSError as e:
+            logger.warning(f"Failed to save log IDs to {self.persist_file} due to error: {e}")
+
+    def _evict(self, now):
+        """
+        Removes the IDs that are older than the time window, and the oldest IDs above 'max_ids'.
+        :param now: the current time in UNIX
+        """
+        expire_time = now - self.window_minutes * 60
+        while self._seen_ids:
+            log_id, seen_time = next(iter(self._seen_ids.items()))
+            if seen_time >= expire_time and len(self._seen_ids) <= self.max_ids:
+                break
+            self._seen_ids.popitem(last=False)
+
+    def _get_log_id(self, log):
+        """
+        Returns the unique ID of the given log.
+        :param log: the log (dictionary, or raw JSON string or bytes)
+        :return: the log ID as string, or None if not found.
+        """
+        if isinstance(log, (bytes, str)):
+            try:
+                log = json_codec.loads(log)
+            except ValueError:
+                return None
+        if not isinstance(log, dict):
+            return None
+        log_id = get_nested_value(log, break_key_name(self.id_path))
+        if log_id is None:
+            return None
+        return log_id if isinstance(log_id, str) else json_codec.dumps(log_id, sort_keys=True)
+
+    def is_duplicate(self, log):
+        """
+        Checks if a log with the same ID was already received within the time window, and keeps its ID if not.
+        Logs without the ID field are never considered duplicates.
+        :param log: the log (dictionary, or raw JSON string or bytes)
+        :return: True if the log is a duplicate, False otherwise.
+        """
+        log_id = self._get_log_id(log)
+        if log_id is None:
+            return False
+
+        now = time()
+        with self._lock:
+            self._evict(now)
+            if log_id in self._seen_ids:
+                return True
+            self._seen_ids[log_id] = now
+            if len(self._seen_ids) > self.max_ids:
+                self._seen_ids.popitem(last=False)
+        return False
+
+    def filter_logs(self, logs, api_name):
+        """
+        Drops the duplicate logs from the given logs.
+        :param logs: iterable of the logs (may be a generator)
+        :param api_name: the name of the API the logs were received from, for logging
+        :return: generator of the logs that are not duplicates
+        """
+        duplicates = 0
+        for log in logs:
+            if self.is_duplicate(log):
+                duplicates += 1
+            else:
+                yield log
+        if duplicates:
+            logger.info(f"Dropped {duplicates} duplicate logs from api {api_name}.")
@@ -1,9 +1,9 @@
 from enum import Enum
-import json
 import logging
 from pydantic import BaseModel, Field, model_validator
 from typing import Union
 
+from src.utils import json_codec
 from src.utils.processing_functions import extract_vars, substitute_vars, get_nested_value, break_key_name
 from src.apis.general.StopPaginationSettings import StopPaginationSettings
 
@@ -111,8 +111,8 @@ class PaginationSettings(BaseModel):
         new_body = self.next_body
         if not isinstance(self.next_body, str):
             try:
-                new_body = json.dumps(self.next_body)
-            except json.decoder.JSONDecodeError:
+                new_body = json_codec.dumps(self.next_body)
+            except TypeError:
                 new_body = str(self.next_body)
         try:
             new_body = substitute_vars(new_body, self.body_vars, values_dict)
@@ -121,7 +121,7 @@ class PaginationSettings(BaseModel):
 
         # Revert flattening of object if needed
         if isinstance(self.next_body, dict):
-            new_body = json.loads(new_body)
+            new_body = json_codec.loads(new_body)
         return new_body
 
     def did_pagination_end(self, res, call_count):
@@ -139,7 +139,7 @@ class PaginationSettings(BaseModel):
         # Check stop indication
         if self.stop_indication:
             should_stop = self.stop_indication.should_stop(get_nested_value(res, break_key_name(self.stop_indication.field)))
-            logger.debug(f"Pagination stop status: {should_stop}")
+            logger.debug("Pagination stop status: %s", should_stop)
 
         # If stop indication says to not stop OR there is no stop indication >> stop if we reached the max call count
         if not should_stop:
@@ -0,0 +1,187 @@
+from enum import Enum
+import logging
+from pydantic import BaseModel, Field, model_validator
+from typing import Union
+
+from src.utils import json_codec, metrics
+from src.utils.processing_functions import break_key_name
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class DropCondition(Enum):
+    """
+    Supported conditions to drop logs by
+    """
+    EMPTY = "empty"
+    NOT_EMPTY = "not_empty"
+    EQUALS = "equals"
+    NOT_EQUALS = "not_equals"
+    CONTAINS = "contains"
+
+
+def _compile_path(path):
+    """
+    :param path: a field path (nested fields separated by '.', a '.' in a field name escaped as '\\.')
+    :return: the field path keys
+    """
+    return tuple(key.replace("~~", ".") for key in break_key_name(path))
+
+
+def _get_field(log, keys):
+    """
+    :param log: the log dictionary
+    :param keys: the field path keys
+    :return: the field value, or _MISSING if the field does not exist
+    """
+    value = log
+    for key in keys:
+        if not isinstance(value, dict):
+            return _MISSING
+        value = value.get(key, _MISSING)
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+class DropRule(BaseModel):
+    """
+    Condition to drop logs by.
+    :param field: the path of the field in the log to check the condition on (e.g. 'status.errorCode')
+    :param condition: the condition to check on the field
+    :param value: the value to check the field against, required only if condition is 'equals', 'not_equals' or
+                  'contains'
+    """
+    field: str = Field(frozen=True, min_length=1)
+    condition: DropCondition = Field(frozen=True)
+    value: Union[str, int, float, bool] = Field(default=None, frozen=True)
+    _keys: tuple = None
+
+    @model_validator(mode='after')
+    def _check_conditional_fields(self):
+        """
+        Validates that:
+        if we got condition as 'equals', 'not_equals' or 'contains' >> that we also got value
+        :return: self
+        """
+        if self.condition in (DropCondition.EQUALS, DropCondition.NOT_EQUALS, DropCondition.CONTAINS) and \
+                self.value is None:
+            raise ValueError(f"Used drop condition {self.condition} but missing required 'value' field.")
+        self._keys = _compile_path(self.field)
+        return self
+
+    def should_drop(self, log):
+        """
+        :param log: the log dictionary
+        :return: True if the log meets the condition, False otherwise
+        """
+        field_value = _get_field(log, self._keys)
+        if self.condition == DropCondition.EMPTY:
+            return field_value is _MISSING or not field_value
+        if self.condition == DropCondition.NOT_EMPTY:
+            return field_value is not _MISSING and bool(field_value)
+        if field_value is _MISSING:
+            return self.condition == DropCondition.NOT_EQUALS
+        if self.condition == DropCondition.EQUALS:
+            return field_value == self.value
+        if self.condition == DropCondition.NOT_EQUALS:
+            return field_value != self.value
+        try:
+            return self.value in field_value
+        except TypeError:
+            return False
+
+
+class ProcessingSettings(BaseModel):
+    """
+    Class that initialize API logs processing settings, applied to every log before it is sent.
+    The field paths are compiled once, when the settings are created.
+    :param include_fields: Optional, paths of the fields to keep in the logs (the rest of the fields are removed)
+    :param exclude_fields: Optional, paths of the fields to remove from the logs
+    :param drop: Optional, list of DropRule, a log that meets any of them is dropped. The rules are checked on the
+                 original log (before the fields are included or excluded).
+    """
+    include_fields: list[str] = Field(default=[], frozen=True)
+    exclude_fields: list[str] = Field(default=[], frozen=True)
+    drop: list[DropRule] = Field(default=[], frozen=True)
+    _include_keys: list = None
+    _exclude_keys: list = None
+
+    def __init__(self, **data):
+        """
+        Compiles the field paths.
+        :param data: the fields for creation of the class.
+        """
+        super().__init__(**data)
+        self._include_keys = [_compile_path(path) for path in self.include_fields]
+        self._exclude_keys = [_compile_path(path) for path in self.exclude_fields]
+
+    def _include(self, log):
+        """
+        :param log: the log dictionary
+        :return: a new log with only the included fields (in their nesting)
+        """
+        included_log = {}
+        for keys in self._include_keys:
+            value = _get_field(log, keys)
+            if value is _MISSING:
+                continue
+            target = included_log
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+        return included_log
+
+    def _exclude(self, log):
+        """
+        Removes the excluded fields from the given log.
+        :param log: the log dictionary
+        """
+        for keys in self._exclude_keys:
+            parent = _get_field(log, keys[:-1]) if len(keys) > 1 else log
+            if isinstance(parent, dict):
+                parent.pop(keys[-1], None)
+
+    def process_log(self, log):
+        """
+        Applies the processing to a single log.
+        :param log: the log (dictionary, or raw JSON string or bytes)
+        :return: the processed log, or None if it should be dropped. Logs that are not JSON objects are returned as is.
+        """
+        parsed_log = log
+        if isinstance(log, (bytes, str)):
+            try:
+                parsed_log = json_codec.loads(log)
+            except ValueError:
+                return log
+        if not isinstance(parsed_log, dict):
+            return log
+
+        for rule in self.drop:
+            if rule.should_drop(parsed_log):
+                return None
+        if self._include_keys:
+            parsed_log = self._include(parsed_log)
+        if self._exclude_keys:
+            self._exclude(parsed_log)
+        return parsed_log
+
+    def process_logs(self, logs, api_name):
+        """
+        Applies the processing to the given logs.
+        :param logs: iterable of the logs (may be a generator)
+        :param api_name: the name of the API the logs were received from, for logging
+        :return: generator of the processed logs that were not dropped
+        """
+        dropped = 0
+        for log in logs:
+            processed_log = self.process_log(log)
+            if processed_log is None:
+                dropped += 1
+            else:
+                yield processed_log
+        if dropped:
+            metrics.DROPPED_RECORDS.inc(dropped, input=api_name, reason="filter")
+            logger.info(f"Dropped {dropped} logs from api {api_name} by its drop rules.")
@@ -0,0 +1,146 @@
+from enum import Enum
+import logging
+from pydantic import BaseModel, Field, model_validator
+from time import monotonic
+from zlib import crc32
+
+from src.utils import json_codec, metrics
+from src.utils.processing_functions import break_key_name, get_nested_value
+
+logger = logging.getLogger(__name__)
+
+HASH_RANGE = 2 ** 32
+
+
+class QuotaAction(Enum):
+    """
+    Supported actions for the logs above the quota
+    """
+    SAMPLE = "sample"
+    DROP = "drop"
+
+
+class QuotaSettings(BaseModel):
+    """
+    Class that initialize API logs volume quota settings.
+    The quota is kept as a budget of records and bytes, which grows by the max rate every second (up to
+    'burst_seconds' of unused quota), and every sent log uses it. The logs above the quota are dropped, or sampled
+    deterministically by the hash of the log (or of its 'sample_key' field), so the same log always gets the same
+    result.
+    :param max_records_per_second: Optional, the max average amount of logs to send per second
+    :param max_bytes_per_second: Optional, the max average size of the logs to send per second
+    :param burst_seconds: The max seconds of unused quota to keep, should cover the scrape interval.
+    :param on_exceeded: What to do with the logs above the quota, 'sample' or 'drop'.
+    :param sample_ratio: The ratio of the logs above the quota to keep, if on_exceeded is 'sample'.
+    :param sample_key: Optional, the path to the log field to sample by (such as a user or zone ID, to keep all the logs
+                       of the sampled values). Defaults to the whole log.
+    """
+    max_records_per_second: float = Field(default=None, frozen=True, gt=0)
+    max_bytes_per_second: float = Field(default=None, frozen=True, gt=0)
+    burst_seconds: int = Field(default=300, frozen=True, ge=1)
+    on_exceeded: QuotaAction = Field(default=QuotaAction.SAMPLE, frozen=True)
+    sample_ratio: float = Field(default=0.1, frozen=True, gt=0, le=1)
+    sample_key: str = Field(default=None, frozen=True, min_length=1)
+    _records_left: float = None
+    _bytes_left: float = None
+    _last_refill: float = None
+
+    @model_validator(mode='after')
+    def _check_conditional_fields(self):
+        """
+        Validates that we got at least one of the max rates
+        :return: self
+        """
+        if self.max_records_per_second is None and self.max_bytes_per_second is None:
+            raise ValueError("Quota requires 'max_records_per_second' or 'max_bytes_per_second'.")
+        return self
+
+    def __init__(self, **data):
+        """
+        Starts with the full burst quota.
+        :param data: the fields for creation of the class.
+        """
+        super().__init__(**data)
+        self._records_left = self._get_burst(self.max_records_per_second)
+        self._bytes_left = self._get_burst(self.max_bytes_per_second)
+        self._last_refill = monotonic()
+
+    def _get_burst(self, max_rate):
+        """
+        :param max_rate: the max rate per second (or None if not limited)
+        :return: the max quota that can be kept
+        """
+        return max_rate * self.burst_seconds if max_rate else float("inf")
+
+    def _refill(self):
+        """
+        Adds the quota of the seconds that passed since the last refill.
+        """
+        now = monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.max_records_per_second:
+            self._records_left = min(self._records_left + elapsed * self.max_records_per_second,
+                                     self._get_burst(self.max_records_per_second))
+        if self.max_bytes_per_second:
+            self._bytes_left = min(self._bytes_left + elapsed * self.max_bytes_per_second,
+                                   self._get_burst(self.max_bytes_per_second))
+
+    @staticmethod
+    def _to_bytes(log):
+        """
+        :param log: the log
+        :return: the log as bytes, as it is sent
+        """
+        if isinstance(log, bytes):
+            return log
+        if isinstance(log, str):
+            return log.encode("utf-8", errors="replace")
+        return json_codec.dumps_bytes(log)
+
+    def _is_sampled(self, log, log_bytes=None):
+        """
+        :param log: the log
+        :param log_bytes: Optional, the log as bytes (if already encoded)
+        :return: True if the log is in the sample, False otherwise
+        """
+        if self.sample_key:
+            if isinstance(log, (bytes, str)):
+                try:
+                    log = json_codec.loads(log)
+                except ValueError:
+                    log = {}
+            value = get_nested_value(log, break_key_name(self.sample_key)) if isinstance(log, dict) else None
+            key = str(value).encode()
+        else:
+            key = log_bytes if log_bytes is not None else self._to_bytes(log)
+        return crc32(key) < self.sample_ratio * HASH_RANGE
+
+    def limit_logs(self, logs, api_name):
+        """
+        Keeps the given logs within the quota.
+        :param logs: iterable of the logs (may be a generator)
+        :param api_name: the name of the API the logs were received from, for logging
+        :return: generator of the logs within the quota, and the sampled logs above it
+        """
+        self._refill()
+        dropped = 0
+        dropped_bytes = 0
+        sampled = 0
+        for log in logs:
+            log_bytes = self._to_bytes(log) if self.max_bytes_per_second else None
+            log_size = len(log_bytes) if log_bytes is not None else 0
+            if self._records_left >= 1 and self._bytes_left >= log_size:
+                self._records_left -= 1
+                self._bytes_left -= log_size
+                yield log
+            elif self.on_exceeded == QuotaAction.SAMPLE and self._is_sampled(log, log_bytes):
+                sampled += 1
+                yield log
+            else:
+                dropped += 1
+                dropped_bytes += log_size
+        if dropped or sampled:
+            metrics.DROPPED_RECORDS.inc(dropped, input=api_name, reason="quota")
+            logger.warning(f"Api {api_name} exceeded its quota, dropped {dropped} logs"
+                           f"{f' ({dropped_bytes} bytes)' if dropped_bytes else ''} and kept {sampled} sampled logs.")
@@ -50,5 +50,5 @@ class StopPaginationSettings(BaseModel):
         elif self.condition == StopCondition.CONTAINS:
             return self.value in field_value
         else:
-            logger.warning("Got invalid stop condition", self.condition)
+            logger.warning("Got invalid stop condition %s", self.condition)
         return True
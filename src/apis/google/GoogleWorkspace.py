@@ -9,6 +9,7 @@ from google.oauth2 import service_account
 from pydantic import Field, ConfigDict, model_validator
 
 from src.apis.general.Api import ApiFetcher
+from src.apis.general.BackfillPlanner import BackfillPlanner, MAX_BACKFILL_SLICES
 from src.apis.general.PaginationSettings import PaginationSettings
 from src.apis.general.StopPaginationSettings import StopPaginationSettings, StopCondition
 from src.apis.oauth.OAuth import OAuthApi
@@ -29,6 +30,8 @@ class GoogleWorkspace(OAuthApi):
     :param google_ws_delegated_account: email of the user for which the application is requesting delegated access.
     :param scopes: list of scopes for the API.
     :param days_back_fetch: The amount of days to fetch back in the first request
+    :param backfill_slices: The amount of time slices to split the first request 'days_back_fetch' range to, and fetch
+                            concurrently.
     :param creds: Not passed to the class, credentials generated by the class.
     """
     model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -37,7 +40,9 @@ class GoogleWorkspace(OAuthApi):
     google_ws_delegated_account: str = Field(frozen=True)
     scopes: list = Field(default=["https://www.googleapis.com/auth/admin.reports.audit.readonly"], frozen=True)
     days_back_fetch: int = Field(default=1, frozen=True, ge=1)
+    backfill_slices: int = Field(default=1, frozen=True, ge=1, le=MAX_BACKFILL_SLICES)
     creds: service_account.Credentials = Field(default=None)
+    _backfill_planner: BackfillPlanner = None
 
     def __init__(self, **data):
         # token request for Google is dummy due to the use of Google library to avoid manual JWT generation.
@@ -56,6 +61,10 @@ class GoogleWorkspace(OAuthApi):
         self._initialize_url_date()
         if self. google_ws_sa_file_path is None:
             self.google_ws_sa_file_path = FETCHER_PATH + self.google_ws_sa_file_name
+        if self.backfill_slices > 1:
+            self._backfill_planner = BackfillPlanner(self.name,
+                                                     datetime.now(UTC) - timedelta(days=self.days_back_fetch),
+                                                     self.backfill_slices)
 
     @classmethod
     @model_validator(mode='before')
@@ -70,6 +79,35 @@ class GoogleWorkspace(OAuthApi):
     def _generate_start_fetch_date(self):
         return (datetime.now(UTC) - timedelta(days=self.days_back_fetch)).isoformat().replace("+00:00", "Z")
 
+    def _replace_url_start_time(self, start):
+        """
+        Replaces the 'startTime' filter value in the data request URL.
+        :param start: the new start time
+        :return: the data request URL with the new start time
+        """
+        org_date = re.search(FIND_DATE_PATTERN, self.data_request.url).group(1)
+        return self.data_request.url.replace(f"{DATE_FILTER_PARAMETER}{org_date}",
+                                             f"{DATE_FILTER_PARAMETER}{start.strftime(DATE_FORMAT)}")
+
+    def _create_backfill_request(self, start, end):
+        """
+        Creates a data request for a single backfill slice, filtered with 'startTime' and 'endTime'.
+        :param start: the slice start time
+        :param end: the slice end time
+        :return: ApiFetcher instance of the slice
+        """
+        return self.data_request.model_copy(update={"url": f"{self._replace_url_start_time(start)}&endTime="
+                                                           f"{end.strftime(DATE_FORMAT)}",
+                                                    "headers": dict(self.data_request.headers),
+                                                    "next_url": None})
+
+    def _complete_backfill(self, end):
+        """
+        Updates the date filter to continue from the end of the backfill.
+        :param end: the backfill end time
+        """
+        self.data_request.url = self._replace_url_start_time(end)
+
     def _token_expired(self):
         """
         Override OAuth method due to use of special google library to avoid manual generating JWT.
@@ -108,13 +146,19 @@ class GoogleWorkspace(OAuthApi):
     def send_request(self):
         """
         1. Sends request using the super class
-        2. Add 1 second to the date from the end of the URL to avoid duplicates in the next call
+        2. Add 1 second to the date from the end of the URL to avoid duplicates in the next call (if 'dedup' is not set)
         :return: all the responses that were received
         """
+        if self._backfill_planner and not self._backfill_planner.done:
+            self._update_token()
+            return self._backfill_planner.run(self._create_backfill_request, self._complete_backfill)
+
         data = super().send_request()
 
-        # Add 1s to the time we took from the response to avoid duplicates
-        if DATE_FILTER_PARAMETER in self.data_request.url:
+        # Add 1s to the time we took from the response to avoid duplicates, unless they are dropped by the dedup (or the
+        # date filter was not updated since the pagination continues in the next run)
+        if (DATE_FILTER_PARAMETER in self.data_request.url and not self.dedup and
+                not self.data_request.pagination_resume):
             self.data_request.add_seconds_to_url_date_filter(1, DATE_FORMAT, FIND_DATE_PATTERN)
 
         return data
\ No newline at end of file
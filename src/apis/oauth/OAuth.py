@@ -1,9 +1,14 @@
 import logging
 from pydantic import BaseModel, Field, model_validator
 from time import time
+from typing import Optional
 
 
 from src.apis.general.Api import ApiFetcher
+from src.apis.general.DedupSettings import DedupSettings
+from src.apis.general.ProcessingSettings import ProcessingSettings
+from src.apis.general.QuotaSettings import QuotaSettings
+from src.utils import tracing
 
 
 # Known keys to find token data
@@ -20,6 +25,9 @@ class OAuthApi(BaseModel):
     :param token_request: ApiFetcher object that contains the request to get the token
     :param data_request: ApiFetcher object that contains the request to get the data
     :param scrape_interval_minutes: the interval between scraping jobs.
+    :param dedup: Optional, DedupSettings object that defines how to drop logs that were already received
+    :param processing: Optional, ProcessingSettings object that defines which fields and logs to send
+    :param quota: Optional, QuotaSettings object that limits the volume of the logs to send
     :param token: The access token, generated by the class after the first request call.
     :param token_expire: The access token expiration time in UNIX, generated by the class after the first request call.
     :param outputs: Not passed to the class, array of outputs to export the returned data to.
@@ -29,6 +37,9 @@ class OAuthApi(BaseModel):
     data_request: ApiFetcher
     scrape_interval_minutes: int = Field(default=1, alias="scrape_interval", ge=1)
     additional_fields: dict = Field(default={})
+    dedup: Optional[DedupSettings] = Field(default=None, frozen=True)
+    processing: Optional[ProcessingSettings] = Field(default=None, frozen=True)
+    quota: Optional[QuotaSettings] = Field(default=None, frozen=True)
     token: str = Field(default=None, init=False, init_var=True)
     token_expire: float = Field(default=0, init=False, init_var=True)
     outputs: list = Field(default=[], init=False, init_var=True)
@@ -38,6 +49,7 @@ class OAuthApi(BaseModel):
         """
         Validates that:
         - Data request has 'Content-Type' header as 'application/json'
+        - The requests metrics are recorded under this input name
         :return: self
         """
         # Make sure the content-type exists for the data request
@@ -48,6 +60,10 @@ class OAuthApi(BaseModel):
         if not self.additional_fields.get("type"):
             self.additional_fields["type"] = "api-fetcher"
 
+        # Record the requests metrics under this input
+        self.token_request.set_metrics_input(self.name)
+        self.data_request.set_metrics_input(self.name)
+
         return self
 
     def _token_expired(self):
@@ -57,6 +73,24 @@ class OAuthApi(BaseModel):
         """
         return time() > (self.token_expire - 60)
 
+    def set_token(self, token, token_expire):
+        """
+        Sets the access token to use in the data request 'Authorization' header.
+        :param token: the access token
+        :param token_expire: the access token expiration time in UNIX
+        """
+        self.token, self.token_expire = token, token_expire
+        self.data_request.headers["Authorization"] = f"Bearer {self.token}"
+
+    def set_session(self, session):
+        """
+        Sets a session to send the token and data requests with, to reuse its connections (such as between the inputs
+        of a fan-out group).
+        :param session: requests.Session instance
+        """
+        self.token_request.set_session(session)
+        self.data_request.set_session(session)
+
     def _update_token(self):
         """
         Checks if the token expiration passed and if so, gets a new one and updates the data request 'Authorization'
@@ -67,10 +101,10 @@ class OAuthApi(BaseModel):
         if self._token_expired():
             try:
                 logger.debug("Sending request to update the access token.")
-                token_response = self.token_request.send_request()[0]
-                self.token, self.token_expire = (token_response.get(OAUTH_ACCESS_TOKEN_KEY),
-                                                 int(token_response.get(OAUTH_TOKEN_EXPIRE_KEY)) + time())
-                self.data_request.headers["Authorization"] = f"Bearer {self.token}"
+                with tracing.span("token refresh", "source", input=self.name):
+                    token_response = self.token_request.send_request()[0]
+                self.set_token(token_response.get(OAUTH_ACCESS_TOKEN_KEY),
+                               int(token_response.get(OAUTH_TOKEN_EXPIRE_KEY)) + time())
             except IndexError:
                 logger.error("Failed to get token for OAuth API request.")
             except ValueError:
@@ -1,11 +1,14 @@
 from datetime import datetime, timedelta, UTC
-import json
 import logging
 from pydantic import Field
 
 from src.apis.general.Api import ApiFetcher
+from src.apis.general.BackfillPlanner import BackfillPlanner, MAX_BACKFILL_SLICES
 from src.apis.general.PaginationSettings import PaginationSettings
 from src.apis.general.StopPaginationSettings import StopPaginationSettings
+from src.utils import json_codec
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
 
 logger = logging.getLogger(__name__)
 
@@ -16,11 +19,15 @@ class OnePassword(ApiFetcher):
     :param pagination_off: True if pagination should be off, False otherwise
     :param days_back_fetch: Amount of days to fetch back in the first request, Optional (adds a filter on 'start_time')
     :param onepassword_limit: 1Password limit for number of events to return in a single request (for pagination)
+    :param backfill_slices: The amount of time slices to split the first request 'days_back_fetch' range to, and fetch
+                            concurrently (requires 'days_back_fetch').
     """
     onepassword_bearer_token: str = Field(frozen=True)
     pagination_off: bool = Field(default=False)
     days_back_fetch: int = Field(default=-1, frozen=True)
     onepassword_limit: int = Field(default=100, ge=1, le=1000)
+    backfill_slices: int = Field(default=1, frozen=True, ge=1, le=MAX_BACKFILL_SLICES)
+    _backfill_planner: BackfillPlanner = None
 
     def __init__(self, **data):
         # Initialize 1Password limit for number of events to return in a single request
@@ -52,22 +59,59 @@ class OnePassword(ApiFetcher):
         if self.days_back_fetch > 0:
             self._initialize_body_date()
 
+            if self.backfill_slices > 1:
+                self._backfill_planner = BackfillPlanner(self.name,
+                                                         datetime.now(UTC) - timedelta(days=self.days_back_fetch),
+                                                         self.backfill_slices)
+
     def _initialize_body_date(self):
         """
         Initialize the first request's 'start_time' body argument.
         """
         try:
-            start_time_field = {"start_time": (datetime.now(UTC) - timedelta(days=self.days_back_fetch)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")}
-            new_body = json.loads(self.body)
+            start_time_field = {"start_time": (datetime.now(UTC) - timedelta(days=self.days_back_fetch)).strftime(DATE_FORMAT)}
+            new_body = json_codec.loads(self.body)
             new_body.update(start_time_field)
-            self.body = json.dumps(new_body)
-        except json.decoder.JSONDecodeError:
+            self.body = json_codec.dumps(new_body)
+        except json_codec.JSONDecodeError:
             logger.error(f"Failed to update 'start_time' filter in the request body: {self.body}. Sending {self.name} "
                          f"request with no date filter.")
         except TypeError:
             logger.error(f"Got unexpected request body parameter. Please make sure the {self.name} API request body is "
                          f"a valid json.")
 
+    def _get_body_with_dates(self, start, end=None):
+        """
+        Returns the request body with the given 'start_time' and 'end_time' filters.
+        :param start: the start time
+        :param end: the end time, Optional
+        :return: the request body
+        """
+        body = json_codec.loads(self.body)
+        body["start_time"] = start.strftime(DATE_FORMAT)
+        if end:
+            body["end_time"] = end.strftime(DATE_FORMAT)
+        return json_codec.dumps(body)
+
+    def _create_backfill_request(self, start, end):
+        """
+        Creates a request for a single backfill slice, filtered with 'start_time' and 'end_time'.
+        :param start: the slice start time
+        :param end: the slice end time
+        :return: ApiFetcher instance of the slice
+        """
+        return self.model_copy(update={"body": self._get_body_with_dates(start, end),
+                                       "headers": dict(self.headers),
+                                       "next_body": None,
+                                       "outputs": []})
+
+    def _complete_backfill(self, end):
+        """
+        Updates the date filter to continue from the end of the backfill.
+        :param end: the backfill end time
+        """
+        self.body = self._get_body_with_dates(end)
+
     def send_request(self):
         """
         1. Sends request using the super class
@@ -75,11 +119,14 @@ class OnePassword(ApiFetcher):
            the first item.
         :return: all the responses that were received
         """
+        if self._backfill_planner and not self._backfill_planner.done:
+            return self._backfill_planner.run(self._create_backfill_request, self._complete_backfill)
+
         data = super().send_request()
 
-        if data:
+        if data and not self.pagination_resume:
             latest_timestamp = data[-1].get("timestamp")
-            self.body = json.loads(self.body)
+            self.body = json_codec.loads(self.body)
             self.body["start_time"] = latest_timestamp
-            self.body = json.dumps(self.body)
+            self.body = json_codec.dumps(self.body)
         return data
@@ -1,53 +1,101 @@
+import hashlib
+from importlib import import_module
+from importlib.metadata import entry_points
 import logging
+import os
 
 from pydantic import ValidationError
 import yaml
 
-# Needed for creating the input and output instances
-from src.apis.general.Api import ApiFetcher
-from src.apis.oauth.OAuth import OAuthApi
-from src.apis.azure.AzureGraph import AzureGraph
-from src.apis.azure.AzureMailReports import AzureMailReports
-from src.apis.cloudflare.Cloudflare import Cloudflare
-from src.apis.cloudflare_logs.CloudflareLogs import CloudflareLogs
-from src.apis.onepassword.OnePassword import OnePassword
+from src.apis.general.ApiGroup import ApiGroup, FAN_OUT_FIELD
 from src.output.LogzioShipper import LogzioShipper
-from src.apis.dockerhub.Dockerhub import DockerHub
-from src.apis.google.GoogleWorkspace import GoogleWorkspace
-from src.apis.google.GoogleWorkspaceActivity import GoogleWorkspaceActivity
-from src.apis.cisco_xdr.CiscoXDR import CiscoXdr
 
 INPUT_API_FIELD = "apis"
+SHARD_INDEX_ENV = "SHARD_INDEX"
+SHARD_COUNT_ENV = "SHARD_COUNT"
 OUTPUT_LOGZIO_FIELD = "logzio"
-API_TYPES_TO_CLASS_NAME_MAPPING = {
-    "general": "ApiFetcher",
-    "oauth": "OAuthApi",
-    "azure_general": "AzureApi",
-    "azure_graph": "AzureGraph",
-    "azure_mail_reports": "AzureMailReports",
-    "cloudflare": "Cloudflare",
-    "cloudflare_logs": "CloudflareLogs",
-    "1password": "OnePassword",
-    "dockerhub": "DockerHub",
-    "google_workspace": "GoogleWorkspace",
-    "google_activity": "GoogleWorkspaceActivity",
-    "cisco_xdr": "CiscoXdr",
+# The input classes are imported only when an input of their type is configured, to not load the dependencies of
+# unused inputs (such as the Google libraries)
+API_TYPES_TO_CLASS_PATH_MAPPING = {
+    "general": "src.apis.general.Api:ApiFetcher",
+    "oauth": "src.apis.oauth.OAuth:OAuthApi",
+    "azure_general": "src.apis.azure.AzureApi:AzureApi",
+    "azure_graph": "src.apis.azure.AzureGraph:AzureGraph",
+    "azure_graph_batch": "src.apis.azure.AzureGraphBatch:AzureGraphBatch",
+    "azure_mail_reports": "src.apis.azure.AzureMailReports:AzureMailReports",
+    "cloudflare": "src.apis.cloudflare.Cloudflare:Cloudflare",
+    "cloudflare_logs": "src.apis.cloudflare_logs.CloudflareLogs:CloudflareLogs",
+    "1password": "src.apis.onepassword.OnePassword:OnePassword",
+    "dockerhub": "src.apis.dockerhub.Dockerhub:DockerHub",
+    "google_workspace": "src.apis.google.GoogleWorkspace:GoogleWorkspace",
+    "google_activity": "src.apis.google.GoogleWorkspaceActivity:GoogleWorkspaceActivity",
+    "cisco_xdr": "src.apis.cisco_xdr.CiscoXDR:CiscoXdr",
 }
+# Entry point group for input types of other packages, the entry point name is the input type
+API_TYPES_ENTRY_POINT_GROUP = "logzio_api_fetcher.inputs"
 
 logger = logging.getLogger(__name__)
 
 
+_api_classes = {}
+
+
+def get_api_class(api_type):
+    """
+    Returns the input class of the given type, and imports it on first use.
+    Types that are not built in are looked up in the 'logzio_api_fetcher.inputs' entry points of the installed packages.
+    :param api_type: the input type from the config
+    :return: the input class
+    """
+    if api_type in _api_classes:
+        return _api_classes[api_type]
+
+    class_path = API_TYPES_TO_CLASS_PATH_MAPPING.get(api_type)
+    if class_path:
+        module_name, class_name = class_path.split(":")
+        api_cls = getattr(import_module(module_name), class_name)
+    else:
+        entry_point = next(iter(entry_points(group=API_TYPES_ENTRY_POINT_GROUP, name=str(api_type))), None)
+        if not entry_point:
+            raise ValueError(f"Unknown API type '{api_type}'.")
+        api_cls = entry_point.load()
+        logger.debug(f"Loaded API type '{api_type}' from entry point {entry_point.value}.")
+
+    _api_classes[api_type] = api_cls
+    return api_cls
+
+
 class ConfigReader:
     """
     Class that reads a Yaml config and generates instances based on it
     """
-    def __init__(self, conf_file):
+    def __init__(self, conf_file, shard_index=None, shard_count=None, previous_config=None, worker_index=None,
+                 workers_count=None):
         """
         Receives a path to a config file, reads it and generates other classes instances based on it.
         :param conf_file: path to the config file
+        :param shard_index: Optional, the index of this replica, to generate only the inputs assigned to it. Defaults to
+                            the SHARD_INDEX environment variable.
+        :param shard_count: Optional, the amount of replicas the inputs are spread across. Defaults to the SHARD_COUNT
+                            environment variable, or 1 (no sharding).
+        :param previous_config: Optional, the ConfigReader of the previous config (on reload), to reuse its instances of
+                                the inputs and outputs whose config did not change, with their state (such as the date
+                                filter, session and token).
+        :param worker_index: Optional, the index of this worker process, to generate only the inputs of the replica that
+                             are assigned to it.
+        :param workers_count: Optional, the amount of worker processes the inputs of the replica are spread across.
         """
         self.config = self._read_config(conf_file)
+        self.shard_index, self.shard_count = self.get_shard_settings(shard_index, shard_count)
+        self.worker_index = worker_index
+        self.workers_count = workers_count
+        # The previous instances are copied, to keep them for the next reload if this config is rejected
+        self._previous_instances = {config_key: list(instances) for config_key, instances
+                                    in previous_config._instances_by_config.items()} if previous_config else {}
+        self._instances_by_config = {}
+        self.outputs_failed = False
         self.api_instances = self.generate_instances()
+        self._previous_instances = {}
 
     @staticmethod
     def _read_config(conf_file):
@@ -68,13 +116,113 @@ class ConfigReader:
             logger.error(f"Failed to read config from path {conf_file} due to error {e}.")
         return None
 
+    @staticmethod
+    def _get_config_key(conf):
+        """
+        :param conf: an input or output config
+        :return: a key that is equal for equal configs
+        """
+        return yaml.safe_dump(conf, sort_keys=True)
+
+    def _create_instance(self, cls, conf, *args):
+        """
+        Creates an instance of the given class with the given config, or reuses the instance of the previous config if
+        it had the same class and config.
+        :param cls: the class to create
+        :param conf: the config to create the class with
+        :param args: Optional, positional arguments to create the class with
+        :return: the instance, and True if it was reused from the previous config, False otherwise
+        """
+        config_key = (cls.__name__, self._get_config_key(conf))
+        previous_instances = self._previous_instances.get(config_key)
+        reused = bool(previous_instances)
+        instance = previous_instances.pop(0) if reused else cls(*args, **conf)
+        self._instances_by_config.setdefault(config_key, []).append(instance)
+        return instance, reused
+
+    @staticmethod
+    def get_shard_settings(shard_index=None, shard_count=None):
+        """
+        Returns the shard settings of this replica, from the given values or the SHARD_INDEX and SHARD_COUNT environment
+        variables.
+        :param shard_index: Optional, the index of this replica
+        :param shard_count: Optional, the amount of replicas
+        :return: the shard index and count, or None and None if they are invalid.
+        """
+        try:
+            shard_index = int(shard_index if shard_index is not None else os.getenv(SHARD_INDEX_ENV, 0))
+            shard_count = int(shard_count if shard_count is not None else os.getenv(SHARD_COUNT_ENV, 1))
+        except ValueError as e:
+            logger.error(f"Invalid shard settings: {e}")
+            return None, None
+
+        if shard_count < 1 or not 0 <= shard_index < shard_count:
+            logger.error(f"Invalid shard settings: shard index should be between 0 and {shard_count - 1} and shard count "
+                         f"should be at least 1, got index {shard_index} and count {shard_count}.")
+            return None, None
+        return shard_index, shard_count
+
+    @staticmethod
+    def _get_input_key(api_conf):
+        """
+        :param api_conf: the input config
+        :return: the key the input is assigned by, its name (or its whole config if it has no name)
+        """
+        return api_conf.get("name") or yaml.safe_dump(api_conf, sort_keys=True)
+
+    @classmethod
+    def get_input_shard(cls, api_conf, shard_count):
+        """
+        Returns the shard (replica index) the given input is assigned to, with rendezvous hashing of the input name, so
+        changing the shard count only moves the inputs of the added or removed shards.
+        Inputs without a name are hashed by their whole config.
+        :param api_conf: the input config
+        :param shard_count: the amount of replicas
+        :return: the index of the replica the input is assigned to
+        """
+        key = cls._get_input_key(api_conf)
+        return max(range(shard_count), key=lambda shard: hashlib.sha256(f"{shard}:{key}".encode("utf-8")).digest())
+
+    @classmethod
+    def filter_shard_inputs(cls, apis, shard_index, shard_count):
+        """
+        Keeps only the inputs that are assigned to the given replica.
+        :param apis: the inputs configs
+        :param shard_index: the index of this replica
+        :param shard_count: the amount of replicas
+        :return: the inputs configs of the replica
+        """
+        if shard_count == 1:
+            return apis
+        return [api_conf for api_conf in apis
+                if isinstance(api_conf, dict) and cls.get_input_shard(api_conf, shard_count) == shard_index]
+
+    @classmethod
+    def filter_worker_inputs(cls, apis, worker_index, workers_count):
+        """
+        Keeps only the inputs that are assigned to the given worker process. The inputs are assigned round-robin in the
+        order of their names, so the workers get the same amount of inputs (up to one more). Invalid inputs configs are
+        kept in the first worker, to report them once.
+        :param apis: the inputs configs (of this replica)
+        :param worker_index: the index of this worker process
+        :param workers_count: the amount of worker processes
+        :return: the inputs configs of the worker
+        """
+        if workers_count == 1:
+            return apis
+        inputs = sorted((api_conf for api_conf in apis if isinstance(api_conf, dict)), key=cls._get_input_key)
+        worker_inputs = inputs[worker_index::workers_count]
+        if worker_index == 0:
+            worker_inputs += [api_conf for api_conf in apis if not isinstance(api_conf, dict)]
+        return worker_inputs
+
     def generate_instances(self):
         """
         Uses 'pydantic' to validate the given APIs config and generates API fetcher per valid config.
         :return: API fetcher (ApiFetcher) instances
         """
         api_instances = []
-        shipper_cls = globals().get("LogzioShipper")
+        shipper_cls = LogzioShipper
         if not self.config:
             return api_instances
         apis = self.config.get(INPUT_API_FIELD)
@@ -84,18 +232,35 @@ class ConfigReader:
             logger.error(f"No inputs defined. Please make sure your API input is configured under '{INPUT_API_FIELD}'")
             return api_instances
 
+        if self.shard_count is None:
+            return api_instances
+        if self.shard_count > 1:
+            apis = self.filter_shard_inputs(apis, self.shard_index, self.shard_count)
+            logger.info(f"Running {len(apis)} inputs assigned to shard {self.shard_index} of {self.shard_count}.")
+        if self.workers_count and self.workers_count > 1:
+            apis = self.filter_worker_inputs(apis, self.worker_index, self.workers_count)
+            logger.debug(f"Running {len(apis)} inputs assigned to worker {self.worker_index} of {self.workers_count}.")
+
         # Generate API fetchers
         for api_conf in apis:
             try:
-                api_type_cls_name = API_TYPES_TO_CLASS_NAME_MAPPING.get(api_conf.get("type"))
-                api_cls = globals().get(api_type_cls_name)
-                api_instance = api_cls(**api_conf)
+                api_cls = get_api_class(api_conf.get("type"))
+                if api_conf.get(FAN_OUT_FIELD):
+                    api_instance, reused = self._create_instance(ApiGroup, api_conf, api_cls)
+                else:
+                    api_instance, reused = self._create_instance(api_cls, api_conf)
+                if reused:
+                    logger.debug(f"Kept {api_instance.name} with its current state, as its config did not change.")
+                else:
+                    logger.debug(f"Created {api_instance.name}.")
                 api_instances.append(api_instance)
-                logger.debug(f"Created {api_instance.name}.")
-            except (AttributeError, ValidationError, TypeError) as e:
+            except (AttributeError, ImportError, ValidationError, TypeError, ValueError) as e:
                 logger.error(f"Failed to create API fetcher for config {api_conf} due to error: {e}")
 
-        # Generate Logzio shipper
+        # Generate Logzio shipper, the outputs of every API are replaced at once after all of them were created, so a
+        # running task of a reused API keeps sending to its current outputs
+        apis_outputs = [[] for _ in api_instances]
+        outputs = []
         if not logzio_conf:
             logger.warning(f"No Logzio shipper output defined. Please make sure your Logzio config is configured under "
                            f"{OUTPUT_LOGZIO_FIELD}")
@@ -104,31 +269,47 @@ class ConfigReader:
                 # Single output
                 if isinstance(logzio_conf, dict):
                     logger.debug("Recognized a single output for all APIs.")
-                    logzio_shipper_instance = shipper_cls(**logzio_conf)
+                    logzio_shipper_instance, _ = self._create_instance(shipper_cls, logzio_conf)
+                    outputs.append(logzio_shipper_instance)
                     logger.debug("Created logzio shipper.")
-                    for api in api_instances:
-                        api.outputs.append(logzio_shipper_instance)
+                    for api_outputs in apis_outputs:
+                        api_outputs.append(logzio_shipper_instance)
 
                 # Multiple outputs
                 elif isinstance(logzio_conf, list):
                     logger.debug("Recognized multiple outputs configuration.")
                     for account in logzio_conf:
-                        logzio_shipper_instance = shipper_cls(**account)
+                        logzio_shipper_instance, _ = self._create_instance(shipper_cls, account)
+                        outputs.append(logzio_shipper_instance)
 
                         if logzio_shipper_instance.inputs:
                             logger.debug(f"Created logzio shipper for inputs: {logzio_shipper_instance.inputs}")
-                            for api in api_instances:
+                            for api, api_outputs in zip(api_instances, apis_outputs):
                                 if api.name in logzio_shipper_instance.inputs:
-                                    api.outputs.append(logzio_shipper_instance)
+                                    api_outputs.append(logzio_shipper_instance)
                                     logger.debug(f"Assigned logzio shipper for API {api.name}.")
                         else:
                             logger.warning(f"Detected a Logzio shipper configuration without any defined inputs. No API data will be exported to it.")
 
                 # Invalid config
                 else:
+                    self.outputs_failed = True
                     logger.error(f"Invalid Logzio output config. Please make sure your Logzio config is an object for single output or a list for multiple outputs.")
 
             except (ValidationError, TypeError) as e:
+                self.outputs_failed = True
                 logger.error(f"Failed to create Logzio shipper for config {logzio_conf} due to error: {e}")
 
+        # On reload, the reused APIs keep their outputs if the new config is rejected
+        if not (self.outputs_failed and self._previous_instances):
+            for api, api_outputs in zip(api_instances, apis_outputs):
+                api.outputs = api_outputs
+            for output_index, output in enumerate(outputs):
+                output.register_metrics(output_index)
+            # The outputs of the previous config that were replaced stop reporting their metrics
+            for instances in self._previous_instances.values():
+                for instance in instances:
+                    if isinstance(instance, LogzioShipper):
+                        instance.unregister_metrics()
+
         return api_instances
@@ -0,0 +1,62 @@
+import logging
+import os
+
+from src.config.ConfigReader import ConfigReader
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigReloader:
+    """
+    Class that reads the config again when it changes, and reuses the instances of the inputs and outputs whose config
+    did not change, so they keep their state (such as the date filter, session and token).
+    :param conf_file: path to the config file
+    :param config_reader: the ConfigReader of the current config
+    :param watch: True to check the config file modification time for changes, False to reload only when asked to
+    """
+    def __init__(self, conf_file, config_reader, watch=False):
+        self.conf_file = conf_file
+        self.config_reader = config_reader
+        self.watch = watch
+        self._modified_time = self._get_modified_time()
+
+    def _get_modified_time(self):
+        """
+        :return: the modification time of the config file, or None if it can't be read
+        """
+        try:
+            return os.stat(self.conf_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def get_apis(self):
+        """
+        :return: the API instances to run from the current config
+        """
+        return self.config_reader.api_instances
+
+    def has_changed(self):
+        """
+        :return: True if the config file was modified since it was last read and 'watch' is on, False otherwise.
+        """
+        return self.watch and self._get_modified_time() != self._modified_time
+
+    def reload(self):
+        """
+        Reads the config file again, keeping the instances of the unchanged inputs and outputs.
+        If the new config can't be read, or its outputs can't be created, the current config is kept.
+        :return: the API instances to run from the new config, or None if the config was not reloaded.
+        """
+        self._modified_time = self._get_modified_time()
+        logger.info(f"Reloading config file {self.conf_file}")
+
+        config_reader = ConfigReader(self.conf_file, shard_index=self.config_reader.shard_index,
+                                     shard_count=self.config_reader.shard_count, previous_config=self.config_reader,
+                                     worker_index=self.config_reader.worker_index,
+                                     workers_count=self.config_reader.workers_count)
+        if not config_reader.config or config_reader.outputs_failed:
+            logger.error(f"Failed to reload config file {self.conf_file}, keeping the current config.")
+            return None
+
+        self.config_reader = config_reader
+        return self.get_apis()
@@ -6,7 +6,12 @@ import logging
 import sys
 from src.utils.MaskInfoFormatter import MaskInfoFormatter
 from src.config.ConfigReader import ConfigReader
+from src.config.ConfigReloader import ConfigReloader
+from src.manager.CycleProfiler import CycleProfiler, DEFAULT_PROFILE_DIR
 from src.manager.TaskManager import TaskManager
+from src.manager.WorkerSupervisor import WorkerSupervisor
+from src.utils import memory_budget, metrics, tracing
+from src.utils.memory_budget import MemoryBudget
 
 FETCHER_CONFIG_PATH = "./src/shared/config.yaml"
 
@@ -19,14 +24,40 @@ def __get_args():
     parser = argparse.ArgumentParser(description='Logzio API Fetcher')
     parser.add_argument('--level', type=str, required=False, default='INFO', choices=['INFO', 'WARN', 'ERROR', 'DEBUG'],
                         help='Logging level (One of INFO, WARN, ERROR, DEBUG)')
+    parser.add_argument('--workers', type=int, required=False, default=1,
+                        help='Amount of worker processes to spread the API inputs across (default 1, single process)')
+    parser.add_argument('--shard-index', type=int, required=False, default=None,
+                        help='Index of this replica, to run only the API inputs assigned to it (default SHARD_INDEX env '
+                             'variable, or 0)')
+    parser.add_argument('--shard-count', type=int, required=False, default=None,
+                        help='Amount of replicas the API inputs are spread across (default SHARD_COUNT env variable, or '
+                             '1)')
+    parser.add_argument('--watch-config', action='store_true', required=False,
+                        help='Reload the config when the config file changes (the config is always reloaded on SIGHUP)')
+    parser.add_argument('--metrics-port', type=int, required=False, default=None,
+                        help='Port to serve Prometheus metrics on (default: no metrics). With --workers, every worker '
+                             'serves its metrics on the port plus its index')
+    parser.add_argument('--trace-file', type=str, required=False, default=None,
+                        help='Path of a file to write the cycles spans to, in Chrome trace format (for Perfetto or '
+                             'chrome://tracing). With --workers, every worker writes to the path with its process ID')
+    parser.add_argument('--memory-budget-mb', type=int, required=False, default=None,
+                        help='Max MB of fetched data the inputs hold until it is shipped (default: no limit). With '
+                             '--workers, the budget is divided between the workers')
+    parser.add_argument('--profile', action='store_true', required=False,
+                        help='Profile the API inputs cycles from the start (profiling can also be toggled with SIGUSR1)')
+    parser.add_argument('--profile-dir', type=str, required=False, default=DEFAULT_PROFILE_DIR,
+                        help=f'Directory to write the profiling reports to (default {DEFAULT_PROFILE_DIR})')
+    parser.add_argument('--profile-inputs', type=str, required=False, default=None,
+                        help='Comma separated names of the API inputs to profile (default all inputs)')
     return parser.parse_args()
 
 
-def _setup_logger(level, test):
+def _setup_logger(level, test, worker_index=None):
     """
     Configures the logger and its logging level in memory.
     :param level: the logger logging level
     :param test: flag to indicate if it's a test run
+    :param worker_index: Optional, the index of the worker process to add to the log lines
     """
     if test:
         level = "DEBUG"
@@ -37,13 +68,15 @@ def _setup_logger(level, test):
     stream_handler = logging.StreamHandler(sys.stderr)
     stream_handler.setLevel(level)
 
-    formatter = MaskInfoFormatter(fmt="%(asctime)s [%(levelname)s]: %(message)s")
+    worker_prefix = f"[worker {worker_index}] " if worker_index is not None else ""
+    formatter = MaskInfoFormatter(fmt=f"%(asctime)s {worker_prefix}[%(levelname)s]: %(message)s")
     stream_handler.setFormatter(formatter)
 
     logger.handlers.clear()
     logger.addHandler(stream_handler)
 
-    logging.info(f"Starting Logzio API fetcher in {level} level.")
+    if worker_index is None:
+        logging.info(f"Starting Logzio API fetcher in {level} level.")
 
 
 def main(conf_path=FETCHER_CONFIG_PATH, test=False):
@@ -52,11 +85,37 @@ def main(conf_path=FETCHER_CONFIG_PATH, test=False):
     """
     args = __get_args()
     _setup_logger(args.level, test)
-
-    conf = ConfigReader(conf_path)
+    profiler = CycleProfiler(args.profile_dir, enabled=args.profile,
+                             inputs=[name.strip() for name in (args.profile_inputs or "").split(",") if name.strip()])
+
+    if args.workers > 1:
+        def init_worker(worker_index):
+            _setup_logger(args.level, test, worker_index)
+            if args.metrics_port is not None:
+                metrics.start_metrics_server(args.metrics_port + worker_index)
+            if args.memory_budget_mb:
+                memory_budget.set_budget(MemoryBudget(args.memory_budget_mb * 1024 * 1024 / args.workers))
+            if args.trace_file:
+                trace_file_root, trace_file_ext = os.path.splitext(args.trace_file)
+                tracing.start_tracing(f"{trace_file_root}-{os.getpid()}{trace_file_ext}")
+
+        WorkerSupervisor(conf_path, args.workers, worker_init=init_worker, shard_index=args.shard_index,
+                         shard_count=args.shard_count, watch_config=args.watch_config, profiler=profiler).run()
+        return
+
+    if args.metrics_port is not None:
+        metrics.start_metrics_server(args.metrics_port)
+    if args.trace_file:
+        tracing.start_tracing(args.trace_file)
+    if args.memory_budget_mb:
+        memory_budget.set_budget(MemoryBudget(args.memory_budget_mb * 1024 * 1024))
+
+    conf = ConfigReader(conf_path, shard_index=args.shard_index, shard_count=args.shard_count)
 
     if conf.api_instances:
-        TaskManager(apis=conf.api_instances).run()
+        TaskManager(apis=conf.api_instances,
+                    config_reloader=ConfigReloader(conf_path, conf, watch=args.watch_config), profiler=profiler).run()
+    tracing.stop_tracing()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,124 @@
+import cProfile
+from datetime import datetime
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import tracemalloc
+
+DEFAULT_PROFILE_DIR = "./src/shared/profiles"
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+logger = logging.getLogger(__name__)
+
+
+class CycleProfiler:
+    """
+    Profiles the cycles of the selected inputs with cProfile and tracemalloc, and writes a report per cycle.
+    Only one cycle is profiled at a time, cycles of other inputs that run meanwhile are not profiled.
+    When profiling is off, the cycles run as is.
+    :param output_dir: the directory to write the reports to
+    :param enabled: True to profile from the start, False to wait for toggle (such as by a signal)
+    :param inputs: Optional, the names of the inputs to profile (default: all inputs)
+    """
+    def __init__(self, output_dir=DEFAULT_PROFILE_DIR, enabled=False, inputs=None):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.inputs = set(inputs) if inputs else None
+        self._lock = threading.Lock()
+
+    def toggle(self):
+        """
+        Turns profiling on if it is off, and off if it is on.
+        """
+        self.enabled = not self.enabled
+        logger.info(f"Profiling is {'on' if self.enabled else 'off'}. Reports are written to {self.output_dir}")
+
+    def should_profile(self, api_name):
+        """
+        :param api_name: the input name
+        :return: True if the cycles of the given input should be profiled now, False otherwise
+        """
+        return self.enabled and (self.inputs is None or api_name in self.inputs)
+
+    def _get_report_path(self, api_name):
+        """
+        :param api_name: the input name
+        :return: the path of the report files of the given input cycle, without extension
+        """
+        safe_name = re.sub(r"[^\w.-]+", "_", api_name).strip("_") or "input"
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        return os.path.join(self.output_dir, f"{safe_name}-{timestamp}-{os.getpid()}")
+
+    @staticmethod
+    def _format_allocations(start_snapshot, end_snapshot):
+        """
+        :param start_snapshot: tracemalloc snapshot of the cycle start
+        :param end_snapshot: tracemalloc snapshot of the cycle end
+        :return: report of the lines that allocated the most memory that is still in use at the cycle end
+        """
+        snapshot_filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        stats = end_snapshot.filter_traces(snapshot_filters).compare_to(
+            start_snapshot.filter_traces(snapshot_filters), "lineno")
+        lines = [f"Top {TOP_ALLOCATIONS} allocations that are still in use at the cycle end (by line):"]
+        lines.extend(str(stat) for stat in stats[:TOP_ALLOCATIONS])
+        return "\n".join(lines)
+
+    def _write_report(self, api_name, profile, allocations, peak_memory):
+        """
+        Writes the pstats file and the text report of a cycle.
+        :param api_name: the input name
+        :param profile: the cProfile.Profile of the cycle
+        :param allocations: the allocations report of the cycle
+        :param peak_memory: the peak traced memory during the cycle in bytes
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        report_path = self._get_report_path(api_name)
+        profile.dump_stats(f"{report_path}.pstats")
+
+        stats_text = io.StringIO()
+        pstats.Stats(profile, stream=stats_text).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        with open(f"{report_path}.txt", "w") as report_file:
+            report_file.write(f"Cycle of api {api_name}, peak traced memory {peak_memory / 1024 / 1024:.1f} MB\n\n")
+            report_file.write(allocations)
+            report_file.write("\n\n")
+            report_file.write(stats_text.getvalue())
+        logger.info(f"Wrote the profile of api {api_name} cycle to {report_path}.txt and {report_path}.pstats")
+
+    def run(self, api_name, func, *args):
+        """
+        Runs the given function, profiled if no other cycle is being profiled.
+        :param api_name: the input name
+        :param func: the cycle function
+        :param args: the cycle function arguments
+        :return: the function return value
+        """
+        # Only one profiler can be active at a time
+        if not self._lock.acquire(blocking=False):
+            logger.debug(f"Not profiling the cycle of api {api_name}, as another cycle is being profiled.")
+            return func(*args)
+
+        try:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            start_snapshot = tracemalloc.take_snapshot()
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args)
+            finally:
+                end_snapshot = tracemalloc.take_snapshot()
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+                try:
+                    self._write_report(api_name, profile, self._format_allocations(start_snapshot, end_snapshot),
+                                       peak_memory)
+                except OSError as e:
+                    logger.error(f"Failed to write the profile of api {api_name} to {self.output_dir}: {e}")
+        finally:
+            self._lock.release()
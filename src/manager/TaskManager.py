@@ -4,7 +4,12 @@ import requests
 from requests.sessions import InvalidSchema
 import signal
 import threading
+from time import time
 
+from src.apis.general.ApiGroup import ApiGroup
+from src.utils import memory_budget, metrics, tracing
+
+CONFIG_WATCH_INTERVAL_SECONDS = 10
 
 logger = logging.getLogger(__name__)
 
@@ -13,11 +18,21 @@ class TaskManager:
     """
     Class to run scheduled task that collects data from given APIs and sends them with the given logzio_shipper.
     :param apis: List of ApiFetcher instances to fetch data from
+    :param stats_callback: Optional, function to call after every task with the API name, the amount of logs that were
+                           sent, the task duration in seconds and whether the task succeeded.
+    :param config_reloader: Optional, ConfigReloader to reload the APIs from on SIGHUP or config file change.
+    :param profiler: Optional, CycleProfiler to profile the APIs cycles with (toggled on and off with SIGUSR1).
     """
-    def __init__(self, apis=[]):
+    def __init__(self, apis=[], stats_callback=None, config_reloader=None, profiler=None):
         self.apis = apis
+        self.stats_callback = stats_callback
+        self.config_reloader = config_reloader
+        self.profiler = profiler
         self.threads = []
+        self.api_tasks = {}
         self.event = threading.Event()
+        self.wakeup_event = threading.Event()
+        self.reload_requested = False
 
     @staticmethod
     def _terminate_process():
@@ -26,17 +41,57 @@ class TaskManager:
     def _run_api_task(self, api):
         """
         Collects data from the API and sends it to Logzio.
+        :param api: The API class instance (or ApiGroup instance, to run all the APIs of the group one after the other)
+        """
+        if isinstance(api, ApiGroup):
+            for group_api in api.iterate_apis():
+                if self.event.is_set():
+                    break
+                self._run_api_task(group_api)
+            return
+
+        with tracing.span("cycle", "cycle", input=api.name):
+            if self.profiler and self.profiler.should_profile(api.name):
+                self.profiler.run(api.name, self._run_api_cycle, api)
+            else:
+                self._run_api_cycle(api)
+        tracing.flush()
+
+    def _run_api_cycle(self, api):
+        """
+        Collects data from a single API and sends it to Logzio.
         :param api: The API class instance
         """
         logger.info(f"Starting task for api {api.name}.")
+        start_time = time()
+        logs_count = 0
+        succeeded = False
+        budget = memory_budget.get_budget()
+        if budget:
+            budget.start(api.name)
 
         try:
+            # The logs may be a generator (streamed by the API), so they are iterated only once
             logs = api.send_request()
+            if logs and api.dedup:
+                logs = api.dedup.filter_logs(logs, api.name)
+            if logs and api.processing:
+                logs = api.processing.process_logs(logs, api.name)
+            if logs and api.quota:
+                logs = api.quota.limit_logs(logs, api.name)
+            # The outputs may be replaced on config reload, the logs of this task are sent to the current ones
+            outputs = api.outputs
             if logs:
-                for logzio_shipper in api.outputs:
-                    for log in logs:
+                for log in logs:
+                    logs_count += 1
+                    for logzio_shipper in outputs:
                         logzio_shipper.add_log_to_send(log, api.additional_fields)
+                for logzio_shipper in outputs:
                     logzio_shipper.send_to_logzio()
+            if api.dedup:
+                api.dedup.save()
+            succeeded = True
+            metrics.set_last_success(api.name)
 
         except requests.exceptions.InvalidURL as e:
             logger.error(f"Failed to send data to Logz.io... Invalid url: {e}")
@@ -53,14 +108,25 @@ class TaskManager:
                 return
         except Exception as e:
             logger.error(f"Failed to send data to Logz.io... exception: {e}")
+        finally:
+            if budget:
+                # The fetched data of the cycle was shipped (or dropped)
+                budget.release(api.name)
+            duration = time() - start_time
+            metrics.FETCHED_RECORDS.inc(logs_count, input=api.name)
+            metrics.CYCLE_DURATION.observe(duration, input=api.name, succeeded=succeeded)
+            if self.stats_callback:
+                self.stats_callback(api.name, logs_count, duration, succeeded)
         logger.info(f"Task finished for api {api.name}. New task will run in {api.scrape_interval_minutes} minutes.")
 
-    def _run_api_scheduled_task(self, api):
+    def _run_api_scheduled_task(self, api, event=None):
         """
         Runs scheduled task, based on the API scrape interval, to collect and send data with _send_data_to_logzio
         function.
         :param api: The API class instance
+        :param event: Optional, event to stop the task of this API only
         """
+        event = event or self.event
         while True:
             logger.debug(f"Starting thread to collect logs from {api.name}")
             thread = threading.Thread(target=self._run_api_task, args=(api,))
@@ -68,40 +134,127 @@ class TaskManager:
             thread.join()
 
             # Enforce new task to run every scrape_interval
-            if self.event.wait(timeout=api.scrape_interval_minutes * 60):
+            if event.wait(timeout=api.scrape_interval_minutes * 60) or self.event.is_set():
                 break
 
+    @staticmethod
+    def _get_api_names(api):
+        """
+        :param api: The API class instance (or ApiGroup instance)
+        :return: the names of the API (or of all the APIs of the group)
+        """
+        if isinstance(api, ApiGroup):
+            return [group_api.name for group_api in api.apis]
+        return [api.name]
+
+    def _start_api_thread(self, api):
+        """
+        Starts the scheduled task thread of the given API.
+        :param api: The API class instance
+        """
+        event = threading.Event()
+        thread = threading.Thread(target=self._run_api_scheduled_task, args=(api, event))
+        self.threads.append(thread)
+        self.api_tasks[id(api)] = (api, thread, event)
+        thread.start()
+
+    def update_apis(self, apis):
+        """
+        Stops the tasks of the APIs that are not in the given APIs (removed, or replaced due to a config change), after
+        their current run, and starts tasks for the new APIs. APIs that are already running keep running.
+        :param apis: List of ApiFetcher instances to fetch data from
+        """
+        api_ids = {id(api) for api in apis}
+        stopped_threads = []
+        stopped_names = set()
+        for api_id, (api, thread, event) in list(self.api_tasks.items()):
+            if api_id not in api_ids:
+                logger.info(f"Stopping the task of api {api.name}, as its config was changed or removed.")
+                event.set()
+                stopped_threads.append(thread)
+                stopped_names.update(self._get_api_names(api))
+                del self.api_tasks[api_id]
+
+        for thread in stopped_threads:
+            thread.join()
+            self.threads.remove(thread)
+
+        # The inputs that were removed are no longer lagging
+        for name in stopped_names.difference(*(self._get_api_names(api) for api in apis)):
+            metrics.INGESTION_LAG.remove(input=name)
+
+        for api in apis:
+            if id(api) not in self.api_tasks:
+                logger.info(f"Starting the task of api {api.name}.")
+                self._start_api_thread(api)
+
+        self.apis = apis
+        logger.debug(f"Running {len(self.api_tasks)} API inputs.")
+
     def __exit_gracefully(self, signum, frame):
         """
-        Clear up all threads before closing program
+        Stops all the tasks after their current run
         :param signum: the number of signal that called the function (required for 'signal.signal' usage)
         :param frame: the frame number (required for 'signal.signal' usage)
         """
         logger.info("Signal caught... Stopping")
         self.event.set()
+        self.wakeup_event.set()
 
-        for thread in self.threads:
-            thread.join()
+    def __request_reload(self, signum, frame):
+        """
+        Asks the run loop to reload the config
+        :param signum: the number of signal that called the function (required for 'signal.signal' usage)
+        :param frame: the frame number (required for 'signal.signal' usage)
+        """
+        logger.info("Reload signal caught...")
+        self.reload_requested = True
+        self.wakeup_event.set()
+
+    def __toggle_profiling(self, signum, frame):
+        """
+        Turns the cycles profiling on or off
+        :param signum: the number of signal that called the function (required for 'signal.signal' usage)
+        :param frame: the frame number (required for 'signal.signal' usage)
+        """
+        self.profiler.toggle()
+
+    def _reload_config(self):
+        """
+        Reloads the config, and updates the running tasks to the new APIs.
+        """
+        self.reload_requested = False
+        apis = self.config_reloader.reload()
+        if apis is not None:
+            self.update_apis(apis)
 
     def run(self):
         """
         Creates thread per API fetcher that runs a scheduled collection task based on the scrape interval.
+        If a config reloader is set, reloads the config on SIGHUP (or when the config file changes, if it is watched).
         """
-        if not self.apis:
+        if not self.apis and not self.config_reloader:
             return
 
-        for api in self.apis:
-            thread = threading.Thread(target=self._run_api_scheduled_task, args=(api,))
-            self.threads.append(thread)
+        signal.signal(signal.SIGINT, self.__exit_gracefully)
+        signal.signal(signal.SIGTERM, self.__exit_gracefully)
+        if self.config_reloader:
+            signal.signal(signal.SIGHUP, self.__request_reload)
+        if self.profiler:
+            signal.signal(signal.SIGUSR1, self.__toggle_profiling)
 
-        logger.debug(f"Configured {len(self.threads)} API inputs.")
+        self.update_apis(self.apis)
 
-        for thread in self.threads:
-            thread.start()
+        watch_interval = CONFIG_WATCH_INTERVAL_SECONDS if self.config_reloader and self.config_reloader.watch else None
+        while not self.event.is_set():
+            self.wakeup_event.wait(timeout=watch_interval)
+            self.wakeup_event.clear()
+            if self.event.is_set():
+                break
+            if self.config_reloader and (self.reload_requested or self.config_reloader.has_changed()):
+                self._reload_config()
 
+        for api, thread, event in self.api_tasks.values():
+            event.set()
         for thread in self.threads:
             thread.join()
-
-        signal.signal(signal.SIGINT, self.__exit_gracefully)
-        signal.signal(signal.SIGTERM, self.__exit_gracefully)
-        signal.sigwait([signal.SIGINT, signal.SIGTERM])
@@ -0,0 +1,260 @@
+import logging
+import multiprocessing
+import os
+from queue import Empty
+import signal
+import threading
+from time import time
+
+from src.config.ConfigReader import ConfigReader, INPUT_API_FIELD
+from src.config.ConfigReloader import ConfigReloader
+from src.manager.TaskManager import TaskManager
+
+STATS_LOG_INTERVAL_SECONDS = 300
+STOP_TIMEOUT_SECONDS = 30
+MAX_RESTART_DELAY_SECONDS = 60
+STABLE_WORKER_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+def _run_worker(conf_path, worker_index, workers_count, stats_queue, worker_init=None, shard_index=None,
+                shard_count=None, watch_config=False, profiler=None):
+    """
+    Runs a worker process, which reads the config and runs the APIs assigned to it with its own TaskManager and outputs.
+    :param conf_path: path to the config file
+    :param worker_index: the index of the worker
+    :param workers_count: the amount of workers
+    :param stats_queue: queue to send the worker tasks stats to the supervisor
+    :param worker_init: Optional, function to call with the worker index when the worker starts (such as for logging)
+    :param shard_index: Optional, the index of this replica (see ConfigReader)
+    :param shard_count: Optional, the amount of replicas (see ConfigReader)
+    :param watch_config: True to reload the config when the config file changes, False to reload only on SIGHUP
+    :param profiler: Optional, CycleProfiler to profile the APIs cycles with (toggled on and off with SIGUSR1)
+    """
+    # Reset the signal handlers inherited from the supervisor until the TaskManager sets its own, the supervisor stops
+    # the worker with SIGTERM
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    if worker_init:
+        worker_init(worker_index)
+
+    conf = ConfigReader(conf_path, shard_index=shard_index, shard_count=shard_count, worker_index=worker_index,
+                        workers_count=workers_count)
+    config_reloader = ConfigReloader(conf_path, conf, watch=watch_config)
+    apis = config_reloader.get_apis()
+    logger.info(f"Worker {worker_index} is running {len(apis)} API inputs: {[api.name for api in apis]}")
+
+    def report_task_stats(api_name, logs_count, duration, succeeded):
+        stats_queue.put((worker_index, api_name, logs_count, duration, succeeded))
+
+    TaskManager(apis=apis, stats_callback=report_task_stats, config_reloader=config_reloader,
+                profiler=profiler).run()
+
+
+class WorkerSupervisor:
+    """
+    Spreads the configured APIs across worker processes, each with its own TaskManager and Logz.io outputs, to use
+    several CPU cores.
+    Restarts workers that crashed and collects the tasks stats of every worker.
+    :param conf_path: path to the config file
+    :param workers_count: the amount of worker processes
+    :param worker_init: Optional, function to call with the worker index when a worker starts (such as for logging)
+    :param shard_index: Optional, the index of this replica (see ConfigReader)
+    :param shard_count: Optional, the amount of replicas (see ConfigReader)
+    :param watch_config: True for the workers to reload the config when the config file changes. The config is also
+                         reloaded on SIGHUP, which is passed to all the workers.
+    :param profiler: Optional, CycleProfiler for the workers to profile the APIs cycles with. SIGUSR1 is passed to all
+                     the workers to toggle it.
+    """
+    def __init__(self, conf_path, workers_count, worker_init=None, shard_index=None, shard_count=None,
+                 watch_config=False, profiler=None):
+        self.conf_path = conf_path
+        self.workers_count = workers_count
+        self.worker_init = worker_init
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.watch_config = watch_config
+        self.profiler = profiler
+        # Fork keeps the already configured process state (such as logging) in the workers
+        self.context = multiprocessing.get_context("fork")
+        self.stats_queue = self.context.Queue()
+        self.workers = {}
+        self.stats = {}
+        self.event = threading.Event()
+
+    def _get_inputs_count(self):
+        """
+        :return: the amount of configured API inputs of this replica
+        """
+        config = ConfigReader._read_config(self.conf_path) or {}
+        shard_index, shard_count = ConfigReader.get_shard_settings(self.shard_index, self.shard_count)
+        if shard_count is None:
+            return 0
+        apis = ConfigReader.filter_shard_inputs(config.get(INPUT_API_FIELD) or [], shard_index, shard_count)
+        return sum(isinstance(api_conf, dict) for api_conf in apis)
+
+    def _start_worker(self, worker_index):
+        """
+        Starts the worker process of the given index.
+        :param worker_index: the index of the worker
+        """
+        process = self.context.Process(target=_run_worker,
+                                       args=(self.conf_path, worker_index, self.workers_count, self.stats_queue,
+                                             self.worker_init, self.shard_index, self.shard_count, self.watch_config,
+                                             self.profiler),
+                                       name=f"api-fetcher-worker-{worker_index}")
+        process.start()
+
+        worker = self.workers.setdefault(worker_index, {"restarts": 0, "crashes_in_row": 0})
+        worker.update({"process": process, "start_time": time(), "restart_time": None})
+        self.stats.setdefault(worker_index, {})
+        logger.info(f"Started worker {worker_index} (pid {process.pid}).")
+
+    def _check_workers(self):
+        """
+        Restarts the workers that exited, with an increasing delay if a worker keeps crashing.
+        :return: False if a worker asked to terminate the program (same as a single process run does), True otherwise.
+        """
+        now = time()
+        for worker_index, worker in self.workers.items():
+            process = worker["process"]
+            if process.is_alive():
+                continue
+
+            # A worker stops by itself (rather than crashing) when it terminates the program, such as due to an invalid
+            # Logz.io URL or token
+            if process.exitcode in (0, -signal.SIGTERM):
+                logger.error(f"Worker {worker_index} (pid {process.pid}) terminated itself. Stopping all workers.")
+                return False
+
+            if worker["restart_time"] is None:
+                crashed_fast = now - worker["start_time"] < STABLE_WORKER_SECONDS
+                worker["crashes_in_row"] = worker["crashes_in_row"] + 1 if crashed_fast else 1
+                delay = min(2 ** (worker["crashes_in_row"] - 1) - 1, MAX_RESTART_DELAY_SECONDS)
+                worker["restart_time"] = now + delay
+                logger.error(f"Worker {worker_index} (pid {process.pid}) exited with code {process.exitcode}. "
+                             f"Restarting it in {delay} seconds.")
+
+            if now >= worker["restart_time"]:
+                worker["restarts"] += 1
+                self._start_worker(worker_index)
+        return True
+
+    def _collect_stats(self, timeout=1):
+        """
+        Collects the tasks stats that the workers sent.
+        :param timeout: seconds to wait for the first stats
+        """
+        try:
+            worker_index, api_name, logs_count, duration, succeeded = self.stats_queue.get(timeout=timeout)
+            while True:
+                api_stats = self.stats.setdefault(worker_index, {}).setdefault(
+                    api_name, {"runs": 0, "failed_runs": 0, "logs": 0, "last_duration": 0})
+                api_stats["runs"] += 1
+                api_stats["failed_runs"] += 0 if succeeded else 1
+                api_stats["logs"] += logs_count
+                api_stats["last_duration"] = duration
+                worker_index, api_name, logs_count, duration, succeeded = self.stats_queue.get_nowait()
+        except Empty:
+            pass
+
+    def log_stats(self):
+        """
+        Logs the tasks stats of every worker.
+        """
+        for worker_index, apis_stats in sorted(self.stats.items()):
+            worker = self.workers.get(worker_index, {})
+            process = worker.get("process")
+            logger.info(f"Worker {worker_index} (pid {process.pid if process else None}, restarts "
+                        f"{worker.get('restarts', 0)}) stats: " +
+                        (", ".join(f"{api_name}: {s['runs']} runs ({s['failed_runs']} failed), {s['logs']} logs, last "
+                                   f"run {s['last_duration']:.1f}s" for api_name, s in apis_stats.items())
+                         or "no runs yet"))
+
+    def _stop_workers(self):
+        """
+        Stops all the workers, and kills the ones that did not stop within STOP_TIMEOUT_SECONDS.
+        """
+        for worker in self.workers.values():
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+        for worker_index, worker in self.workers.items():
+            worker["process"].join(timeout=STOP_TIMEOUT_SECONDS)
+            if worker["process"].is_alive():
+                logger.warning(f"Worker {worker_index} did not stop in {STOP_TIMEOUT_SECONDS} seconds, killing it.")
+                worker["process"].kill()
+                worker["process"].join()
+
+    def __exit_gracefully(self, signum, frame):
+        """
+        Stops the supervisor loop.
+        :param signum: the number of signal that called the function (required for 'signal.signal' usage)
+        :param frame: the frame number (required for 'signal.signal' usage)
+        """
+        logger.info("Signal caught... Stopping workers")
+        self.event.set()
+
+    def _signal_workers(self, signum):
+        """
+        Sends the given signal to all the running workers.
+        :param signum: the signal number
+        """
+        for worker in self.workers.values():
+            if worker["process"].is_alive():
+                os.kill(worker["process"].pid, signum)
+
+    def __reload_workers(self, signum, frame):
+        """
+        Passes the reload signal to all the workers.
+        :param signum: the number of signal that called the function (required for 'signal.signal' usage)
+        :param frame: the frame number (required for 'signal.signal' usage)
+        """
+        logger.info("Reload signal caught... Reloading the config in all workers")
+        self._signal_workers(signal.SIGHUP)
+
+    def __toggle_workers_profiling(self, signum, frame):
+        """
+        Passes the profiling toggle signal to all the workers.
+        :param signum: the number of signal that called the function (required for 'signal.signal' usage)
+        :param frame: the frame number (required for 'signal.signal' usage)
+        """
+        logger.info("Profiling signal caught... Toggling the profiling in all workers")
+        self._signal_workers(signal.SIGUSR1)
+
+    def run(self):
+        """
+        Starts the workers and supervises them until a stop signal is received.
+        """
+        inputs_count = self._get_inputs_count()
+        if not inputs_count:
+            logger.error(f"No inputs to run. Please make sure your API input is configured under '{INPUT_API_FIELD}' "
+                         f"(and that the shard settings are valid)")
+            return
+        if self.workers_count > inputs_count:
+            logger.info(f"Using {inputs_count} workers, one per API input.")
+            self.workers_count = inputs_count
+
+        signal.signal(signal.SIGINT, self.__exit_gracefully)
+        signal.signal(signal.SIGTERM, self.__exit_gracefully)
+        signal.signal(signal.SIGHUP, self.__reload_workers)
+        if self.profiler:
+            signal.signal(signal.SIGUSR1, self.__toggle_workers_profiling)
+
+        for worker_index in range(self.workers_count):
+            self._start_worker(worker_index)
+
+        last_stats_log = time()
+        while not self.event.is_set():
+            self._collect_stats()
+            if not self._check_workers():
+                break
+            if time() - last_stats_log >= STATS_LOG_INTERVAL_SECONDS:
+                self.log_stats()
+                last_stats_log = time()
+
+        self._stop_workers()
+        self._collect_stats(timeout=0)
+        self.log_stats()
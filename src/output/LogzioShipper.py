@@ -1,12 +1,18 @@
+from collections import OrderedDict
 import gzip
-import json
 import logging
 from pydantic import BaseModel, Field
 import requests
+import threading
+from time import perf_counter
+import weakref
 from requests.adapters import HTTPAdapter, RetryError
 from requests.sessions import InvalidSchema
 from urllib3.util.retry import Retry
 
+from src.utils import json_codec, metrics, tracing
+from src.utils.LogPreview import LogPreview
+
 # Current integration version
 INT_VERSION = "0.2.0"
 
@@ -15,6 +21,9 @@ MAX_BODY_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB
 MAX_BULK_SIZE_BYTES = MAX_BODY_SIZE_BYTES / 10  # 1 MB
 MAX_LOG_SIZE_BYTES = 500 * 1000  # 500 KB
 
+# Max amount of custom fields sets to keep serialized for the raw logs
+MAX_RAW_FIELDS_CACHE_SIZE = 128
+
 # Retry Settings
 MAX_RETRIES = 3
 BACKOFF_FACTOR = 1
@@ -24,23 +33,84 @@ CONNECTION_TIMEOUT_SECONDS = 5
 logger = logging.getLogger(__name__)
 
 
+class _TracedRetry(Retry):
+    """
+    Retry settings that add a trace event on every retry of the listener request.
+    """
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        tracing.instant("listener retry", "listener", status=response.status if response is not None else None,
+                        error=str(error) if error else None)
+        return super().increment(method=method, url=url, response=response, error=error, _pool=_pool,
+                                 _stacktrace=_stacktrace)
+
+
 class LogzioShipper(BaseModel):
     """
     Class to send data to logzio
     :param listener: The listener endpoint to send the logs to (Default: https://listener.logz.io:8071)
     :param token: Required, the logzio shipping token
-    :param curr_logs: Not passed to the class, array of the logs that were yet to sent
+    :param curr_logs: Not passed to the class, array of the logs (JSON bytes) that were yet to sent
     :param curr_bulk_size: Not passed to the class, size of the current logs bulk (of data in 'self.curr_logs')
+    :param _raw_fields_cache: Not passed to the class, the custom fields as JSON members to splice into raw logs, by
+                              the custom fields content (up to MAX_RAW_FIELDS_CACHE_SIZE of them, oldest evicted first).
+    :param _lock: Not passed to the class, lock of the current bulk, as the shipper may be shared by several APIs threads.
+                  A full bulk is taken out of the current bulk under the lock and sent without holding it, so the other
+                  threads keep adding logs while a bulk is sent.
+    :param _metrics_output: Not passed to the class, the listener URL (without the token) to record the metrics under.
+    :param _metrics_gauges: Not passed to the class, the labels and functions the current bulk gauges were set with (see
+                            register_metrics).
     """
     listener: str = Field(default="https://listener.logz.io:8071", alias="url")
     token: str = Field(frozen=True)
     inputs: list = Field(default=[], frozen=True)
     curr_logs: list = Field(default=[], init=False, init_var=True)
     curr_bulk_size: int = Field(default=0, init=False, init_var=True)
+    _raw_fields_cache: OrderedDict = None
+    _lock: threading.RLock = None
+    _metrics_output: str = None
+    _metrics_gauges: tuple = None
 
     def __init__(self, **data):
         super().__init__(**data)
+        self._metrics_output = self.listener
         self.listener = f"{self.listener}/?token={self.token}"
+        self._lock = threading.RLock()
+        self._raw_fields_cache = OrderedDict()
+
+    def register_metrics(self, output_index):
+        """
+        Sets the gauges of the current bulk, which are read when the metrics are collected. They are labelled by the
+        listener URL and the index of the output in the config, so outputs on the same listener have their own series.
+        The gauges read the shipper weakly, so they do not keep it alive once it was replaced.
+        :param output_index: the index of the output in the config
+        """
+        self.unregister_metrics()
+        shipper = weakref.ref(self)
+
+        def pending_logs():
+            curr_shipper = shipper()
+            return len(curr_shipper.curr_logs) if curr_shipper else None
+
+        def pending_bytes():
+            curr_shipper = shipper()
+            return curr_shipper.curr_bulk_size if curr_shipper else None
+
+        labels = {"output": self._metrics_output, "output_index": output_index}
+        self._metrics_gauges = (labels, pending_logs, pending_bytes)
+        metrics.BULK_PENDING_LOGS.set(pending_logs, **labels)
+        metrics.BULK_PENDING_BYTES.set(pending_bytes, **labels)
+
+    def unregister_metrics(self):
+        """
+        Removes the gauges of the current bulk (such as of an output that was replaced on a config reload), unless they
+        were already set by another shipper with the same labels.
+        """
+        if not self._metrics_gauges:
+            return
+        labels, pending_logs, pending_bytes = self._metrics_gauges
+        metrics.BULK_PENDING_LOGS.unset(pending_logs, **labels)
+        metrics.BULK_PENDING_BYTES.unset(pending_bytes, **labels)
+        self._metrics_gauges = None
 
     @staticmethod
     def _add_custom_fields_to_log(log, custom_fields):
@@ -48,18 +118,74 @@ class LogzioShipper(BaseModel):
         Makes sure the given log is in JSON format (if not, makes it) and adds the given custom fields to it.
         :param log: the log
         :param custom_fields: the fields to add to it
-        :return: the log in json format with the custom fields added to it
+        :return: the log in json format (bytes) with the custom fields added to it
         """
 
-        try:
-            json_log = json.loads(log)
-        except json.decoder.JSONDecodeError:
-            json_log = {"message": log}
-        except TypeError:
+        if isinstance(log, str):
+            try:
+                json_log = json_codec.loads(log)
+            except json_codec.JSONDecodeError:
+                json_log = {"message": log}
+        else:
             json_log = log
         if custom_fields:
             json_log.update(custom_fields)
-        return json.dumps(json_log)
+        return json_codec.dumps_bytes(json_log)
+
+    def _get_raw_custom_fields(self, custom_fields):
+        """
+        Returns the given custom fields as JSON members (without the wrapping brackets), ready to be spliced into a raw
+        JSON log. The result is cached by the custom fields content, since they are constant per API. Custom fields
+        with values that can not be hashed (such as nested objects) are serialized on every call.
+        :param custom_fields: the fields to add to the logs
+        :return: the custom fields as JSON members bytes
+        """
+        try:
+            # The value types are part of the key, as equal values of different types (such as 1 and True) are
+            # serialized differently
+            cache_key = tuple((key, type(value), value) for key, value in custom_fields.items())
+            hash(cache_key)
+        except TypeError:
+            return json_codec.dumps_bytes(custom_fields)[1:-1]
+
+        with self._lock:
+            raw_fields = self._raw_fields_cache.get(cache_key)
+            if raw_fields is not None:
+                self._raw_fields_cache.move_to_end(cache_key)
+                return raw_fields
+        raw_fields = json_codec.dumps_bytes(custom_fields)[1:-1]
+        with self._lock:
+            self._raw_fields_cache[cache_key] = raw_fields
+            if len(self._raw_fields_cache) > MAX_RAW_FIELDS_CACHE_SIZE:
+                self._raw_fields_cache.popitem(last=False)
+        return raw_fields
+
+    def _add_custom_fields_to_raw_log(self, raw_log, custom_fields):
+        """
+        Adds the given custom fields to a raw JSON object log (bytes) without serializing it again, by splicing them
+        before its closing bracket. The log is decoded to validate it, so malformed lines are never spliced into the
+        bulk. If the log already has one of the custom fields, it is overridden in the decoded log (rather than
+        duplicating the key), which is serialized instead.
+        :param raw_log: the raw JSON object log
+        :param custom_fields: the fields to add to it
+        :return: the log (bytes) with the custom fields added to it, or None if the log is not a valid JSON object
+        """
+        raw_log = raw_log.strip()
+        try:
+            log = json_codec.loads(raw_log)
+        except (json_codec.JSONDecodeError, UnicodeDecodeError):
+            return None
+        if not isinstance(log, dict):
+            return None
+        if not custom_fields:
+            return raw_log
+
+        if any(str(key) in log for key in custom_fields):
+            log.update(custom_fields)
+            return json_codec.dumps_bytes(log)
+        log_members = raw_log[:-1].rstrip()
+        separator = b"" if log_members.endswith(b"{") else b","
+        return log_members + separator + self._get_raw_custom_fields(custom_fields) + b"}"
 
     @staticmethod
     def _is_valid_log(log_to_send, log_size):
@@ -70,8 +196,8 @@ class LogzioShipper(BaseModel):
         :return: True if log_size < MAX_LOG_SIZE_BYTES, false otherwise
         """
         if log_size > MAX_LOG_SIZE_BYTES:
-            logger.error(f"The following log size of {log_size} bytes is passing the allowed "
-                         f"{MAX_LOG_SIZE_BYTES} bytes logzio limit. Not sending the log: '{log_to_send}'")
+            logger.error("The following log size of %s bytes is passing the allowed %s bytes logzio limit. Not sending "
+                         "the log: '%s'", log_size, MAX_LOG_SIZE_BYTES, LogPreview(log_to_send))
             return False
         return True
 
@@ -86,7 +212,7 @@ class LogzioShipper(BaseModel):
         :return: session object
         """
         session = requests.Session()
-        retry = Retry(
+        retry = _TracedRetry(
             total=retries,
             read=retries,
             connect=retries,
@@ -102,12 +228,47 @@ class LogzioShipper(BaseModel):
 
         return session
 
-    def _reset_logs(self):
+    def _take_bulk(self):
+        """
+        Takes the logs out of the current bulk, to send them without holding the bulk lock.
+        :return: the logs of the bulk and the bulk size
+        """
+        with self._lock:
+            logs, bulk_size = self.curr_logs, self.curr_bulk_size
+            self.curr_logs = []
+            self.curr_bulk_size = 0
+        return logs, bulk_size
+
+    def _return_bulk(self, logs, bulk_size):
         """
-        Removes logs from the current queue and resets the bulk size.
+        Returns the logs of a bulk that failed to be sent to the start of the current bulk, to send them again with
+        the next bulk (same as a bulk that failed without being taken out). If the bulk would pass MAX_BODY_SIZE_BYTES,
+        the logs are dropped since the listener would reject it.
+        :param logs: the logs of the bulk
+        :param bulk_size: the bulk size
         """
-        self.curr_logs.clear()
-        self.curr_bulk_size = 0
+        with self._lock:
+            if self.curr_bulk_size + bulk_size > MAX_BODY_SIZE_BYTES:
+                logger.error(f"Dropping {len(logs)} logs that failed to be sent, as the bulk reached the max size of "
+                             f"{MAX_BODY_SIZE_BYTES} bytes.")
+                return
+            self.curr_logs[:0] = logs
+            self.curr_bulk_size += bulk_size
+
+    def _ship_bulk(self, logs, bulk_size):
+        """
+        Sends the given bulk without holding the bulk lock, and returns its logs to the current bulk if it failed.
+        :param logs: the logs of the bulk
+        :param bulk_size: the bulk size
+        """
+        if not logs:
+            return
+        with tracing.span("ship bulk", "listener", output=self._metrics_output):
+            try:
+                self._send_bulk(logs, bulk_size)
+            except Exception:
+                self._return_bulk(logs, bulk_size)
+                raise
 
     @staticmethod
     def _handle_exception(exp, msg, *args):
@@ -140,24 +301,42 @@ class LogzioShipper(BaseModel):
         """
         Sends logs from 'self.curr_logs' to logzio with retry mechanism.
         """
-        if not self.curr_logs:
-            return
+        self._ship_bulk(*self._take_bulk())
 
-        if self.curr_bulk_size == 0:
-            logger.info("bulk is 0 but logs are:", self.curr_logs)
+    def _send_bulk(self, logs, bulk_size):
+        """
+        Sends the given bulk.
+        :param logs: the logs of the bulk
+        :param bulk_size: the bulk size
+        """
+        if bulk_size == 0:
+            logger.info("bulk is 0 but logs are: %s", LogPreview(logs))
 
         try:
             headers = {"Content-Type": "application/json",
                        "Content-Encoding": "gzip",
                        "Logzio-Shipper": f"logzio-api-fetcher/{INT_VERSION}"}
-            compressed_data = gzip.compress(str.encode('\n'.join(self.curr_logs)))
-            response = self._get_request_retry_session().post(url=self.listener,
-                                                              data=compressed_data,
-                                                              headers=headers,
-                                                              timeout=CONNECTION_TIMEOUT_SECONDS)
-            response.raise_for_status()
-            logger.info(f"Successfully sent bulk of {self.curr_bulk_size} bytes to Logz.io.")
-            self._reset_logs()
+            data = b'\n'.join(logs)
+            compress_start_time = perf_counter()
+            with tracing.span("gzip", "listener", bytes=len(data)) as gzip_span:
+                compressed_data = gzip.compress(data)
+                gzip_span.set(compressed_bytes=len(compressed_data))
+            ship_start_time = perf_counter()
+            metrics.COMPRESSION_DURATION.observe(ship_start_time - compress_start_time, output=self._metrics_output)
+            try:
+                with tracing.span("listener post", "listener", logs=len(logs)) as post_span:
+                    response = self._get_request_retry_session().post(url=self.listener,
+                                                                      data=compressed_data,
+                                                                      headers=headers,
+                                                                      timeout=CONNECTION_TIMEOUT_SECONDS)
+                    post_span.set(status=response.status_code)
+                response.raise_for_status()
+            except Exception:
+                metrics.SHIP_DURATION.observe(perf_counter() - ship_start_time, output=self._metrics_output,
+                                              succeeded=False)
+                raise
+            self._record_ship_metrics(response, perf_counter() - ship_start_time, len(data), len(compressed_data))
+            logger.info("Successfully sent bulk of %s bytes to Logz.io.", bulk_size)
 
         except requests.ConnectionError as e:
             self._handle_exception(e, "Failed to establish connection to the listener, max retries {} reached. "
@@ -174,29 +353,59 @@ class LogzioShipper(BaseModel):
         except Exception as e:
             self._handle_exception(e, "Something went wrong. response: {}", e)
 
+    def _record_ship_metrics(self, response, duration, size, compressed_size):
+        """
+        Records the metrics of a bulk that was sent (if the metrics are enabled).
+        :param response: the listener response
+        :param duration: the request duration in seconds (including retries)
+        :param size: the bulk size in bytes
+        :param compressed_size: the compressed bulk size in bytes
+        """
+        if not metrics.is_enabled():
+            return
+        output = self._metrics_output
+        metrics.SHIP_DURATION.observe(duration, output=output, succeeded=True)
+        metrics.SHIPPED_BYTES.inc(size, output=output)
+        metrics.SHIPPED_COMPRESSED_BYTES.inc(compressed_size, output=output)
+        metrics.COMPRESSION_RATIO.set(size / compressed_size if compressed_size else 0, output=output)
+        retries = getattr(response.raw, "retries", None)
+        if retries and retries.history:
+            metrics.SHIP_RETRIES.inc(len(retries.history), output=output)
+
     def add_log_to_send(self, log, custom_fields=None):
         """
         Receives log to send, adds the given additional fields to it, validates it and adds it to a bulk.
+        Logs of type bytes are treated as raw JSON logs, and the additional fields are spliced into them without
+        serializing the log again.
         If the bulk reaches the MAX_BULK_SIZE_BYTES >> send data. Otherwise, add the logs to the bulk.
         :param log: log to add to the bulk
         :param custom_fields: custom fields to add to the log
         """
-        enriched_log = self._add_custom_fields_to_log(log, custom_fields)
+        enrich_start_time = perf_counter() if metrics.is_enabled() else None
+        enriched_log = None
+        if isinstance(log, bytes):
+            # Raw JSON log, passed as is with the custom fields spliced in
+            enriched_log = self._add_custom_fields_to_raw_log(log, custom_fields)
+            if enriched_log is None:
+                log = log.decode("utf-8", errors="replace")
+        if enriched_log is None:
+            enriched_log = self._add_custom_fields_to_log(log, custom_fields)
+        if enrich_start_time is not None:
+            metrics.ENRICH_SECONDS.inc(perf_counter() - enrich_start_time, output=self._metrics_output)
 
         if not self._is_valid_log(enriched_log, len(enriched_log)):
             return
 
-        # Bulk size was not reached yet
-        if not self.curr_bulk_size + len(enriched_log) > MAX_BULK_SIZE_BYTES:
-            self.curr_logs.append(enriched_log)
-            self.curr_bulk_size += len(enriched_log)
-            return
+        with self._lock:
+            # Bulk size was not reached yet
+            if not self.curr_bulk_size + len(enriched_log) > MAX_BULK_SIZE_BYTES:
+                self.curr_logs.append(enriched_log)
+                self.curr_bulk_size += len(enriched_log)
+                return
 
-        # Bulk size was reached >> send current logs and append the new logs to the new bulk
-        try:
-            self.send_to_logzio()
-        except Exception:
-            raise
+            # Bulk size was reached >> take the current logs out to send them, and start a new bulk with the new log
+            logs, bulk_size = self.curr_logs, self.curr_bulk_size
+            self.curr_logs = [enriched_log]
+            self.curr_bulk_size = len(enriched_log)
 
-        self.curr_logs.append(enriched_log)
-        self.curr_bulk_size = len(enriched_log)
+        self._ship_bulk(logs, bulk_size)
@@ -0,0 +1,64 @@
+import reprlib
+
+LOG_PREVIEW_MAX_LENGTH = 1000
+
+
+class _PreviewRepr(reprlib.Repr):
+    """
+    Repr with limited depth and items, which keeps the dictionaries order (the standard reprlib sorts them).
+    """
+    def __init__(self):
+        super().__init__()
+        self.maxlevel = 4
+        self.maxdict = 30
+        self.maxlist = 30
+        self.maxtuple = 30
+        self.maxstring = 300
+        self.maxother = 300
+
+    def repr_dict(self, x, level):
+        if not x:
+            return "{}"
+        if level <= 0:
+            return "{...}"
+        items = []
+        for i, (key, value) in enumerate(x.items()):
+            if i >= self.maxdict:
+                items.append("...")
+                break
+            items.append(f"{self.repr1(key, level - 1)}: {self.repr1(value, level - 1)}")
+        return "{" + ", ".join(items) + "}"
+
+
+_preview_repr = _PreviewRepr()
+
+
+class LogPreview:
+    """
+    Wraps a value (such as a response) to log, so it is formatted only if the log is emitted, and with a capped length.
+    Use with lazy logging: logger.debug("Response: %s", LogPreview(response))
+    :param value: the value to preview
+    :param max_length: the maximum length of the preview
+    """
+    __slots__ = ("value", "max_length")
+
+    def __init__(self, value, max_length=LOG_PREVIEW_MAX_LENGTH):
+        self.value = value
+        self.max_length = max_length
+
+    def __str__(self):
+        value = self.value
+        if isinstance(value, bytes):
+            value = value[:self.max_length + 1].decode("utf-8", errors="replace")
+        if isinstance(value, str):
+            if len(self.value) > self.max_length:
+                return f"{value[:self.max_length]}... ({len(self.value) - self.max_length} more characters)"
+            return value
+
+        # The items are limited first, so a large value is not formatted as a whole
+        preview = _preview_repr.repr(value)
+        if len(preview) > self.max_length:
+            return f"{preview[:self.max_length]}..."
+        return preview
+
+    __repr__ = __str__
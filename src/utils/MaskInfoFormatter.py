@@ -1,6 +1,11 @@
 import logging
 import re
 
+# Texts that come before the sensitive values, a log without any of them is not searched with the masking pattern
+SENSITIVE_PREFIXES = ("token=", "grant_type=", "client_secret=", "Bearer ", "Basic ", "TOKEN")
+MASKING_PATTERN = re.compile(
+    r'(token=|grant_type=|client_secret=|Bearer |Authorization[\"|\']: [\"|\']Basic |TOKEN[\"|\']: [\"|\'])[^&\n]{0,26}')
+
 
 class MaskInfoFormatter(logging.Formatter):
     """
@@ -8,8 +13,9 @@ class MaskInfoFormatter(logging.Formatter):
     """
     @staticmethod
     def _filter(org_log):
-        return re.sub(r'(token=|grant_type=|client_secret=|Bearer |Authorization[\"|\']: [\"|\']Basic |TOKEN[\"|\']: [\"|\'])[^&\n]{0,26}',
-                      r'\g<1>******', org_log)
+        if not any(prefix in org_log for prefix in SENSITIVE_PREFIXES):
+            return org_log
+        return MASKING_PATTERN.sub(r'\g<1>******', org_log)
 
     def format(self, record):
         original = super().format(record)
@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_CODEC_ENV = "JSON_CODEC"
+ORJSON_BACKEND = "orjson"
+STDLIB_BACKEND = "json"
+
+# orjson.JSONDecodeError is a subclass of it, so it catches the decoding errors of both backends
+JSONDecodeError = json.JSONDecodeError
+
+# Integers of 19 digits or more may be out of the 64 bit range that orjson decodes exactly
+LONG_NUMBER_PATTERN = re.compile(r"\d{19}")
+LONG_NUMBER_BYTES_PATTERN = re.compile(rb"\d{19}")
+
+logger = logging.getLogger(__name__)
+
+_use_orjson = False
+
+
+def set_backend(backend):
+    """
+    Sets the JSON backend to use.
+    :param backend: 'orjson' to use orjson (falls back to 'json' if it is not installed) or 'json' for the standard
+                    library module
+    """
+    global _use_orjson
+    if backend not in (ORJSON_BACKEND, STDLIB_BACKEND):
+        raise ValueError(f"Unsupported JSON codec '{backend}', expected '{ORJSON_BACKEND}' or '{STDLIB_BACKEND}'.")
+    if backend == ORJSON_BACKEND and orjson is None:
+        logger.debug("orjson is not installed, using the standard json module.")
+    _use_orjson = backend == ORJSON_BACKEND and orjson is not None
+
+
+def get_backend():
+    """
+    :return: the name of the JSON backend in use
+    """
+    return ORJSON_BACKEND if _use_orjson else STDLIB_BACKEND
+
+
+def loads(data):
+    """
+    Decodes the given JSON document.
+    The orjson backend decodes bytes directly, without decoding them to a string first. Documents with values orjson
+    does not decode exactly (integers above 64 bit, which it rejects or decodes as floats, depending on its version)
+    are decoded with the standard library module.
+    :param data: the JSON document (str or bytes)
+    :return: the decoded object
+    """
+    if _use_orjson:
+        pattern = LONG_NUMBER_BYTES_PATTERN if isinstance(data, (bytes, bytearray)) else LONG_NUMBER_PATTERN
+        if not pattern.search(data):
+            return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj, sort_keys=False):
+    """
+    Encodes the given object to a UTF-8 JSON document.
+    :param obj: the object to encode
+    :param sort_keys: True to sort the object keys, False otherwise
+    :return: the JSON document bytes
+    """
+    if _use_orjson:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else None)
+        except TypeError:
+            # Values orjson does not support (such as integers above 64 bit or non string keys)
+            pass
+    return json.dumps(obj, sort_keys=sort_keys, ensure_ascii=False).encode("utf-8", errors="replace")
+
+
+def dumps(obj, sort_keys=False):
+    """
+    Encodes the given object to an ASCII JSON string, same as 'json.dumps', to keep it safe to use in request bodies
+    and URLs.
+    :param obj: the object to encode
+    :param sort_keys: True to sort the object keys, False otherwise
+    :return: the JSON document string
+    """
+    if _use_orjson:
+        try:
+            encoded = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else None)
+            if encoded.isascii():
+                return encoded.decode()
+        except TypeError:
+            pass
+    return json.dumps(obj, sort_keys=sort_keys)
+
+
+try:
+    set_backend(os.getenv(JSON_CODEC_ENV, STDLIB_BACKEND))
+except ValueError as e:
+    logger.error(f"{e} Using the default JSON codec.")
+    set_backend(STDLIB_BACKEND)
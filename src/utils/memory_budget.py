@@ -0,0 +1,115 @@
+import logging
+import threading
+from time import time
+
+from src.utils import metrics
+
+DEFAULT_MAX_WAIT_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+_budget = None
+
+
+class MemoryBudget:
+    """
+    Global budget of the bytes of the fetched data that the inputs hold until it is shipped, shared by all the inputs
+    of the process with a fair share per running input.
+    Every input records the size of the pages it fetched, and checks for room before requesting its next page. When
+    the budget is exhausted, an input that holds up to its fair share (the budget divided by the running inputs) waits
+    for the other inputs to ship their data, and an input that holds more than its fair share stops fetching pages for
+    this cycle.
+    The data of an input is released when its cycle ends (after it was shipped).
+    :param max_bytes: the budget in bytes
+    :param max_wait_seconds: the max seconds an input waits for room before it stops fetching pages for this cycle
+    """
+    def __init__(self, max_bytes, max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS):
+        if max_bytes <= 0:
+            raise ValueError(f"The memory budget should be positive, got {max_bytes} bytes.")
+        self.max_bytes = max_bytes
+        self.max_wait_seconds = max_wait_seconds
+        self.used_bytes = 0
+        self._usage = {}
+        self._condition = threading.Condition()
+
+    def get_fair_share(self):
+        """
+        :return: the bytes every running input may hold when the budget is exhausted
+        """
+        return self.max_bytes / max(len(self._usage), 1)
+
+    def get_usage(self, owner):
+        """
+        :param owner: the input name
+        :return: the bytes the input holds
+        """
+        return self._usage.get(owner, 0)
+
+    def start(self, owner):
+        """
+        Registers a running input cycle, to count it in the fair share.
+        :param owner: the input name
+        """
+        with self._condition:
+            self._usage.setdefault(owner, 0)
+
+    def record(self, owner, size):
+        """
+        Records data that the input fetched and holds until it is shipped.
+        :param owner: the input name
+        :param size: the data size in bytes
+        """
+        with self._condition:
+            self._usage[owner] = self._usage.get(owner, 0) + size
+            self.used_bytes += size
+
+    def release(self, owner):
+        """
+        Releases all the data of the input (once its cycle ended), and wakes up the inputs that wait for room.
+        :param owner: the input name
+        """
+        with self._condition:
+            self.used_bytes -= self._usage.pop(owner, 0)
+            self._condition.notify_all()
+
+    def wait_for_room(self, owner):
+        """
+        Waits until the budget has room for the input to fetch more data.
+        :param owner: the input name
+        :return: True if the input may fetch more data, False if it should stop fetching for this cycle (it holds more
+                 than its fair share, or there was no room for max_wait_seconds).
+        """
+        deadline = time() + self.max_wait_seconds
+        with self._condition:
+            while self.used_bytes >= self.max_bytes:
+                usage = self._usage.get(owner, 0)
+                if usage == 0:
+                    # An input that holds nothing can always fetch, so every input makes progress
+                    return True
+                if usage > self.get_fair_share() or usage == self.used_bytes:
+                    # Waiting would not help, the input has to ship its data first
+                    return False
+                remaining = deadline - time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(timeout=remaining)
+        return True
+
+
+def set_budget(budget):
+    """
+    Sets the global memory budget of the process.
+    :param budget: MemoryBudget instance, or None for no budget
+    """
+    global _budget
+    _budget = budget
+    if budget:
+        logger.info(f"Limiting the fetched data held by the inputs to {budget.max_bytes / 1024 / 1024:.0f} MB.")
+        metrics.MEMORY_BUDGET_USED_BYTES.set(lambda: budget.used_bytes)
+
+
+def get_budget():
+    """
+    :return: the global MemoryBudget instance, or None if there is no budget
+    """
+    return _budget
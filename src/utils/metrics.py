@@ -0,0 +1,316 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+from time import time
+
+METRICS_PREFIX = "logzio_api_fetcher_"
+METRICS_PATH = "/metrics"
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DEFAULT_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_metrics = []
+
+
+def is_enabled():
+    """
+    :return: True if the metrics are collected (the metrics server was started), False otherwise
+    """
+    return _enabled
+
+
+def set_enabled(enabled):
+    """
+    Turns the metrics collection on or off. The metrics are not collected by default, so they add no overhead unless
+    the metrics server is started.
+    :param enabled: True to collect the metrics, False otherwise
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=None):
+    """
+    :param label_names: the label names
+    :param label_values: the label values, in the label names order
+    :param extra: Optional, tuple of an extra label name and value (such as the histogram 'le')
+    :return: the labels in Prometheus text format (such as '{input="a"}'), or an empty string if there are no labels
+    """
+    labels = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    Base class of a metric with labels, its values are kept per label values.
+    :param name: the metric name (without METRICS_PREFIX)
+    :param description: the metric help text
+    :param label_names: the names of the metric labels
+    """
+    metric_type = None
+
+    def __init__(self, name, description, label_names=()):
+        self.name = METRICS_PREFIX + name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _get_key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def get(self, **labels):
+        """
+        :param labels: the label values
+        :return: the value of the given labels (or None if it was not set)
+        """
+        return self._values.get(self._get_key(labels))
+
+    def remove(self, **labels):
+        """
+        Removes the value of the given labels (such as of an input that was removed from the config).
+        :param labels: the label values
+        """
+        with self._lock:
+            self._values.pop(self._get_key(labels), None)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _render_samples(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}"
+                    for key, value in self._values.items()]
+
+    def render(self):
+        """
+        :return: the metric lines in Prometheus text format
+        """
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.metric_type}"] + \
+            self._render_samples()
+
+
+class Counter(_Metric):
+    """
+    Metric that only increases, such as the amount of requests.
+    """
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        """
+        Increases the counter of the given labels, if the metrics are enabled.
+        :param amount: the amount to increase by
+        :param labels: the label values
+        """
+        if not _enabled:
+            return
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Metric that can go up and down, such as the size of a queue. A value can be a function that is called on render,
+    such as for the time since an event.
+    """
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        """
+        Sets the gauge of the given labels, if the metrics are enabled.
+        :param value: the value, or a function without arguments that returns the value
+        :param labels: the label values
+        """
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[self._get_key(labels)] = value
+
+    def unset(self, value, **labels):
+        """
+        Removes the value of the given labels only if it is still the given value (such as the function of an output
+        that was replaced, which should not remove the function of the output that replaced it).
+        :param value: the value (or function) that was set
+        :param labels: the label values
+        """
+        key = self._get_key(labels)
+        with self._lock:
+            if self._values.get(key) is value:
+                del self._values[key]
+
+    def _render_samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        samples = []
+        for key, value in values:
+            if callable(value):
+                value = value()
+                if value is None:
+                    # The function has no value to report (such as of an object that no longer exists)
+                    continue
+            samples.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}")
+        return samples
+
+
+class Histogram(_Metric):
+    """
+    Metric that counts observations in buckets, such as requests latency.
+    :param buckets: the upper bounds of the buckets, in ascending order
+    """
+    metric_type = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        """
+        Adds an observation of the given labels, if the metrics are enabled.
+        :param value: the observed value
+        :param labels: the label values
+        """
+        if not _enabled:
+            return
+        key = self._get_key(labels)
+        with self._lock:
+            bucket_counts, total = self._values.get(key) or ([0] * len(self.buckets), 0)
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    bucket_counts[i] += 1
+                    break
+            self._values[key] = (bucket_counts, total + value)
+
+    def get(self, **labels):
+        """
+        :param labels: the label values
+        :return: tuple of the amount and sum of the observations of the given labels (or None if there are none)
+        """
+        value = self._values.get(self._get_key(labels))
+        return (sum(value[0]), value[1]) if value else None
+
+    def _render_samples(self):
+        lines = []
+        with self._lock:
+            for key, (bucket_counts, total) in self._values.items():
+                cumulative_count = 0
+                for upper_bound, count in zip(self.buckets, bucket_counts):
+                    cumulative_count += count
+                    lines.append(f"{self.name}_bucket"
+                                 f"{_format_labels(self.label_names, key, ('le', _format_number(upper_bound)))} "
+                                 f"{cumulative_count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_number(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative_count}")
+        return lines
+
+
+def render():
+    """
+    :return: all the metrics in Prometheus text format
+    """
+    return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
+
+
+def clear():
+    """
+    Clears the values of all the metrics.
+    """
+    for metric in _metrics:
+        metric.clear()
+
+
+# Inputs metrics
+REQUEST_DURATION = Histogram("request_duration_seconds", "Duration of the requests to the source API.", ["input"])
+REQUESTS = Counter("requests_total", "Requests to the source API by the response status ('error' if no response).",
+                   ["input", "status"])
+RATE_LIMITED_REQUESTS = Counter("rate_limited_requests_total", "Requests to the source API that got 429 (Too Many "
+                                                               "Requests).", ["input"])
+FETCHED_BYTES = Counter("fetched_bytes_total", "Bytes received from the source API.", ["input"])
+PAGES_PER_CYCLE = Histogram("pages_per_cycle", "Pages fetched in a cycle (of the inputs with pagination).", ["input"],
+                            buckets=DEFAULT_COUNT_BUCKETS)
+FETCHED_RECORDS = Counter("fetched_records_total", "Records fetched from the source API (after dedup and processing).",
+                          ["input"])
+DROPPED_RECORDS = Counter("dropped_records_total", "Records dropped before shipping, by the reason they were dropped.",
+                          ["input", "reason"])
+CYCLE_DURATION = Histogram("cycle_duration_seconds", "Duration of the input cycles (fetch and ship).",
+                           ["input", "succeeded"])
+LAST_SUCCESS_TIMESTAMP = Gauge("last_success_timestamp_seconds", "Unix time of the last successful cycle end.",
+                               ["input"])
+INGESTION_LAG = Gauge("ingestion_lag_seconds", "Seconds since the last successful cycle end.", ["input"])
+
+# Outputs metrics
+ENRICH_SECONDS = Counter("enrich_seconds_total", "Seconds spent adding the custom fields to the logs.", ["output"])
+COMPRESSION_DURATION = Histogram("compression_duration_seconds", "Duration of the bulks gzip compression.", ["output"])
+COMPRESSION_RATIO = Gauge("compression_ratio", "Uncompressed to compressed size ratio of the last bulk.", ["output"])
+SHIPPED_BYTES = Counter("shipped_bytes_total", "Uncompressed bytes of the bulks sent to Logz.io.", ["output"])
+SHIPPED_COMPRESSED_BYTES = Counter("shipped_compressed_bytes_total", "Compressed bytes of the bulks sent to Logz.io.",
+                                   ["output"])
+SHIP_DURATION = Histogram("ship_duration_seconds", "Duration of the bulks requests to the Logz.io listener "
+                                                   "(including retries).", ["output", "succeeded"])
+SHIP_RETRIES = Counter("ship_retries_total", "Retries of the bulks requests to the Logz.io listener.", ["output"])
+BULK_PENDING_LOGS = Gauge("bulk_pending_logs", "Logs waiting in the current bulk.", ["output", "output_index"])
+BULK_PENDING_BYTES = Gauge("bulk_pending_bytes", "Bytes waiting in the current bulk.", ["output", "output_index"])
+
+# Process metrics
+MEMORY_BUDGET_USED_BYTES = Gauge("memory_budget_used_bytes", "Bytes of fetched data held by the inputs, of the memory "
+                                                             "budget.")
+
+
+def set_last_success(input_name):
+    """
+    Sets the last success time and the ingestion lag of the given input to now.
+    :param input_name: the input name
+    """
+    now = time()
+    LAST_SUCCESS_TIMESTAMP.set(now, input=input_name)
+    INGESTION_LAG.set(lambda: time() - now, input=input_name)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the metrics in Prometheus text format.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in (METRICS_PATH, "/"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """
+    Enables the metrics collection and serves them in Prometheus text format on the given port, in a background thread.
+    :param port: the port to listen on
+    :param host: the address to listen on (default: all addresses)
+    :return: the server
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    set_enabled(True)
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}{METRICS_PATH}")
+    return server
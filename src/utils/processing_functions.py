@@ -1,7 +1,9 @@
-import json
 import logging
 import re
 
+from src.utils import json_codec
+from src.utils.LogPreview import LogPreview
+
 # EXPECTED_
 VARS_PATTERN = re.compile(r"\{res\.(.*?)\}")
 EXPECTED_ARRAY_PREFIX = "["
@@ -20,7 +22,7 @@ def extract_vars(item):
     if not item:
         return []
     if not isinstance(item, str):
-        item = json.dumps(item)
+        item = json_codec.dumps(item)
     return re.findall(VARS_PATTERN, item)
 
 
@@ -54,8 +56,7 @@ def _get_key_from_nested_array(next_item, key):
     try:
         next_item = next_item[int(key)]
     except (IndexError, ValueError):
-        logger.warning(f"Failed to find the next key: '{key}' nested in {next_item}")
-        logger.warning("Failed to find the next key: '%s' nested in %s", key, next_item)
+        logger.warning("Failed to find the next key: '%s' nested in %s", key, LogPreview(next_item))
         next_item = None
     return next_item
 
@@ -77,15 +78,15 @@ def _get_key_from_nested(next_item, key):
 
         # The key does not exist in the dictionary
         if next_item is _SENTINEL:
-            logger.warning(f"Key '{key}' does not exists in: {original}")
+            logger.warning("Key '%s' does not exists in: %s", key, LogPreview(original))
             next_item = None
 
     except AttributeError:
         # Check if nested value is in a flattened object and extract it
         try:
-            next_item = _get_key_from_nested(json.loads(next_item), key)
-        except json.decoder.JSONDecodeError:
-            logger.debug(f"Failed to find '{key}' in response due to error.")
+            next_item = _get_key_from_nested(json_codec.loads(next_item), key)
+        except (json_codec.JSONDecodeError, TypeError):
+            logger.debug("Failed to find '%s' in response due to error.", key)
             next_item = None
     return next_item
 
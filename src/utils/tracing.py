@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+from time import time_ns
+
+logger = logging.getLogger(__name__)
+
+_writer = None
+
+
+class _Span:
+    """
+    A timed span of work, written to the trace file as a complete event when it ends.
+    :param name: the span name
+    :param category: the span category (such as 'source' for the source API requests)
+    :param args: the span arguments to show in the trace viewer
+    """
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start_ns = None
+
+    def set(self, **args):
+        """
+        Adds arguments to the span (such as the response status).
+        :param args: the span arguments
+        """
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start_ns = time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc_value}"
+        writer = _writer
+        if writer:
+            writer.write_event({"name": self.name, "cat": self.category, "ph": "X", "ts": self.start_ns / 1000,
+                                "dur": (time_ns() - self.start_ns) / 1000, "args": self.args})
+        return False
+
+
+class _NullSpan:
+    """
+    Span that does nothing, used when tracing is off.
+    """
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _TraceWriter:
+    """
+    Writes the trace events to a file in the Chrome trace JSON array format, which Perfetto and chrome://tracing read
+    also without the closing bracket (so the file can be read while it is being written).
+    :param path: the trace file path
+    """
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._named_threads = set()
+        self._file = open(path, "w")
+        self._file.write("[\n")
+        self._write_metadata("process_name", 0, f"logzio-api-fetcher ({self.pid})")
+
+    def _write_metadata(self, name, tid, value):
+        self._file.write(json.dumps({"name": name, "ph": "M", "pid": self.pid, "tid": tid,
+                                     "args": {"name": value}}) + ",\n")
+
+    def write_event(self, event):
+        """
+        Writes the given event of the current thread.
+        :param event: the trace event
+        """
+        tid = threading.get_ident()
+        event.update(pid=self.pid, tid=tid)
+        line = json.dumps(event, default=str) + ",\n"
+        with self._lock:
+            if self._file.closed:
+                return
+            if tid not in self._named_threads:
+                self._named_threads.add(tid)
+                self._write_metadata("thread_name", tid, threading.current_thread().name)
+            self._file.write(line)
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(json.dumps({"name": "trace end", "ph": "i", "s": "g", "ts": time_ns() / 1000,
+                                             "pid": self.pid, "tid": 0}) + "\n]\n")
+                self._file.close()
+
+
+def is_enabled():
+    """
+    :return: True if the spans are written to a trace file, False otherwise
+    """
+    return _writer is not None
+
+
+def start_tracing(path):
+    """
+    Starts writing the spans to the given trace file (replaces the file if it exists).
+    :param path: the trace file path
+    """
+    global _writer
+    stop_tracing()
+    _writer = _TraceWriter(path)
+    logger.info(f"Writing trace spans to {path}")
+
+
+def stop_tracing():
+    """
+    Stops writing the spans, and closes the trace file.
+    """
+    global _writer
+    writer, _writer = _writer, None
+    if writer:
+        writer.close()
+
+
+def flush():
+    """
+    Flushes the written spans to the trace file (such as at the end of every cycle).
+    """
+    writer = _writer
+    if writer:
+        writer.flush()
+
+
+def span(name, category="fetcher", **args):
+    """
+    Creates a span to time a block of work with ('with tracing.span(...) as span:'). When tracing is off, returns a
+    span that does nothing.
+    :param name: the span name
+    :param category: the span category
+    :param args: the span arguments to show in the trace viewer
+    :return: the span context manager
+    """
+    if _writer is None:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def instant(name, category="fetcher", **args):
+    """
+    Writes an instant event (such as a retry), if tracing is on.
+    :param name: the event name
+    :param category: the event category
+    :param args: the event arguments to show in the trace viewer
+    """
+    writer = _writer
+    if writer:
+        writer.write_event({"name": name, "cat": category, "ph": "i", "s": "t", "ts": time_ns() / 1000, "args": args})
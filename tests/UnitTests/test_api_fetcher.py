@@ -1,10 +1,18 @@
+from datetime import datetime, timedelta, UTC
+import gzip
+import json
 from pydantic import ValidationError
+import requests
 import responses
+from responses import matchers
 import unittest
+from unittest.mock import patch
 
 from src.apis.general.Api import ApiFetcher, ReqMethod
+from src.apis.general.BackfillPlanner import BackfillPlanner
 from src.apis.general.PaginationSettings import PaginationSettings, PaginationType
 from src.apis.general.StopPaginationSettings import StopPaginationSettings, StopCondition
+from src.utils import json_codec
 
 
 class TestApiFetcher(unittest.TestCase):
@@ -92,6 +100,41 @@ class TestApiFetcher(unittest.TestCase):
         # Validate that next_url updates the url for next request as expected
         self.assertEqual("http://some/api/abc/1/hello", a.url)
 
+    @responses.activate
+    def test_send_compressed_request(self):
+        success_res_body = {"field": "abc", "arr": [1, 2]}
+
+        # Mock gzip compressed response, which is sent only if the request accepts gzip
+        responses.add(responses.GET, "http://some/api",
+                      body=gzip.compress(json.dumps(success_res_body).encode()),
+                      headers={"Content-Encoding": "gzip"},
+                      match=[matchers.header_matcher({"Accept-Encoding": "gzip"})],
+                      status=200)
+
+        a = ApiFetcher(url="http://some/api", accept_encoding=["GZIP", "compress"])
+
+        # Unsupported encodings are not requested
+        self.assertEqual(a.get_request_headers()["Accept-Encoding"], "gzip")
+        self.assertEqual([success_res_body], a.send_request())
+
+        # The encoding is added to every request, so it is kept when the headers are replaced (such as by pagination)
+        a.headers = {"X-Page": "2"}
+        self.assertEqual(a.get_request_headers(), {"X-Page": "2", "Accept-Encoding": "gzip"})
+        self.assertEqual([success_res_body], a.send_request())
+
+    @responses.activate
+    def test_send_request_with_long_integers(self):
+        org_backend = json_codec.get_backend()
+        self.addCleanup(json_codec.set_backend, org_backend)
+        responses.add(responses.GET, "http://some/api", body='{"id": 123456789012345678901234567890, "n": 1}',
+                      status=200)
+
+        # Integers above 64 bit are decoded exactly with every JSON backend
+        for backend in (json_codec.ORJSON_BACKEND, json_codec.STDLIB_BACKEND):
+            json_codec.set_backend(backend)
+            self.assertEqual(ApiFetcher(url="http://some/api").send_request(),
+                             [{"id": 123456789012345678901234567890, "n": 1}])
+
     @responses.activate
     def test_send_bad_request(self):
         # Mock response from some API
@@ -165,3 +208,110 @@ class TestApiFetcher(unittest.TestCase):
         # Ensure the final logs list contains only the necessary data in the correct format
         self.assertEqual(result, [{"msg": "random log1"}, {"msg": "random log2"}, {"msg": "random log3"},
                                   {"msg": "random log4"}])
+
+    @responses.activate
+    def test_request_timeout(self):
+        responses.add(responses.GET, "http://slow/api", body=requests.exceptions.ReadTimeout())
+
+        a = ApiFetcher(url="http://slow/api", connect_timeout=2, read_timeout=5)
+        self.assertEqual(a.get_timeout(), (2, 5))
+
+        with self.assertLogs("src.apis.general.Api", level='ERROR') as log:
+            self.assertEqual(a.send_request(), [])
+        self.assertIn("ERROR:src.apis.general.Api:Timed out waiting for the http://slow/api API (connect timeout: 2.0s, "
+                      "read timeout: 5.0s).", log.output)
+        self.assertTrue(a.request_failed)
+
+    @responses.activate
+    def test_pagination_stop_at_cycle_deadline(self):
+        responses.add(responses.GET, "https://some/api", json={"result": [{"msg": "log1"}], "page": 1}, status=200)
+        responses.add(responses.GET, "https://some/api?page=2", json={"result": [{"msg": "log2"}], "page": 2},
+                      status=200)
+
+        a = ApiFetcher(url="https://some/api",
+                       next_url="https://some/api?since={res.result.[0].msg}",
+                       response_data_path="result",
+                       cycle_deadline_seconds=10,
+                       pagination=PaginationSettings(type=PaginationType("url"),
+                                                     url_format="?page={res.page+1}",
+                                                     update_first_url=True,
+                                                     stop_indication=StopPaginationSettings(field="result",
+                                                                                            condition=StopCondition.EMPTY)))
+
+        # The deadline passes after the first pagination call
+        with patch("src.apis.general.Api.time", side_effect=[100, 105, 111]):
+            result = a.send_request()
+
+        # The pagination stopped and the cursor was not updated, the next page is kept to continue from
+        self.assertEqual(result, [{"msg": "log1"}, {"msg": "log2"}])
+        self.assertTrue(a.cycle_deadline_reached)
+        self.assertEqual(a.url, "https://some/api")
+        self.assertEqual(a.pagination_resume["page"], "https://some/api?page=3")
+
+        # The next run continues from the next page (the fetched pages are not requested again), and moves the cursor
+        # per the first response of the pagination once it completes
+        responses.add(responses.GET, "https://some/api?page=3", json={"result": [{"msg": "log3"}], "page": 3},
+                      status=200)
+        responses.add(responses.GET, "https://some/api?page=4", json={"result": [], "page": 4}, status=200)
+        with patch("src.apis.general.Api.time", side_effect=[200, 201, 202]):
+            result = a.send_request()
+
+        self.assertEqual(result, [{"msg": "log3"}])
+        self.assertEqual([call.request.url for call in responses.calls[2:]],
+                         ["https://some/api?page=3", "https://some/api?page=4"])
+        self.assertFalse(a.cycle_deadline_reached)
+        self.assertIsNone(a.pagination_resume)
+        self.assertEqual(a.url, "https://some/api?since=log1")
+
+    @responses.activate
+    def test_resume_pagination_after_failure(self):
+        responses.add(responses.GET, "https://some/api?cursor=b", status=500)
+
+        a = ApiFetcher(url="https://some/api",
+                       response_data_path="result",
+                       pagination=PaginationSettings(type=PaginationType("url"),
+                                                     url_format="https://some/api?cursor={res.next}",
+                                                     stop_indication=StopPaginationSettings(field="next",
+                                                                                            condition=StopCondition.EMPTY)))
+        a.pagination_resume = {"page": "https://some/api?cursor=b", "call_count": 1, "next_url": None,
+                               "next_body": None}
+
+        # The page to continue from failed, it is requested again in the next run
+        self.assertEqual(a.send_request(), [])
+        self.assertTrue(a.request_failed)
+        self.assertEqual(a.pagination_resume["page"], "https://some/api?cursor=b")
+        self.assertEqual(a.url, "https://some/api")
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_backfill_slice_continues_after_failed_page(self):
+        responses.add(responses.GET, "https://some/slice", json={"data": [{"page": 1}], "next": "2"})
+        responses.add(responses.GET, "https://some/page/2", status=500)
+        responses.add(responses.GET, "https://some/page/2", json={"data": [{"page": 2}], "next": ""})
+        completed = []
+
+        def create_slice_request(start, end):
+            return ApiFetcher(name="backfill", url="https://some/slice", response_data_path="data",
+                              pagination=PaginationSettings(type="url", url_format="https://some/page/{res.next}",
+                                                            stop_indication={"field": "next", "condition": "empty"}))
+
+        planner = BackfillPlanner("backfill", datetime.now(UTC) - timedelta(days=1), 1)
+        self.assertEqual(planner.run(create_slice_request, completed.append), [{"page": 1}])
+
+        # The slice is not completed, and continues from the failed page in the next run
+        self.assertFalse(planner.done)
+        self.assertEqual(completed, [])
+        self.assertEqual(planner.run(create_slice_request, completed.append), [{"page": 2}])
+        self.assertEqual([call.request.url for call in responses.calls],
+                         ["https://some/slice", "https://some/page/2", "https://some/page/2"])
+        self.assertTrue(planner.done)
+        self.assertEqual(completed, [planner.end])
+
+    def test_split_backfill_time_range(self):
+        start = datetime(2024, 1, 1, tzinfo=UTC)
+        end = datetime(2024, 1, 2, tzinfo=UTC)
+        slices = BackfillPlanner.split_time_range(start, end, 3)
+
+        self.assertEqual(slices, [(start, start + timedelta(hours=8)),
+                                  (start + timedelta(hours=8), start + timedelta(hours=16)),
+                                  (start + timedelta(hours=16), end)])
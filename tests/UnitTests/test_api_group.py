@@ -0,0 +1,79 @@
+from os.path import abspath, dirname
+import responses
+import unittest
+
+from src.apis.cloudflare.Cloudflare import Cloudflare
+from src.apis.general.ApiGroup import ApiGroup
+from src.apis.oauth.OAuth import OAuthApi
+from src.config.ConfigReader import ConfigReader
+from src.manager.TaskManager import TaskManager
+
+
+curr_path = abspath(dirname(dirname(__file__)))
+
+
+class TestApiGroup(unittest.TestCase):
+    """
+    Test cases for the fan-out API group
+    """
+
+    def test_invalid_setup(self):
+        with self.assertRaises(ValueError):
+            ApiGroup(OAuthApi, fan_out=["tenant"])
+        with self.assertRaises(ValueError):
+            ApiGroup(OAuthApi, fan_out={"tenant": []})
+
+    def test_fan_out_config(self):
+        apis = ConfigReader(f"{curr_path}/testConfigs/fan_out_conf.yaml").api_instances
+
+        self.assertEqual(len(apis), 1)
+        group = apis[0]
+        self.assertIsInstance(group, ApiGroup)
+        self.assertEqual(group.name, "cloudflare accounts")
+        self.assertEqual(group.scrape_interval_minutes, 1)
+        self.assertEqual(len(group.outputs), 1)
+
+        for api, account_id in zip(group.apis, ["acc1", "acc2", "acc3"]):
+            self.assertIsInstance(api, Cloudflare)
+            self.assertEqual(api.name, f"cloudflare accounts ({account_id})")
+            self.assertEqual(api.cloudflare_account_id, account_id)
+            self.assertIn(f"/accounts/{account_id}/alerting", api.url)
+            self.assertEqual(api.additional_fields.get("type"), f"cloudflare-{account_id}")
+            self.assertIs(api.outputs, group.outputs)
+            self.assertIs(api._session, group.session)
+
+    def test_multiple_params(self):
+        group = ApiGroup(OAuthApi, fan_out={"tenant": ["t1", "t2"], "region": ["eu", "us"]},
+                         token_request={"url": "http://my-token-url/{tenant}"},
+                         data_request={"url": "http://my-data-url/{tenant}/{region}"})
+
+        self.assertEqual([api.data_request.url for api in group.apis],
+                         ["http://my-data-url/t1/eu", "http://my-data-url/t1/us",
+                          "http://my-data-url/t2/eu", "http://my-data-url/t2/us"])
+
+    def test_unnamed_group_targets_names(self):
+        group = ApiGroup(Cloudflare, fan_out={"cloudflare_account_id": ["acc1", "acc2", "acc1"]},
+                         cloudflare_bearer_token="b3ar3r-t0k3n",
+                         url="https://api.cloudflare.com/client/v4/accounts/{cloudflare_account_id}/alerting/v3/history")
+
+        # The targets of a group without a name get unique names from the group URL and their values
+        self.assertEqual([api.name for api in group.apis],
+                         [f"{group.name} (acc1)", f"{group.name} (acc2)", f"{group.name} (acc1) #2"])
+
+    @responses.activate
+    def test_shared_token(self):
+        token_call = responses.add(responses.POST, "http://my-token-url",
+                                   json={"access_token": "shared-token", "expires_in": 3600})
+        responses.add(responses.GET, "http://my-data-url/t1", json=[{"log": 1}])
+        responses.add(responses.GET, "http://my-data-url/t2", json=[{"log": 2}])
+
+        group = ApiGroup(OAuthApi, name="tenants", fan_out={"tenant": ["t1", "t2"]},
+                         token_request={"url": "http://my-token-url", "method": "POST"},
+                         data_request={"url": "http://my-data-url/{tenant}"})
+        stats = []
+        TaskManager(stats_callback=lambda *args: stats.append(args[:2]))._run_api_task(group)
+
+        self.assertEqual(token_call.call_count, 1)
+        self.assertEqual(stats, [("tenants (t1)", 1), ("tenants (t2)", 1)])
+        for api in group.apis:
+            self.assertEqual(api.data_request.headers["Authorization"], "Bearer shared-token")
@@ -7,6 +7,7 @@ import unittest
 
 from src.apis.azure.AzureApi import AzureApi
 from src.apis.azure.AzureGraph import AzureGraph
+from src.apis.azure.AzureGraphBatch import AzureGraphBatch
 from src.apis.azure.AzureMailReports import AzureMailReports
 
 
@@ -166,3 +167,170 @@ class TestAzureApi(unittest.TestCase):
             self.assertEqual(result, data_res_body.get("d").get("results"))
             self.assertEqual(a.data_request.url,
                              "https://reports.office365.com/ecp/reportingwebservice/reporting.svc/MessageTrace?$filter=StartDate eq datetime'2024-05-30T13:08:54Z' and EndDate eq datetime'NOW_DATE'&$format=json")
+
+    @responses.activate
+    def test_azure_graph_delta_query(self):
+        token_res_body = {"token_type": "Bearer", "expires_in": 3599,
+                          "access_token": "eyJ0eXAiOiJKV1QiLCJhbGciOiJSUzI1NiIsIng1dCI6Ik1uQ19WWmNBVGZNNXBP"}
+        delta_url = "https://graph.microsoft.com/v1.0/users/delta"
+        next_link = "https://graph.microsoft.com/v1.0/users/delta?$skiptoken=page2"
+        delta_link = "https://graph.microsoft.com/v1.0/users/delta?$deltatoken=abc123"
+
+        # token response
+        responses.add(responses.POST,
+                      "https://login.microsoftonline.com/some-tenant/oauth2/v2.0/token",
+                      json=token_res_body,
+                      status=200)
+
+        # First page, second page with the delta link and the changes after it
+        responses.add(responses.GET, delta_url,
+                      json={"@odata.nextLink": next_link, "value": [{"id": "1"}, {"id": "2"}]},
+                      status=200)
+        responses.add(responses.GET, next_link,
+                      json={"@odata.deltaLink": delta_link, "value": [{"id": "3"}]},
+                      status=200)
+        responses.add(responses.GET, delta_link,
+                      json={"@odata.deltaLink": f"{delta_link}2", "value": [{"id": "2", "displayName": "new"}]},
+                      status=200)
+
+        a = AzureGraph(azure_ad_tenant_id="some-tenant",
+                       azure_ad_client_id="some-client",
+                       azure_ad_secret_value="some-secret",
+                       delta_query=True,
+                       data_request={"url": delta_url})
+
+        # No date filter should be added in delta query mode
+        self.assertEqual(a.data_request.url, delta_url)
+
+        # First run follows the next links until the delta link
+        self.assertEqual(a.send_request(), [{"id": "1"}, {"id": "2"}, {"id": "3"}])
+        self.assertEqual(a.data_request.url, delta_link)
+
+        # Next run only gets the changes since the delta link
+        self.assertEqual(a.send_request(), [{"id": "2", "displayName": "new"}])
+        self.assertEqual(a.data_request.url, f"{delta_link}2")
+
+    @responses.activate
+    def test_azure_graph_delta_query_resumes_failed_page(self):
+        token_res_body = {"token_type": "Bearer", "expires_in": 3599, "access_token": "some-token"}
+        delta_url = "https://graph.microsoft.com/v1.0/groups/delta"
+        next_link = "https://graph.microsoft.com/v1.0/groups/delta?$skiptoken=page2"
+
+        responses.add(responses.POST,
+                      "https://login.microsoftonline.com/some-tenant/oauth2/v2.0/token",
+                      json=token_res_body,
+                      status=200)
+        responses.add(responses.GET, delta_url,
+                      json={"@odata.nextLink": next_link, "value": [{"id": "1"}]},
+                      status=200)
+        responses.add(responses.GET, next_link, status=503)
+
+        a = AzureGraph(azure_ad_tenant_id="some-tenant",
+                       azure_ad_client_id="some-client",
+                       azure_ad_secret_value="some-secret",
+                       delta_query=True,
+                       data_request={"url": delta_url})
+
+        self.assertEqual(a.send_request(), [{"id": "1"}])
+
+        # The failed page should be requested again in the next run
+        self.assertEqual(a.data_request.url, next_link)
+
+    @responses.activate
+    def test_azure_graph_batch_send_request(self):
+        token_res_body = {"token_type": "Bearer", "expires_in": 3599, "access_token": "some-token"}
+        sign_ins_next_link = "https://graph.microsoft.com/v1.0/auditLogs/signIns?$skiptoken=page2"
+        batch_bodies = []
+
+        def batch_callback(request):
+            body = json.loads(request.body)
+            batch_bodies.append(body)
+            res = []
+            for sub_req in body.get("requests"):
+                if sub_req.get("url").startswith("/auditLogs/signIns?$filter"):
+                    res.append({"id": sub_req.get("id"), "status": 200,
+                                "body": {"@odata.nextLink": sign_ins_next_link,
+                                         "value": [{"id": "a", "createdDateTime": "2024-05-28T13:08:54Z"}]}})
+                elif sub_req.get("url") == "/auditLogs/signIns?$skiptoken=page2":
+                    res.append({"id": sub_req.get("id"), "status": 200,
+                                "body": {"value": [{"id": "b", "createdDateTime": "2024-05-28T13:08:50Z"}]}})
+                else:
+                    res.append({"id": sub_req.get("id"), "status": 200, "body": {"value": []}})
+            return 200, {}, json.dumps({"responses": res})
+
+        responses.add(responses.POST,
+                      "https://login.microsoftonline.com/some-tenant/oauth2/v2.0/token",
+                      json=token_res_body,
+                      status=200)
+        responses.add_callback(responses.POST, "https://graph.microsoft.com/v1.0/$batch", callback=batch_callback)
+
+        a = AzureGraphBatch(azure_ad_tenant_id="some-tenant",
+                            azure_ad_client_id="some-client",
+                            azure_ad_secret_value="some-secret",
+                            data_requests=[{"url": "https://graph.microsoft.com/v1.0/auditLogs/signIns"},
+                                           {"url": "https://graph.microsoft.com/v1.0/auditLogs/directoryAudits",
+                                            "date_filter_key": "activityDateTime"}])
+        directory_audits_url = a.graph_apis[1].data_request.url
+        result = a.send_request()
+
+        # Both requests are sent in the first batch, and only the next page in the second batch
+        self.assertEqual(len(batch_bodies), 2)
+        self.assertEqual(len(batch_bodies[0].get("requests")), 2)
+        self.assertIn("activityDateTime gt", batch_bodies[0].get("requests")[1].get("url"))
+        self.assertEqual(batch_bodies[1].get("requests"), [{"id": "0", "method": "GET",
+                                                            "url": "/auditLogs/signIns?$skiptoken=page2"}])
+        self.assertEqual(result, [{"id": "a", "createdDateTime": "2024-05-28T13:08:54Z"},
+                                  {"id": "b", "createdDateTime": "2024-05-28T13:08:50Z"}])
+
+        # Only the input with new data should have its date filter updated
+        self.assertEqual(a.graph_apis[0].data_request.url,
+                         "https://graph.microsoft.com/v1.0/auditLogs/signIns?$filter=createdDateTime gt 2024-05-28T13:08:55Z")
+        self.assertEqual(a.graph_apis[1].data_request.url, directory_audits_url)
+
+    @responses.activate
+    def test_azure_graph_batch_failed_sub_response(self):
+        responses.add(responses.POST,
+                      "https://login.microsoftonline.com/some-tenant/oauth2/v2.0/token",
+                      json={"token_type": "Bearer", "expires_in": 3599, "access_token": "some-token"},
+                      status=200)
+        responses.add(responses.POST, "https://graph.microsoft.com/v1.0/$batch",
+                      json={"responses": [{"id": "0", "status": 403,
+                                           "body": {"error": {"code": "Forbidden", "message": "x" * 5000}}}]})
+
+        a = AzureGraphBatch(azure_ad_tenant_id="some-tenant",
+                            azure_ad_client_id="some-client",
+                            azure_ad_secret_value="some-secret",
+                            data_requests=[{"url": "https://graph.microsoft.com/v1.0/auditLogs/signIns"}])
+        sign_ins_url = a.graph_apis[0].data_request.url
+        with self.assertLogs("src.apis.azure.AzureGraphBatch", level="ERROR") as log:
+            self.assertEqual(a.send_request(), [])
+
+        # The failed sub response is logged with its id and status, and a capped preview of it
+        self.assertIn("(id: 0, status: 403)", log.output[0])
+        self.assertLess(len(log.output[0]), 2000)
+        # The batch request is built per call, without changing the shared data request
+        self.assertEqual((a.data_request.url, a.data_request.body), ("/$batch", None))
+        self.assertEqual(a.graph_apis[0].data_request.url, sign_ins_url)
+
+    @responses.activate
+    def test_azure_graph_batch_dedup(self):
+        responses.add(responses.POST,
+                      "https://login.microsoftonline.com/some-tenant/oauth2/v2.0/token",
+                      json={"token_type": "Bearer", "expires_in": 3599, "access_token": "some-token"},
+                      status=200)
+        responses.add(responses.POST, "https://graph.microsoft.com/v1.0/$batch",
+                      json={"responses": [{"id": "0", "status": 200,
+                                           "body": {"value": [{"id": "a",
+                                                               "createdDateTime": "2024-05-28T13:08:54Z"}]}}]})
+
+        a = AzureGraphBatch(azure_ad_tenant_id="some-tenant",
+                            azure_ad_client_id="some-client",
+                            azure_ad_secret_value="some-secret",
+                            dedup={"id_path": "id"},
+                            data_requests=[{"url": "https://graph.microsoft.com/v1.0/auditLogs/signIns"}])
+        a.send_request()
+
+        # The data requests share the dedup of the batch, so the date filter is not moved by 1 second
+        self.assertIs(a.graph_apis[0].dedup, a.dedup)
+        self.assertEqual(a.graph_apis[0].data_request.url,
+                         "https://graph.microsoft.com/v1.0/auditLogs/signIns?$filter=createdDateTime gt 2024-05-28T13:08:54Z")
@@ -1,5 +1,7 @@
+import gzip
 import json
 import os
+import re
 from datetime import datetime, timedelta, timezone
 from unittest.mock import patch
 from pydantic import ValidationError
@@ -8,6 +10,7 @@ import unittest
 
 from src.apis.cloudflare.Cloudflare import Cloudflare
 from src.apis.cloudflare_logs.CloudflareLogs import CloudflareLogs
+from src.utils import json_codec
 
 
 curr_path = os.path.abspath(os.path.dirname(__file__))
@@ -53,6 +56,52 @@ class TestCloudflareApi(unittest.TestCase):
         self.assertEqual(a.url, "https://api.cloudflare.com/client/v4/accounts/abcd-efg/alerting/v3/history?since=2024-05-24T03:22:46.410294Z")
         self.assertEqual(results, res.get("result"))
 
+    @responses.activate
+    def test_backfill_slices(self):
+        failed_slices = []
+
+        def slice_callback(request):
+            if "page=" in request.url:
+                return 200, {}, json.dumps({"result": [], "result_info": {"page": 2}})
+            if not failed_slices:
+                # Fail the first slice to make sure it is fetched again in the next run
+                failed_slices.append(request.url)
+                return 500, {}, json.dumps({"success": False})
+            return 200, {}, json.dumps({"result": [{"url": request.url}], "result_info": {"page": 1}})
+
+        responses.add_callback(responses.GET,
+                               re.compile(r"https://api\.cloudflare\.com/client/v4/accounts/abcd-efg/alerting/v3/history.*"),
+                               callback=slice_callback)
+
+        a = Cloudflare(cloudflare_account_id="abcd-efg",
+                       cloudflare_bearer_token="mYbeReartOKen",
+                       url="https://api.cloudflare.com/client/v4/accounts/{account_id}/alerting/v3/history",
+                       days_back_fetch=4,
+                       backfill_slices=4)
+        org_url = a.url
+
+        # First run fetches all the slices, one of them fails and the date filter is not updated
+        first_run = a.send_request()
+        self.assertEqual(len(first_run), 3)
+        self.assertTrue(all("before=" in log.get("url") for log in first_run))
+        self.assertEqual(len(a._backfill_planner.pending_slices), 1)
+        self.assertEqual(a.url, org_url)
+
+        # Second run fetches only the failed slice and hands over the date filter to the backfill end
+        second_run = a.send_request()
+        self.assertEqual(second_run, [{"url": failed_slices[0]}])
+        self.assertTrue(a._backfill_planner.done)
+        self.assertEqual(a.url, "https://api.cloudflare.com/client/v4/accounts/abcd-efg/alerting/v3/history?since="
+                                f"{a._backfill_planner.end.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}")
+
+    def test_invalid_backfill_slices(self):
+        with self.assertRaises(ValidationError):
+            Cloudflare(cloudflare_account_id="abcd-efg",
+                       cloudflare_bearer_token="mYbeReartOKen",
+                       url="https://api.cloudflare.com/client/v4/accounts/{account_id}/alerting/v3/history",
+                       days_back_fetch=4,
+                       backfill_slices=0)
+
 
 class TestCloudflareLogsApi(unittest.TestCase):
     """
@@ -98,18 +147,18 @@ class TestCloudflareLogsApi(unittest.TestCase):
         self.assertEqual(a.headers["Authorization"], "Bearer myToken")
 
     def test_parse_ndjson(self):
-        logs = CloudflareLogs._parse_ndjson(self.NDJSON_RESPONSE)
+        logs = list(CloudflareLogs._parse_ndjson(self.NDJSON_RESPONSE.splitlines()))
         self.assertEqual(len(logs), 2)
         self.assertEqual(logs[0]["ClientIP"], "1.2.3.4")
         self.assertEqual(logs[1]["RayID"], "def456")
 
     def test_parse_ndjson_empty(self):
-        logs = CloudflareLogs._parse_ndjson("")
+        logs = list(CloudflareLogs._parse_ndjson("".splitlines()))
         self.assertEqual(logs, [])
 
     def test_parse_ndjson_with_blank_lines(self):
         text = '{"a":1}\n\n{"b":2}\n'
-        logs = CloudflareLogs._parse_ndjson(text)
+        logs = list(CloudflareLogs._parse_ndjson(text.splitlines()))
         self.assertEqual(len(logs), 2)
 
     def test_build_url(self):
@@ -120,6 +169,26 @@ class TestCloudflareLogsApi(unittest.TestCase):
         self.assertIn("end=2026-02-23T11:00:00Z", url)
         self.assertTrue(url.startswith(self.BASE_URL))
 
+    def test_build_url_with_fields_and_sample(self):
+        start = datetime(2026, 2, 23, 10, 0, 0, tzinfo=timezone.utc)
+        end = datetime(2026, 2, 23, 11, 0, 0, tzinfo=timezone.utc)
+        a = self._create_instance(fields=["ClientIP", "RayID", "EdgeStartTimestamp"], sample=0.1)
+        self.assertEqual(a._window_url(start, end),
+                         f"{self.BASE_URL}?start=2026-02-23T10:00:00Z&end=2026-02-23T11:00:00Z"
+                         f"&fields=ClientIP,RayID,EdgeStartTimestamp&sample=0.1")
+
+        # Full sample rate is the API default, no need to pass it
+        a = self._create_instance(sample=1)
+        self.assertNotIn("sample=", a._window_url(start, end))
+
+    def test_invalid_fields_and_sample(self):
+        with self.assertRaises(ValidationError):
+            self._create_instance(sample=0)
+        with self.assertRaises(ValidationError):
+            self._create_instance(sample=1.5)
+        with self.assertRaises(ValidationError):
+            self._create_instance(fields=[])
+
     def test_build_url_with_existing_params(self):
         """If base URL has other params (e.g., fields=), start/end should be appended with &."""
         base_url = f"{self.BASE_URL}?fields=ClientIP,RayID"
@@ -151,12 +220,30 @@ class TestCloudflareLogsApi(unittest.TestCase):
             mock_dt.now.return_value = fixed_now
             mock_dt.strptime = datetime.strptime
             mock_dt.side_effect = lambda *a, **kw: datetime(*a, **kw)
-            results = a.send_request()
+            results = list(a.send_request())
 
         self.assertEqual(len(results), 2)
         self.assertEqual(results[0]["ClientIP"], "1.2.3.4")
         self.assertEqual(results[1]["RayID"], "def456")
 
+    @responses.activate
+    def test_send_request_compressed_ndjson(self):
+        """Compressed NDJSON responses are decompressed while the lines are read."""
+        a = self._create_instance(accept_encoding="gzip, deflate")
+        a.next_start_time = datetime.now(timezone.utc) - timedelta(minutes=30)
+
+        responses.add(
+            responses.GET,
+            self.BASE_URL,
+            body=gzip.compress(self.NDJSON_RESPONSE.encode()),
+            headers={"Content-Encoding": "gzip"},
+            status=200,
+        )
+
+        results = list(a.send_request())
+        self.assertEqual(responses.calls[0].request.headers["Accept-Encoding"], "gzip, deflate")
+        self.assertEqual([log["RayID"] for log in results], ["abc123", "def456"])
+
     @responses.activate
     def test_send_request_advances_start_time(self):
         """After fetching, next_start_time should advance to the end of the last window."""
@@ -176,7 +263,7 @@ class TestCloudflareLogsApi(unittest.TestCase):
             mock_dt.now.return_value = fixed_now
             mock_dt.strptime = datetime.strptime
             mock_dt.side_effect = lambda *a, **kw: datetime(*a, **kw)
-            a.send_request()
+            list(a.send_request())
 
         # end_limit = fixed_now - 5 min = 11:55
         # Single window: start=11:30, end=min(11:30+1h, 11:55)=11:55
@@ -215,7 +302,7 @@ class TestCloudflareLogsApi(unittest.TestCase):
             mock_dt.now.return_value = fixed_now
             mock_dt.strptime = datetime.strptime
             mock_dt.side_effect = lambda *a, **kw: datetime(*a, **kw)
-            results = a.send_request()
+            results = list(a.send_request())
 
         self.assertEqual(len(results), 3)
         # 3 windows: 9:30-10:30, 10:30-11:30, 11:30-11:55
@@ -234,7 +321,153 @@ class TestCloudflareLogsApi(unittest.TestCase):
             mock_dt.now.return_value = fixed_now
             mock_dt.strptime = datetime.strptime
             mock_dt.side_effect = lambda *a, **kw: datetime(*a, **kw)
-            results = a.send_request()
+            results = list(a.send_request())
 
         self.assertEqual(results, [])
         self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_send_request_failed_window_is_retried(self):
+        """A failed window should stop the fetch without advancing next_start_time past it."""
+        fixed_now = datetime(2026, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+        a = self._create_instance()
+        a.next_start_time = fixed_now - timedelta(hours=2, minutes=30)
+
+        responses.add(responses.GET, self.BASE_URL, body='{"log":"window1"}\n', status=200)
+        responses.add(responses.GET, self.BASE_URL, status=500)
+
+        with patch("src.apis.cloudflare_logs.CloudflareLogs.datetime") as mock_dt:
+            mock_dt.now.return_value = fixed_now
+            mock_dt.strptime = datetime.strptime
+            mock_dt.side_effect = lambda *a, **kw: datetime(*a, **kw)
+            results = list(a.send_request())
+
+        self.assertEqual(results, [{"log": "window1"}])
+        self.assertEqual(len(responses.calls), 2)
+        # Only the first window (9:30-10:30) was completed
+        self.assertEqual(a.next_start_time, fixed_now - timedelta(hours=1, minutes=30))
+        self.assertEqual(a.url, self.BASE_URL)
+
+    def test_window_failed_partway_is_read_again(self):
+        """A window that failed after some of its logs were yielded should be read again as a whole in the next run."""
+        fixed_now = datetime(2026, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+        a = self._create_instance()
+        a.next_start_time = fixed_now - timedelta(hours=1, minutes=30)
+        requested_urls = []
+
+        def failing_window(url):
+            requested_urls.append(url)
+            yield {"log": 1}
+            yield {"log": 2}
+            return False
+
+        def window(url):
+            requested_urls.append(url)
+            # Cloudflare may return the logs of the window in a different order
+            for i in range(4, 0, -1):
+                yield {"log": i}
+            return True
+
+        with patch("src.apis.cloudflare_logs.CloudflareLogs.datetime") as mock_dt:
+            mock_dt.now.return_value = fixed_now
+            mock_dt.strptime = datetime.strptime
+            mock_dt.side_effect = lambda *a, **kw: datetime(*a, **kw)
+            with patch.object(CloudflareLogs, "_stream_window", side_effect=failing_window):
+                with self.assertLogs("src.apis.cloudflare_logs.CloudflareLogs", level="WARNING") as logs:
+                    first_results = list(a.send_request())
+            mock_dt.now.return_value = fixed_now + timedelta(minutes=10)
+            with patch.object(CloudflareLogs, "_stream_window", side_effect=window):
+                second_results = list(a.send_request())
+
+        self.assertEqual(first_results, [{"log": 1}, {"log": 2}])
+        self.assertTrue(any("Set 'dedup'" in line for line in logs.output))
+        self.assertEqual(a.next_start_time, fixed_now + timedelta(minutes=5))
+        # The failed window is sent again with the same URL, and all of its logs are returned
+        self.assertEqual(requested_urls[1], requested_urls[0])
+        self.assertEqual([log["log"] for log in second_results], [4, 3, 2, 1, 4, 3, 2, 1])
+
+    @responses.activate
+    def test_send_request_json_document(self):
+        """A response which is a single JSON document should be decoded as a whole."""
+        fixed_now = datetime(2026, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+        a = self._create_instance(response_data_path="result")
+        a.next_start_time = fixed_now - timedelta(hours=1, minutes=30)
+
+        responses.add(responses.GET, self.BASE_URL, json={"result": [{"a": 1}, {"a": 2}]}, status=200)
+        responses.add(responses.GET, self.BASE_URL, body=json.dumps({"result": {"b": 1}}, indent=2), status=200)
+
+        with patch("src.apis.cloudflare_logs.CloudflareLogs.datetime") as mock_dt:
+            mock_dt.now.return_value = fixed_now
+            mock_dt.strptime = datetime.strptime
+            mock_dt.side_effect = lambda *a, **kw: datetime(*a, **kw)
+            results = list(a.send_request())
+
+        self.assertEqual(results, [{"a": 1}, {"a": 2}, {"b": 1}])
+
+    def test_parse_long_integers(self):
+        org_backend = json_codec.get_backend()
+        self.addCleanup(json_codec.set_backend, org_backend)
+        long_id = 123456789012345678901234
+        a = self._create_instance()
+
+        # Integers above 64 bit are kept exactly with every JSON backend, in NDJSON lines and single JSON documents
+        for backend in (json_codec.ORJSON_BACKEND, json_codec.STDLIB_BACKEND):
+            json_codec.set_backend(backend)
+            lines = [f'{{"id": {long_id}}}'.encode(), b'{"id": 1}']
+            self.assertEqual(list(CloudflareLogs._parse_ndjson(lines)), [{"id": long_id}, {"id": 1}])
+            self.assertEqual(list(a._parse_response(lines)), [{"id": long_id}, {"id": 1}])
+            self.assertEqual(list(a._parse_response([b'[', f'{{"id": {long_id}}}'.encode(), b']'])),
+                             [{"id": long_id}])
+
+    def test_parse_ndjson_bytes_lines(self):
+        logs = list(CloudflareLogs._parse_ndjson([b'{"a":1}', b'not json', b'[{"b":2},{"c":3}]']))
+        self.assertEqual(logs, [{"a": 1}, {"b": 2}, {"c": 3}])
+
+    @responses.activate
+    def test_send_request_raw_passthrough(self):
+        """In raw passthrough mode the NDJSON lines should be yielded as is, without parsing."""
+        fixed_now = datetime(2026, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+        a = self._create_instance(raw_passthrough=True)
+        a.next_start_time = fixed_now - timedelta(minutes=30)
+
+        responses.add(responses.GET, self.BASE_URL, body=self.NDJSON_RESPONSE, status=200)
+
+        with patch("src.apis.cloudflare_logs.CloudflareLogs.datetime") as mock_dt:
+            mock_dt.now.return_value = fixed_now
+            mock_dt.strptime = datetime.strptime
+            mock_dt.side_effect = lambda *a, **kw: datetime(*a, **kw)
+            results = list(a.send_request())
+
+        self.assertEqual(results, [line.encode() for line in self.NDJSON_RESPONSE.splitlines()])
+
+    @responses.activate
+    def test_send_request_concurrent_windows(self):
+        """Windows fetched in parallel should be delivered in order, and a failed window should stop the advance."""
+        fixed_now = datetime(2026, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+        def window_callback(request):
+            if "start=2026-03-01T08:30:00Z" in request.url:
+                return 500, {}, ""
+            window_start = request.url.split("start=")[1].split("&")[0]
+            return 200, {}, f'{{"window":"{window_start}"}}\n'
+
+        responses.add_callback(responses.GET, self.BASE_URL, callback=window_callback)
+
+        a = self._create_instance(max_concurrent_windows=3)
+        # 5 windows: 6:30, 7:30, 8:30 (fails), 9:30, 10:30-11:30, 11:30-11:55
+        a.next_start_time = fixed_now - timedelta(hours=5, minutes=30)
+
+        with patch("src.apis.cloudflare_logs.CloudflareLogs.datetime") as mock_dt:
+            mock_dt.now.return_value = fixed_now
+            mock_dt.strptime = datetime.strptime
+            mock_dt.side_effect = lambda *a, **kw: datetime(*a, **kw)
+            results = list(a.send_request())
+
+        self.assertEqual(results, [{"window": "2026-03-01T06:30:00Z"}, {"window": "2026-03-01T07:30:00Z"}])
+        self.assertEqual(a.next_start_time, datetime(2026, 3, 1, 8, 30, 0, tzinfo=timezone.utc))
+
+    def test_invalid_concurrent_windows(self):
+        with self.assertRaises(ValidationError):
+            self._create_instance(max_concurrent_windows=0)
@@ -1,7 +1,13 @@
+from importlib.metadata import EntryPoint
 from os.path import abspath, dirname
+import os
+import subprocess
+import sys
+from unittest.mock import patch
 import unittest
 
-from src.config.ConfigReader import ConfigReader
+from src.apis.general.Api import ApiFetcher
+from src.config.ConfigReader import ConfigReader, get_api_class
 
 
 curr_path = abspath(dirname(dirname(__file__)))
@@ -59,3 +65,54 @@ class TestConfigReader(unittest.TestCase):
         with self.assertLogs("src.config.ConfigReader", level='INFO') as log:
             ConfigReader(f"{curr_path}/testConfigs/invalid_output_conf.yaml")
         self.assertIn("ERROR:src.config.ConfigReader:Invalid Logzio output config. Please make sure your Logzio config is an object for single output or a list for multiple outputs.", log.output)
+
+    def test_shard_inputs(self):
+        conf_path = f"{curr_path}/testConfigs/multiple_apis_conf.yaml"
+        shards = [ConfigReader(conf_path, shard_index=i, shard_count=3).api_instances for i in range(3)]
+
+        # Every input runs in exactly one shard
+        names = sorted(api.name for shard in shards for api in shard)
+        self.assertEqual(names, ["cloudflare test", "logz-api"])
+
+        # The shard settings can be set with environment variables
+        with patch.dict(os.environ, {"SHARD_INDEX": "1", "SHARD_COUNT": "3"}):
+            self.assertEqual([api.name for api in ConfigReader(conf_path).api_instances],
+                             [api.name for api in shards[1]])
+
+    def test_rendezvous_shard_reassignment(self):
+        apis = [{"name": f"input-{i}"} for i in range(200)]
+        before = {api["name"]: ConfigReader.get_input_shard(api, 4) for api in apis}
+        after = {api["name"]: ConfigReader.get_input_shard(api, 5) for api in apis}
+
+        # Adding a shard only moves inputs to the new shard
+        moved = [name for name in before if before[name] != after[name]]
+        self.assertTrue(all(after[name] == 4 for name in moved))
+        self.assertLess(len(moved), len(apis) / 2)
+        self.assertEqual(len(set(before.values())), 4)
+
+    def test_invalid_shard_settings(self):
+        conf_path = f"{curr_path}/testConfigs/multiple_apis_conf.yaml"
+        with self.assertLogs("src.config.ConfigReader", level='ERROR'):
+            self.assertEqual(ConfigReader(conf_path, shard_index=3, shard_count=3).api_instances, [])
+        with patch.dict(os.environ, {"SHARD_COUNT": "two"}), self.assertLogs("src.config.ConfigReader", level='ERROR'):
+            self.assertEqual(ConfigReader(conf_path).api_instances, [])
+
+    def test_lazy_input_types_import(self):
+        # Only the modules of the configured input types are imported
+        code = ("import sys; from src.config.ConfigReader import ConfigReader; "
+                f"ConfigReader('{curr_path}/testConfigs/multiple_apis_conf.yaml'); "
+                "print('src.apis.cloudflare.Cloudflare' in sys.modules, 'src.apis.google.GoogleWorkspace' in sys.modules)")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=dirname(curr_path), check=True)
+        self.assertEqual(result.stdout.strip(), "True False")
+
+    def test_entry_point_input_type(self):
+        entry_point = EntryPoint(name="my_input", value="src.apis.general.Api:ApiFetcher",
+                                 group="logzio_api_fetcher.inputs")
+        with patch("src.config.ConfigReader.entry_points", return_value=[entry_point]) as mock_entry_points:
+            self.assertIs(get_api_class("my_input"), ApiFetcher)
+        mock_entry_points.assert_called_once_with(group="logzio_api_fetcher.inputs", name="my_input")
+
+        with patch("src.config.ConfigReader.entry_points", return_value=[]):
+            with self.assertRaises(ValueError):
+                get_api_class("not_existing_input")
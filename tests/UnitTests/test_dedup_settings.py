@@ -0,0 +1,69 @@
+import os
+from pydantic import ValidationError
+import tempfile
+from unittest.mock import patch
+import unittest
+
+from src.apis.general.Api import ApiFetcher
+from src.apis.general.DedupSettings import DedupSettings
+
+
+class TestDedupSettings(unittest.TestCase):
+    """
+    Test cases for the logs de-duplication settings
+    """
+
+    def test_invalid_setup(self):
+        with self.assertRaises(ValidationError):
+            DedupSettings()
+        with self.assertRaises(ValidationError):
+            DedupSettings(id_path="id", window_minutes=0)
+        with self.assertRaises(ValidationError):
+            ApiFetcher(url="https://some/url", dedup={"max_ids": 10})
+
+    def test_valid_setup(self):
+        a = ApiFetcher(url="https://some/url", dedup={"id_path": "uuid"})
+        self.assertIsInstance(a.dedup, DedupSettings)
+        self.assertEqual(a.dedup.window_minutes, 60)
+        self.assertIsNone(ApiFetcher(url="https://some/url").dedup)
+
+    def test_filter_logs(self):
+        dedup = DedupSettings(id_path="id.uniqueQualifier")
+        logs = [{"id": {"uniqueQualifier": 1, "time": "a"}, "msg": "first"},
+                {"id": {"uniqueQualifier": 2, "time": "b"}, "msg": "second"},
+                {"id": {"uniqueQualifier": 1, "time": "a"}, "msg": "first again"},
+                {"msg": "no id"},
+                {"msg": "no id"}]
+
+        self.assertEqual(list(dedup.filter_logs(logs, "test")), [logs[0], logs[1], logs[3], logs[4]])
+
+        # Already received IDs are dropped in the next runs as well, including from raw logs
+        next_logs = [b'{"id": {"uniqueQualifier": 2}}', b'{"id": {"uniqueQualifier": 3}}']
+        self.assertEqual(list(dedup.filter_logs(next_logs, "test")), [next_logs[1]])
+
+    def test_eviction(self):
+        dedup = DedupSettings(id_path="id", window_minutes=1, max_ids=2)
+
+        with patch("src.apis.general.DedupSettings.time", return_value=1000):
+            self.assertFalse(dedup.is_duplicate({"id": "a"}))
+            self.assertFalse(dedup.is_duplicate({"id": "b"}))
+            # Passing max_ids evicts the oldest ID
+            self.assertFalse(dedup.is_duplicate({"id": "c"}))
+            self.assertFalse(dedup.is_duplicate({"id": "a"}))
+            self.assertTrue(dedup.is_duplicate({"id": "c"}))
+
+        # IDs older than the time window are evicted
+        with patch("src.apis.general.DedupSettings.time", return_value=1061):
+            self.assertFalse(dedup.is_duplicate({"id": "c"}))
+
+    def test_persist_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            persist_file = os.path.join(tmp_dir, "ids.json")
+
+            dedup = DedupSettings(id_path="id", persist_file=persist_file)
+            self.assertEqual(list(dedup.filter_logs([{"id": 1}, {"id": 2}], "test")), [{"id": 1}, {"id": 2}])
+            dedup.save()
+
+            # IDs are kept after a restart
+            restarted_dedup = DedupSettings(id_path="id", persist_file=persist_file)
+            self.assertEqual(list(restarted_dedup.filter_logs([{"id": 2}, {"id": 3}], "test")), [{"id": 3}])
@@ -1,8 +1,12 @@
+import gzip
+import json
 import responses
 import requests
+import threading
 import unittest
 
-from src.output.LogzioShipper import LogzioShipper
+from src.output.LogzioShipper import LogzioShipper, MAX_RAW_FIELDS_CACHE_SIZE
+from src.utils import json_codec
 
 
 class TestLogzioShipper(unittest.TestCase):
@@ -15,13 +19,102 @@ class TestLogzioShipper(unittest.TestCase):
 
         # Text log
         s.add_log_to_send("random text log", {"type": "someType"})
-        self.assertIn('{"message": "random text log", "type": "someType"}', s.curr_logs)
+        self.assertEqual(json.loads(s.curr_logs[-1]), {"message": "random text log", "type": "someType"})
 
         # Json log
         s.add_log_to_send('{"message": "json log", "field": 123}',
                           {"type": "api-fetcher", "field2": "value"})
-        self.assertIn('{"message": "json log", "field": 123, "type": "api-fetcher", "field2": "value"}',
-                      s.curr_logs)
+        self.assertEqual(json.loads(s.curr_logs[-1]),
+                         {"message": "json log", "field": 123, "type": "api-fetcher", "field2": "value"})
+
+        # Logs which are already decoded
+        s.add_log_to_send({"message": "decoded log"}, {"type": "api-fetcher"})
+        self.assertEqual(json.loads(s.curr_logs[-1]), {"message": "decoded log", "type": "api-fetcher"})
+
+    def test_add_raw_log_to_send(self):
+        s = LogzioShipper(token="myShippingToken")
+        custom_fields = {"type": "cloudflare", "field2": 1}
+
+        # Raw JSON logs get the custom fields spliced in
+        s.add_log_to_send(b'{"ClientIP":"1.2.3.4","RayID":"abc123"}', custom_fields)
+        s.add_log_to_send(b'{ }', custom_fields)
+        raw_fields = json_codec.dumps_bytes(custom_fields)[1:-1]
+        self.assertEqual(s.curr_logs, [b'{"ClientIP":"1.2.3.4","RayID":"abc123",' + raw_fields + b'}',
+                                       b'{' + raw_fields + b'}'])
+
+        # Raw logs which already have a custom field get it overridden, without a duplicate key
+        s.add_log_to_send(b'{"type":"original","RayID":"abc123"}', custom_fields)
+        self.assertEqual(s.curr_logs[-1].count(b'"type"'), 1)
+        self.assertEqual(json.loads(s.curr_logs[-1]), {"type": "cloudflare", "RayID": "abc123", "field2": 1})
+
+        # Raw logs which are not JSON objects go through the regular enrichment
+        s.add_log_to_send(b'raw text log', {"type": "cloudflare"})
+        self.assertEqual(json.loads(s.curr_logs[-1]), {"message": "raw text log", "type": "cloudflare"})
+
+        # Malformed raw logs which look like JSON objects are not spliced into the bulk
+        s.add_log_to_send(b'{"RayID":"abc123", broken}', {"type": "cloudflare"})
+        self.assertEqual(json.loads(s.curr_logs[-1]), {"message": '{"RayID":"abc123", broken}', "type": "cloudflare"})
+
+        # A custom field name which appears only as a value does not prevent the splice
+        s.add_log_to_send(b'{"note":"type"}', {"type": "cloudflare"})
+        raw_fields = json_codec.dumps_bytes({"type": "cloudflare"})[1:-1]
+        self.assertEqual(s.curr_logs[-1], b'{"note":"type",' + raw_fields + b'}')
+
+    def test_raw_fields_cache(self):
+        s = LogzioShipper(token="myShippingToken")
+
+        # The cache is by the custom fields content, so a changed object gets its new fields
+        custom_fields = {"type": "cloudflare"}
+        s.add_log_to_send(b'{"a":1}', custom_fields)
+        custom_fields["type"] = "changed"
+        s.add_log_to_send(b'{"a":1}', custom_fields)
+        s.add_log_to_send(b'{"a":1}', {"flag": True})
+        s.add_log_to_send(b'{"a":1}', {"flag": 1})
+        self.assertEqual([json.loads(log) for log in s.curr_logs],
+                         [{"a": 1, "type": "cloudflare"}, {"a": 1, "type": "changed"}, {"a": 1, "flag": True},
+                          {"a": 1, "flag": 1}])
+
+        # Nested custom fields are not cached, and the cache size is bounded
+        s.add_log_to_send(b'{"a":1}', {"nested": {"b": 2}})
+        self.assertEqual(json.loads(s.curr_logs[-1]), {"a": 1, "nested": {"b": 2}})
+        for i in range(MAX_RAW_FIELDS_CACHE_SIZE + 10):
+            s.add_log_to_send(b'{"a":1}', {"i": i})
+        self.assertEqual(len(s._raw_fields_cache), MAX_RAW_FIELDS_CACHE_SIZE)
+
+    def test_add_log_with_long_integers(self):
+        org_backend = json_codec.get_backend()
+        self.addCleanup(json_codec.set_backend, org_backend)
+        long_id = 123456789012345678901234
+
+        # Integers above 64 bit are kept exactly with every JSON backend, in parsed text and raw logs
+        for backend in (json_codec.ORJSON_BACKEND, json_codec.STDLIB_BACKEND):
+            json_codec.set_backend(backend)
+            s = LogzioShipper(token="myShippingToken")
+            s.add_log_to_send(f'{{"id": {long_id}}}', {"type": "someType"})
+            s.add_log_to_send(f'{{"id": {long_id}, "type": "original"}}'.encode(), {"type": "someType"})
+            self.assertEqual([json.loads(log) for log in s.curr_logs],
+                             [{"id": long_id, "type": "someType"}] * 2)
+
+    @responses.activate
+    def test_shared_shipper_threads(self):
+        s = LogzioShipper(token="myShippingToken")
+        call = responses.add(responses.POST, "https://listener.logz.io:8071/?token=myShippingToken", status=200)
+
+        def ship_logs(api_name):
+            for i in range(2000):
+                s.add_log_to_send({"message": "x" * 500, "api": api_name, "i": i})
+            s.send_to_logzio()
+
+        threads = [threading.Thread(target=ship_logs, args=(f"api{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Every log is sent exactly once
+        sent_logs = [log for c in call.calls for log in gzip.decompress(c.request.body).split(b"\n")]
+        self.assertEqual(len(sent_logs), 8000)
+        self.assertEqual(len(set(sent_logs)), 8000)
 
     @responses.activate
     def test_send_to_logzio(self):
@@ -31,9 +124,11 @@ class TestLogzioShipper(unittest.TestCase):
                       status=200)
 
         s.add_log_to_send("random text log", {"type": "someType"})
+        bulk_size = s.curr_bulk_size
         with self.assertLogs("src.output.LogzioShipper", level='INFO') as log:
             s.send_to_logzio()
-        self.assertIn("INFO:src.output.LogzioShipper:Successfully sent bulk of 50 bytes to Logz.io.", log.output)
+        self.assertIn(f"INFO:src.output.LogzioShipper:Successfully sent bulk of {bulk_size} bytes to Logz.io.",
+                      log.output)
 
     @responses.activate
     def test_invalid_token(self):
@@ -47,3 +142,41 @@ class TestLogzioShipper(unittest.TestCase):
             with self.assertRaises(requests.exceptions.HTTPError):
                 s.send_to_logzio()
         self.assertIn("ERROR:src.output.LogzioShipper:Logzio Shipping Token is missing or invalid. Make sure you’re using the right account token.", log.output)
+
+    @responses.activate
+    def test_add_logs_while_sending(self):
+        s = LogzioShipper(token="myShippingToken")
+        post_started = threading.Event()
+        log_added = threading.Event()
+
+        def slow_listener(request):
+            post_started.set()
+            # The bulk lock is not held while sending, so another thread can add logs meanwhile
+            self.assertTrue(log_added.wait(5))
+            return 200, {}, ""
+
+        responses.add_callback(responses.POST, "https://listener.logz.io:8071/?token=myShippingToken",
+                               callback=slow_listener)
+        s.add_log_to_send({"message": "first"})
+        sender = threading.Thread(target=s.send_to_logzio)
+        sender.start()
+        self.assertTrue(post_started.wait(5))
+        s.add_log_to_send({"message": "second"})
+        log_added.set()
+        sender.join()
+
+        self.assertEqual(json.loads(gzip.decompress(responses.calls[0].request.body)), {"message": "first"})
+        self.assertEqual([json.loads(log) for log in s.curr_logs], [{"message": "second"}])
+
+    @responses.activate
+    def test_failed_bulk_is_kept(self):
+        s = LogzioShipper(token="myShippingToken")
+        responses.add(responses.POST, "https://listener.logz.io:8071/?token=myShippingToken", status=400)
+
+        s.add_log_to_send({"message": "first"})
+        with self.assertRaises(requests.exceptions.HTTPError):
+            s.send_to_logzio()
+        s.add_log_to_send({"message": "second"})
+
+        # The failed bulk is sent again with the next one
+        self.assertEqual([json.loads(log) for log in s.curr_logs], [{"message": "first"}, {"message": "second"}])
@@ -0,0 +1,224 @@
+from datetime import datetime, timedelta, UTC
+import json
+import responses
+import threading
+from time import time
+import unittest
+from unittest.mock import patch
+
+from src.apis.azure.AzureGraph import AzureGraph
+from src.apis.azure.AzureGraphBatch import AzureGraphBatch
+from src.apis.cloudflare_logs.CloudflareLogs import CloudflareLogs
+from src.apis.general.Api import ApiFetcher
+from src.apis.general.BackfillPlanner import BackfillPlanner
+from src.apis.general.PaginationSettings import PaginationSettings
+from src.utils import memory_budget
+from src.utils.memory_budget import MemoryBudget
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """
+    Test cases for the global memory budget of the inputs
+    """
+
+    def tearDown(self):
+        memory_budget.set_budget(None)
+
+    def test_fair_share(self):
+        budget = MemoryBudget(100, max_wait_seconds=5)
+        for owner in ("a", "b"):
+            budget.start(owner)
+        budget.record("a", 80)
+        budget.record("b", 30)
+
+        # Over its fair share, 'a' has to ship its data first
+        self.assertEqual(budget.get_fair_share(), 50)
+        self.assertFalse(budget.wait_for_room("a"))
+
+        # Under its fair share, 'b' waits for 'a' to release its data
+        result = {}
+        waiting_thread = threading.Thread(target=lambda: result.update(room=budget.wait_for_room("b")))
+        waiting_thread.start()
+        waiting_thread.join(timeout=0.2)
+        self.assertTrue(waiting_thread.is_alive())
+
+        budget.release("a")
+        waiting_thread.join(timeout=5)
+        self.assertTrue(result["room"])
+        self.assertEqual(budget.used_bytes, 30)
+
+        # An input that holds nothing can always fetch
+        budget.record("b", 100)
+        budget.start("c")
+        self.assertTrue(budget.wait_for_room("c"))
+
+    def test_wait_timeout(self):
+        budget = MemoryBudget(100, max_wait_seconds=0.1)
+        budget.record("a", 80)
+        budget.record("b", 10)
+        budget.record("c", 20)
+
+        # Under its fair share, but the other inputs did not release their data in time
+        start_time = time()
+        self.assertFalse(budget.wait_for_room("b"))
+        self.assertGreaterEqual(time() - start_time, 0.1)
+
+    def test_invalid_budget(self):
+        with self.assertRaises(ValueError):
+            MemoryBudget(0)
+
+    @responses.activate
+    def test_pagination_stops_on_exhausted_budget(self):
+        for page, next_page in (("1", "2"), ("2", "3"), ("3", "4"), ("4", "")):
+            responses.add(responses.GET, f"https://some/page/{page}",
+                          json={"data": [{"message": f"{page}" * 100}], "next": next_page})
+        budget = MemoryBudget(150)
+        memory_budget.set_budget(budget)
+
+        api = ApiFetcher(name="paged", url="https://some/page/1", response_data_path="data",
+                         pagination=PaginationSettings(type="url", url_format="https://some/page/{res.next}",
+                                                       stop_indication={"field": "next", "condition": "empty"}))
+        budget.start("paged")
+        budget.start("other")
+        logs = api.send_request()
+
+        # The first two pages exhausted the budget and are over the input fair share
+        self.assertEqual(len(responses.calls), 2)
+        self.assertEqual(len(logs), 2)
+        self.assertTrue(api.cycle_deadline_reached)
+        self.assertEqual(api.url, "https://some/page/1")
+        self.assertEqual(api.pagination_resume["page"], "https://some/page/3")
+
+        # Once the data was shipped, the next run continues from the page it stopped at
+        budget.release("paged")
+        budget.start("paged")
+        logs = api.send_request()
+
+        self.assertEqual([call.request.url for call in responses.calls[2:]],
+                         ["https://some/page/3", "https://some/page/4"])
+        self.assertEqual([log["message"][0] for log in logs], ["3", "4"])
+        self.assertIsNone(api.pagination_resume)
+
+    @responses.activate
+    def test_backfill_slice_continues_after_budget_stop(self):
+        responses.add(responses.GET, "https://some/slice", json={"data": [{"message": "1" * 100}], "next": "2"})
+        responses.add(responses.GET, "https://some/page/2", json={"data": [{"message": "2" * 100}], "next": ""})
+        budget = MemoryBudget(100)
+        memory_budget.set_budget(budget)
+        completed = []
+
+        def create_slice_request(start, end):
+            return ApiFetcher(name="backfill", url="https://some/slice", response_data_path="data",
+                              pagination=PaginationSettings(type="url", url_format="https://some/page/{res.next}",
+                                                            stop_indication={"field": "next", "condition": "empty"}))
+
+        planner = BackfillPlanner("backfill", datetime.now(UTC) - timedelta(days=1), 1)
+        budget.start("backfill")
+        budget.start("other")
+        logs = planner.run(create_slice_request, completed.append)
+
+        # The fetched page of the slice is sent, and the slice continues from its next page in the next run
+        self.assertEqual([log["message"][0] for log in logs], ["1"])
+        self.assertFalse(planner.done)
+        self.assertEqual(completed, [])
+
+        budget.release("backfill")
+        budget.start("backfill")
+        logs = planner.run(create_slice_request, completed.append)
+
+        self.assertEqual([log["message"][0] for log in logs], ["2"])
+        self.assertEqual([call.request.url for call in responses.calls], ["https://some/slice", "https://some/page/2"])
+        self.assertTrue(planner.done)
+        self.assertEqual(completed, [planner.end])
+
+    @responses.activate
+    def test_cloudflare_windows_stop_on_exhausted_budget(self):
+        fixed_now = datetime(2026, 3, 1, 12, 0, 0, tzinfo=UTC)
+        responses.add(responses.GET, "https://api.cloudflare.com/client/v4/zones/zone123/logs/received",
+                      body=json.dumps({"message": "x" * 200}) + "\n")
+        budget = MemoryBudget(100)
+        memory_budget.set_budget(budget)
+
+        for max_concurrent_windows in (1, 2):
+            api = CloudflareLogs(name="cf", cloudflare_account_id="acc-123", cloudflare_bearer_token="myToken",
+                                 url="https://api.cloudflare.com/client/v4/zones/zone123/logs/received",
+                                 max_concurrent_windows=max_concurrent_windows)
+            api.next_start_time = fixed_now - timedelta(hours=2, minutes=30)
+            budget.start("cf")
+            budget.start("other")
+            with patch("src.apis.cloudflare_logs.CloudflareLogs.datetime") as mock_dt:
+                mock_dt.now.return_value = fixed_now
+                logs = list(api.send_request())
+
+            # The windows read exhausted the budget (windows that were already requested in parallel are still read),
+            # the next windows are fetched in the next run
+            self.assertGreater(budget.get_usage("cf"), 200)
+            self.assertIn(len(logs), range(1, max_concurrent_windows + 1))
+            self.assertEqual(api.next_start_time, fixed_now - timedelta(hours=2 - len(logs), minutes=30))
+            budget.release("cf")
+
+    @responses.activate
+    def test_azure_graph_pages_stop_on_exhausted_budget(self):
+        responses.add(responses.POST, "https://login.microsoftonline.com/some-tenant/oauth2/v2.0/token",
+                      json={"token_type": "Bearer", "expires_in": 3599, "access_token": "some-token"})
+        responses.add(responses.GET, "https://graph.microsoft.com/v1.0/users/delta",
+                      json={"@odata.nextLink": "https://graph.microsoft.com/v1.0/users/delta/page2",
+                            "value": [{"id": "1" * 200}]})
+        budget = MemoryBudget(100)
+        memory_budget.set_budget(budget)
+        budget.start("graph")
+        budget.start("other")
+
+        api = AzureGraph(name="graph", azure_ad_tenant_id="some-tenant", azure_ad_client_id="some-client",
+                         azure_ad_secret_value="some-secret", delta_query=True,
+                         data_request={"url": "https://graph.microsoft.com/v1.0/users/delta"})
+
+        # The delta query stops after the first page, and continues from the next page in the next run
+        self.assertEqual(len(api.send_request()), 1)
+        self.assertEqual(api.data_request.url, "https://graph.microsoft.com/v1.0/users/delta/page2")
+
+    @responses.activate
+    def test_azure_graph_batch_stops_on_exhausted_budget(self):
+        next_link = "https://graph.microsoft.com/v1.0/auditLogs/signIns/page2"
+
+        def batch_callback(request):
+            sub_req = json.loads(request.body)["requests"][0]
+            if sub_req["url"].startswith("/auditLogs/signIns?$filter"):
+                body = {"@odata.nextLink": next_link,
+                        "value": [{"id": "a" * 200, "createdDateTime": "2024-05-28T13:08:54Z"}]}
+            else:
+                body = {"value": [{"id": "b", "createdDateTime": "2024-05-28T13:08:50Z"}]}
+            return 200, {}, json.dumps({"responses": [{"id": sub_req["id"], "status": 200, "body": body}]})
+
+        responses.add(responses.POST, "https://login.microsoftonline.com/some-tenant/oauth2/v2.0/token",
+                      json={"token_type": "Bearer", "expires_in": 3599, "access_token": "some-token"})
+        batch_call = responses.add_callback(responses.POST, "https://graph.microsoft.com/v1.0/$batch",
+                                            callback=batch_callback)
+        budget = MemoryBudget(100)
+        memory_budget.set_budget(budget)
+        budget.start("batch")
+        budget.start("other")
+
+        api = AzureGraphBatch(name="batch", azure_ad_tenant_id="some-tenant", azure_ad_client_id="some-client",
+                              azure_ad_secret_value="some-secret",
+                              data_requests=[{"url": "https://graph.microsoft.com/v1.0/auditLogs/signIns"}])
+        first_url = api.graph_apis[0].data_request.url
+        logs = api.send_request()
+
+        # The chain stops after the first batch, without moving the date filter
+        self.assertEqual([log["id"][0] for log in logs], ["a"])
+        self.assertEqual(api.graph_apis[0].data_request.url, first_url)
+        self.assertEqual(api.chains_resume["0"]["page_url"], next_link)
+
+        # The next run continues from the next page, and moves the date filter once the chain completes
+        budget.release("batch")
+        budget.start("batch")
+        logs = api.send_request()
+
+        self.assertEqual([log["id"] for log in logs], ["b"])
+        self.assertEqual(json.loads(batch_call.calls[-1].request.body)["requests"][0]["url"],
+                         "/auditLogs/signIns/page2")
+        self.assertEqual(api.chains_resume, {})
+        self.assertEqual(api.graph_apis[0].data_request.url,
+                         "https://graph.microsoft.com/v1.0/auditLogs/signIns?$filter=createdDateTime gt "
+                         "2024-05-28T13:08:55Z")
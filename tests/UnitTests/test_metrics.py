@@ -0,0 +1,135 @@
+import gc
+import requests
+import responses
+import unittest
+import weakref
+
+from src.apis.general.Api import ApiFetcher
+from src.apis.general.PaginationSettings import PaginationSettings
+from src.manager.TaskManager import TaskManager
+from src.output.LogzioShipper import LogzioShipper
+from src.utils import json_codec, metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Test cases for the Prometheus metrics
+    """
+
+    def setUp(self):
+        metrics.clear()
+        metrics.set_enabled(True)
+
+    def tearDown(self):
+        metrics.set_enabled(False)
+        metrics.clear()
+
+    def test_render(self):
+        counter = metrics.Counter("test_total", "Test counter.", ["input"])
+        histogram = metrics.Histogram("test_seconds", "Test histogram.", ["input"], buckets=(1, 5))
+        gauge = metrics.Gauge("test_gauge", "Test gauge.", ["input"])
+        try:
+            counter.inc(input='my "api"')
+            counter.inc(2, input='my "api"')
+            histogram.observe(0.5, input="a")
+            histogram.observe(3, input="a")
+            histogram.observe(10, input="a")
+            gauge.set(lambda: 7, input="a")
+
+            text = metrics.render()
+        finally:
+            metrics._metrics.remove(counter)
+            metrics._metrics.remove(histogram)
+            metrics._metrics.remove(gauge)
+
+        self.assertIn("# TYPE logzio_api_fetcher_test_total counter", text)
+        self.assertIn('logzio_api_fetcher_test_total{input="my \\"api\\""} 3', text)
+        self.assertIn('logzio_api_fetcher_test_seconds_bucket{input="a",le="1"} 1', text)
+        self.assertIn('logzio_api_fetcher_test_seconds_bucket{input="a",le="5"} 2', text)
+        self.assertIn('logzio_api_fetcher_test_seconds_bucket{input="a",le="+Inf"} 3', text)
+        self.assertIn('logzio_api_fetcher_test_seconds_sum{input="a"} 13.5', text)
+        self.assertIn('logzio_api_fetcher_test_seconds_count{input="a"} 3', text)
+        self.assertIn('logzio_api_fetcher_test_gauge{input="a"} 7', text)
+
+    def test_disabled(self):
+        metrics.set_enabled(False)
+        metrics.REQUESTS.inc(input="a", status=200)
+        metrics.CYCLE_DURATION.observe(1, input="a", succeeded=True)
+
+        self.assertIsNone(metrics.REQUESTS.get(input="a", status=200))
+        self.assertIsNone(metrics.CYCLE_DURATION.get(input="a", succeeded=True))
+
+    @responses.activate
+    def test_input_metrics(self):
+        responses.add(responses.GET, "https://some/url", json={"data": [{"a": 1}, {"a": 2}], "next": "2"})
+        responses.add(responses.GET, "https://some/url?page=2", json={"data": [{"a": 3}], "next": ""})
+        responses.add(responses.GET, "https://other/url", status=429)
+        responses.add(responses.POST, "https://listener.logz.io:8071/?token=token", status=200)
+
+        shipper = LogzioShipper(token="token")
+        shipper.register_metrics(0)
+        api = ApiFetcher(name="paged", url="https://some/url", response_data_path="data",
+                         pagination=PaginationSettings(type="url", url_format="https://some/url?page={res.next}",
+                                                       stop_indication={"field": "next", "condition": "empty"}))
+        api.outputs = [shipper]
+        TaskManager()._run_api_task(api)
+
+        self.assertEqual(metrics.REQUESTS.get(input="paged", status=200), 2)
+        self.assertEqual(metrics.REQUEST_DURATION.get(input="paged")[0], 2)
+        self.assertEqual(metrics.PAGES_PER_CYCLE.get(input="paged"), (1, 2))
+        self.assertGreater(metrics.FETCHED_BYTES.get(input="paged"), 0)
+        self.assertEqual(metrics.FETCHED_RECORDS.get(input="paged"), 3)
+        self.assertEqual(metrics.CYCLE_DURATION.get(input="paged", succeeded=True)[0], 1)
+        self.assertIsNotNone(metrics.LAST_SUCCESS_TIMESTAMP.get(input="paged"))
+
+        output = "https://listener.logz.io:8071"
+        self.assertEqual(metrics.SHIP_DURATION.get(output=output, succeeded=True)[0], 1)
+        self.assertEqual(metrics.COMPRESSION_DURATION.get(output=output)[0], 1)
+        self.assertEqual(metrics.SHIPPED_BYTES.get(output=output),
+                         len(b"\n".join(json_codec.dumps_bytes({"a": i, "type": "api-fetcher"}) for i in range(1, 4))))
+        self.assertGreater(metrics.SHIPPED_COMPRESSED_BYTES.get(output=output), 0)
+        self.assertGreater(metrics.ENRICH_SECONDS.get(output=output), 0)
+        self.assertIn(f'logzio_api_fetcher_bulk_pending_logs{{output="{output}",output_index="0"}} 0', metrics.render())
+
+        # Rate limited requests
+        ApiFetcher(name="limited", url="https://other/url").send_request()
+        self.assertEqual(metrics.REQUESTS.get(input="limited", status=429), 1)
+        self.assertEqual(metrics.RATE_LIMITED_REQUESTS.get(input="limited"), 1)
+
+    def test_outputs_gauges(self):
+        output = "https://listener.logz.io:8071"
+        first, second = LogzioShipper(token="first"), LogzioShipper(token="second")
+        first.register_metrics(0)
+        second.register_metrics(1)
+        first.add_log_to_send({"a": 1})
+
+        # Outputs on the same listener have their own series
+        text = metrics.render()
+        self.assertIn(f'logzio_api_fetcher_bulk_pending_logs{{output="{output}",output_index="0"}} 1', text)
+        self.assertIn(f'logzio_api_fetcher_bulk_pending_logs{{output="{output}",output_index="1"}} 0', text)
+
+        # A replaced output does not remove the series of the output that replaced it
+        replacement = LogzioShipper(token="first")
+        replacement.register_metrics(0)
+        first.unregister_metrics()
+        self.assertIn(f'logzio_api_fetcher_bulk_pending_logs{{output="{output}",output_index="0"}} 0', metrics.render())
+
+        # The gauges do not keep a shipper alive, and its series is not reported once it is gone
+        second_ref = weakref.ref(second)
+        del second
+        gc.collect()
+        self.assertIsNone(second_ref())
+        self.assertNotIn('output_index="1"', metrics.render())
+
+    def test_metrics_server(self):
+        metrics.REQUESTS.inc(input="served", status=200)
+        server = metrics.start_metrics_server(0, host="127.0.0.1")
+        try:
+            r = requests.get(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.headers["Content-Type"].startswith("text/plain"))
+        self.assertIn('logzio_api_fetcher_requests_total{input="served",status="200"} 1', r.text)
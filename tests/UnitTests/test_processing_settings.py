@@ -0,0 +1,108 @@
+import gzip
+from pydantic import ValidationError
+import responses
+import unittest
+
+from src.apis.general.Api import ApiFetcher
+from src.apis.general.ProcessingSettings import ProcessingSettings
+from src.apis.oauth.OAuth import OAuthApi
+from src.manager.TaskManager import TaskManager
+from src.output.LogzioShipper import LogzioShipper
+from src.utils import json_codec, metrics
+
+
+class TestProcessingSettings(unittest.TestCase):
+    """
+    Test cases for the logs processing settings
+    """
+
+    def tearDown(self):
+        metrics.set_enabled(False)
+        metrics.clear()
+
+    def test_invalid_setup(self):
+        with self.assertRaises(ValidationError):
+            ProcessingSettings(drop=[{"field": "status"}])
+        with self.assertRaises(ValidationError):
+            ProcessingSettings(drop=[{"field": "status", "condition": "equals"}])
+        with self.assertRaises(ValidationError):
+            ProcessingSettings(drop=[{"field": "status", "condition": "bigger"}])
+        with self.assertRaises(ValidationError):
+            ApiFetcher(url="https://some/url", processing={"include_fields": "a"})
+
+    def test_valid_setup(self):
+        a = ApiFetcher(url="https://some/url", processing={"exclude_fields": ["a"]})
+        self.assertIsInstance(a.processing, ProcessingSettings)
+        self.assertIsNone(ApiFetcher(url="https://some/url").processing)
+
+        o = OAuthApi(token_request=ApiFetcher(url="https://token/url"),
+                     data_request=ApiFetcher(url="https://data/url"),
+                     processing={"drop": [{"field": "a", "condition": "empty"}]})
+        self.assertIsInstance(o.processing, ProcessingSettings)
+
+    def test_include_exclude_fields(self):
+        processing = ProcessingSettings(include_fields=["id", "actor.email", "event\\.type", "missing.field"],
+                                        exclude_fields=["actor.email", "id.secret"])
+        log = {"id": {"value": 1, "secret": "s"}, "actor": {"email": "a@b.c", "name": "a"}, "event.type": "login",
+               "other": "x"}
+
+        self.assertEqual(processing.process_log(log), {"id": {"value": 1}, "actor": {}, "event.type": "login"})
+
+        # Only excluded fields
+        processing = ProcessingSettings(exclude_fields=["other", "actor.name", "not.exists"])
+        self.assertEqual(processing.process_log({"actor": {"email": "a@b.c", "name": "a"}, "other": "x"}),
+                         {"actor": {"email": "a@b.c"}})
+
+    def test_drop(self):
+        processing = ProcessingSettings(drop=[{"field": "level", "condition": "equals", "value": "debug"},
+                                              {"field": "meta.tags", "condition": "contains", "value": "health"},
+                                              {"field": "message", "condition": "empty"}])
+        logs = [{"level": "info", "message": "kept", "meta": {"tags": ["login"]}},
+                {"level": "debug", "message": "dropped by equals"},
+                {"level": "info", "message": "dropped by contains", "meta": {"tags": ["health", "check"]}},
+                {"level": "info", "message": ""},
+                {"level": "info"},
+                {"level": "info", "message": "kept", "meta": {"tags": 5}}]
+
+        self.assertEqual(list(processing.process_logs(logs, "test")), [logs[0], logs[5]])
+
+        processing = ProcessingSettings(drop=[{"field": "status.code", "condition": "not_equals", "value": 200},
+                                              {"field": "error", "condition": "not_empty"}])
+        logs = [{"status": {"code": 200}},
+                {"status": {"code": 500}},
+                {"message": "no status"},
+                {"status": {"code": 200}, "error": "failed"}]
+        self.assertEqual(list(processing.process_logs(logs, "test")), [logs[0]])
+
+    def test_raw_logs(self):
+        processing = ProcessingSettings(include_fields=["a"],
+                                        drop=[{"field": "b", "condition": "equals", "value": True}])
+
+        self.assertEqual(processing.process_log(b'{"a": 1, "b": false}'), {"a": 1})
+        self.assertEqual(processing.process_log('{"a": 1, "c": 2}'), {"a": 1})
+        self.assertIsNone(processing.process_log(b'{"a": 1, "b": true}'))
+
+        # Logs which are not JSON objects are kept as is
+        self.assertEqual(processing.process_log("plain text log"), "plain text log")
+        self.assertEqual(processing.process_log(b'[1, 2]'), b'[1, 2]')
+
+    @responses.activate
+    def test_processing_before_shipping(self):
+        responses.add(responses.GET, "https://some/url",
+                      json={"data": [{"id": 1, "level": "info", "secret": "s"},
+                                     {"id": 2, "level": "debug", "secret": "s"}]})
+        responses.add(responses.POST, "https://listener.logz.io:8071/?token=token", status=200)
+        api = ApiFetcher(name="processed", url="https://some/url", response_data_path="data",
+                         processing={"exclude_fields": ["secret"],
+                                     "drop": [{"field": "level", "condition": "equals", "value": "debug"}]})
+        api.outputs = [LogzioShipper(token="token")]
+        metrics.set_enabled(True)
+
+        TaskManager()._run_api_task(api)
+
+        shipped_body = gzip.decompress(responses.calls[1].request.body)
+        # The drop conditions and excluded fields apply before the additional fields are added
+        self.assertEqual([json_codec.loads(line) for line in shipped_body.splitlines()],
+                         [{"id": 1, "level": "info", "type": "api-fetcher"}])
+        self.assertEqual(metrics.DROPPED_RECORDS.get(input="processed", reason="filter"), 1)
+        self.assertEqual(metrics.FETCHED_RECORDS.get(input="processed"), 1)
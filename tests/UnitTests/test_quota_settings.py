@@ -0,0 +1,91 @@
+from pydantic import ValidationError
+import responses
+from unittest.mock import patch
+import unittest
+
+from src.apis.general.Api import ApiFetcher
+from src.apis.general.QuotaSettings import QuotaSettings
+from src.manager.TaskManager import TaskManager
+from src.output.LogzioShipper import LogzioShipper
+from src.utils import metrics
+
+
+class TestQuotaSettings(unittest.TestCase):
+    """
+    Test cases for the logs volume quota settings
+    """
+
+    def tearDown(self):
+        metrics.set_enabled(False)
+        metrics.clear()
+
+    def test_invalid_setup(self):
+        with self.assertRaises(ValidationError):
+            QuotaSettings()
+        with self.assertRaises(ValidationError):
+            QuotaSettings(max_records_per_second=0)
+        with self.assertRaises(ValidationError):
+            QuotaSettings(max_records_per_second=1, sample_ratio=2)
+        with self.assertRaises(ValidationError):
+            ApiFetcher(url="https://some/url", quota={"on_exceeded": "drop"})
+
+    def test_valid_setup(self):
+        a = ApiFetcher(url="https://some/url", quota={"max_bytes_per_second": 1000})
+        self.assertIsInstance(a.quota, QuotaSettings)
+        self.assertEqual(a.quota.burst_seconds, 300)
+        self.assertIsNone(ApiFetcher(url="https://some/url").quota)
+
+    @patch("src.apis.general.QuotaSettings.monotonic")
+    def test_records_quota(self, mock_time):
+        mock_time.return_value = 1000
+        quota = QuotaSettings(max_records_per_second=1, burst_seconds=5, on_exceeded="drop")
+        logs = [{"id": i} for i in range(10)]
+
+        self.assertEqual(list(quota.limit_logs(logs, "test")), logs[:5])
+
+        # The quota grows by the max rate every second, up to the burst
+        mock_time.return_value = 1002
+        self.assertEqual(list(quota.limit_logs(logs, "test")), logs[:2])
+        mock_time.return_value = 2000
+        self.assertEqual(list(quota.limit_logs(logs, "test")), logs[:5])
+
+    @patch("src.apis.general.QuotaSettings.monotonic")
+    def test_bytes_quota(self, mock_time):
+        mock_time.return_value = 1000
+        quota = QuotaSettings(max_bytes_per_second=10, burst_seconds=2, on_exceeded="drop")
+        logs = [b'{"id":1}', "0123456789abcd", {"id": 3}, b'{"id":4}']
+
+        # 8 bytes are within the quota, 14 bytes are above the 12 bytes left, but the next 8 bytes are within it
+        self.assertEqual(list(quota.limit_logs(logs, "test")), [logs[0], logs[2]])
+
+    def test_sampling(self):
+        quota = QuotaSettings(max_records_per_second=1, burst_seconds=1, sample_ratio=0.5)
+        logs = [{"id": i, "zone": i % 4} for i in range(1000)]
+
+        sampled = list(quota.limit_logs(logs, "test"))[1:]
+        self.assertTrue(300 < len(sampled) < 700)
+
+        # The sampling is deterministic
+        quota = QuotaSettings(max_records_per_second=1, burst_seconds=1, sample_ratio=0.5)
+        self.assertEqual(list(quota.limit_logs(logs, "test"))[1:], sampled)
+
+        # Sampled by the sample key, all the logs of a sampled value are kept
+        quota = QuotaSettings(max_records_per_second=1, burst_seconds=1, sample_ratio=0.5, sample_key="zone")
+        sampled_zones = {log["zone"] for log in list(quota.limit_logs(logs, "test"))[1:]}
+        kept = [log for log in logs[1:] if log["zone"] in sampled_zones]
+        quota = QuotaSettings(max_records_per_second=1, burst_seconds=1, sample_ratio=0.5, sample_key="zone")
+        self.assertEqual(list(quota.limit_logs(logs, "test"))[1:], kept)
+
+    @responses.activate
+    def test_quota_before_shipping(self):
+        responses.add(responses.GET, "https://some/url", json={"data": [{"id": i} for i in range(5)]})
+        responses.add(responses.POST, "https://listener.logz.io:8071/?token=token", status=200)
+        api = ApiFetcher(name="limited", url="https://some/url", response_data_path="data",
+                         quota={"max_records_per_second": 1, "burst_seconds": 2, "on_exceeded": "drop"})
+        api.outputs = [LogzioShipper(token="token")]
+        metrics.set_enabled(True)
+
+        TaskManager()._run_api_task(api)
+
+        self.assertEqual(metrics.DROPPED_RECORDS.get(input="limited", reason="quota"), 3)
+        self.assertEqual(metrics.FETCHED_RECORDS.get(input="limited"), 2)
@@ -0,0 +1,161 @@
+import os
+import tempfile
+from unittest.mock import patch
+import unittest
+import yaml
+
+from src.apis.general.Api import ApiFetcher
+from src.config.ConfigReader import ConfigReader
+from src.config.ConfigReloader import ConfigReloader
+from src.manager.CycleProfiler import CycleProfiler
+from src.manager.TaskManager import TaskManager
+from src.utils import metrics
+
+
+CONFIG = {
+    "apis": [
+        {"name": "api1", "type": "general", "url": "https://some/url1", "scrape_interval": 60},
+        {"name": "api2", "type": "general", "url": "https://some/url2", "scrape_interval": 60}
+    ],
+    "logzio": {"url": "https://listener.logz.io:8071", "token": "SHipPIngtoKen"}
+}
+
+
+class TestTaskManager(unittest.TestCase):
+    """
+    Test cases for running the APIs tasks and reloading the config
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.conf_path = os.path.join(self.tmp_dir.name, "config.yaml")
+        self._write_config(CONFIG)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write_config(self, config):
+        with open(self.conf_path, "w") as conf_file:
+            yaml.safe_dump(config, conf_file)
+
+    def test_reload_keeps_unchanged_instances(self):
+        reloader = ConfigReloader(self.conf_path, ConfigReader(self.conf_path))
+        api1, api2 = reloader.get_apis()
+        shipper = api1.outputs[0]
+        api1.url = "https://some/url1?since=cursor"
+
+        new_config = {"apis": [CONFIG["apis"][0],
+                               dict(CONFIG["apis"][1], url="https://some/changed"),
+                               {"name": "api3", "type": "general", "url": "https://some/url3"}],
+                      "logzio": CONFIG["logzio"]}
+        self._write_config(new_config)
+        new_apis = reloader.reload()
+
+        # Unchanged input keeps its state, changed and new inputs are created
+        self.assertIs(new_apis[0], api1)
+        self.assertEqual(new_apis[0].url, "https://some/url1?since=cursor")
+        self.assertIsNot(new_apis[1], api2)
+        self.assertEqual(new_apis[1].url, "https://some/changed")
+        self.assertEqual(new_apis[2].name, "api3")
+        for api in new_apis:
+            self.assertEqual(api.outputs, [shipper])
+            self.assertIs(api.outputs[0], shipper)
+
+    def test_reload_invalid_config(self):
+        reloader = ConfigReloader(self.conf_path, ConfigReader(self.conf_path), watch=True)
+        apis = reloader.get_apis()
+        self.assertFalse(reloader.has_changed())
+
+        os.remove(self.conf_path)
+        self.assertTrue(reloader.has_changed())
+        with self.assertLogs("src.config.ConfigReloader", level="ERROR"):
+            self.assertIsNone(reloader.reload())
+        self.assertIs(reloader.get_apis()[0], apis[0])
+
+    def test_reload_invalid_outputs(self):
+        reloader = ConfigReloader(self.conf_path, ConfigReader(self.conf_path), watch=True)
+        api1, api2 = reloader.get_apis()
+        outputs = api1.outputs
+
+        self._write_config({"apis": CONFIG["apis"], "logzio": {"url": "https://listener.logz.io:8071"}})
+        with self.assertLogs("src.config.ConfigReloader", level="ERROR"):
+            self.assertIsNone(reloader.reload())
+
+        # The whole reload is rejected, the current inputs keep their outputs
+        self.assertEqual(reloader.get_apis(), [api1, api2])
+        self.assertIs(api1.outputs, outputs)
+        self.assertEqual(len(outputs), 1)
+
+        # The next valid reload still reuses the unchanged instances
+        self._write_config(CONFIG)
+        new_apis = reloader.reload()
+        self.assertIs(new_apis[0], api1)
+        self.assertIs(new_apis[0].outputs[0], outputs[0])
+
+    def test_reload_replaces_outputs_metrics(self):
+        metrics.clear()
+        metrics.set_enabled(True)
+        self.addCleanup(metrics.clear)
+        self.addCleanup(metrics.set_enabled, False)
+        listener = CONFIG["logzio"]["url"]
+        outputs = [dict(CONFIG["logzio"], inputs=["api1"]), dict(CONFIG["logzio"], inputs=["api2"], token="other")]
+        self._write_config({"apis": CONFIG["apis"], "logzio": outputs})
+        reloader = ConfigReloader(self.conf_path, ConfigReader(self.conf_path))
+        first_shipper = reloader.get_apis()[0].outputs[0]
+
+        # Two outputs on the same listener are labelled by their index
+        self.assertIsNotNone(metrics.BULK_PENDING_LOGS.get(output=listener, output_index=0))
+        self.assertIsNotNone(metrics.BULK_PENDING_LOGS.get(output=listener, output_index=1))
+
+        # The replaced output stops reporting, and does not remove the series of the output that replaced it
+        self._write_config({"apis": CONFIG["apis"], "logzio": [outputs[1]]})
+        reloader.reload()
+        self.assertIsNone(first_shipper._metrics_gauges)
+        self.assertIsNotNone(metrics.BULK_PENDING_LOGS.get(output=listener, output_index=0))
+        self.assertIsNone(metrics.BULK_PENDING_LOGS.get(output=listener, output_index=1))
+
+    @patch.object(ApiFetcher, "send_request", return_value=[])
+    def test_update_apis(self, send_request):
+        api1, api2, api3 = [ApiFetcher(name=f"api{i}", url=f"https://some/url{i}", scrape_interval=60)
+                            for i in range(1, 4)]
+        task_manager = TaskManager()
+
+        task_manager.update_apis([api1, api2])
+        self.assertEqual(len(task_manager.threads), 2)
+        api1_thread = task_manager.api_tasks[id(api1)][1]
+
+        task_manager.update_apis([api1, api3])
+        self.assertEqual([api for api, _, _ in task_manager.api_tasks.values()], [api1, api3])
+        self.assertIs(task_manager.api_tasks[id(api1)][1], api1_thread)
+        self.assertEqual(len(task_manager.threads), 2)
+
+        for api, thread, event in task_manager.api_tasks.values():
+            event.set()
+            thread.join()
+        self.assertEqual(send_request.call_count, 3)
+
+    def test_profile_cycles(self):
+        profile_dir = os.path.join(self.tmp_dir.name, "profiles")
+        profiler = CycleProfiler(profile_dir, inputs=["api1"])
+        task_manager = TaskManager(profiler=profiler)
+        api1 = ApiFetcher(name="api1", url="https://some/url1")
+        api2 = ApiFetcher(name="api2", url="https://some/url2")
+
+        with patch.object(ApiFetcher, "send_request", return_value=[]) as send_request:
+            # Profiling is off
+            task_manager._run_api_task(api1)
+            self.assertFalse(os.path.exists(profile_dir))
+
+            profiler.toggle()
+            task_manager._run_api_task(api1)
+            task_manager._run_api_task(api2)
+
+        self.assertEqual(send_request.call_count, 3)
+        reports = sorted(os.listdir(profile_dir))
+        self.assertEqual(len(reports), 2)
+        self.assertTrue(reports[0].startswith("api1-") and reports[0].endswith(".pstats"))
+        self.assertTrue(reports[1].startswith("api1-") and reports[1].endswith(".txt"))
+        with open(os.path.join(profile_dir, reports[1])) as report_file:
+            report = report_file.read()
+        self.assertIn("allocations", report)
+        self.assertIn("_run_api_cycle", report)
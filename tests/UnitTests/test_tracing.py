@@ -0,0 +1,68 @@
+import json
+import os
+import responses
+import tempfile
+import unittest
+
+from src.apis.general.Api import ApiFetcher
+from src.manager.TaskManager import TaskManager
+from src.output.LogzioShipper import LogzioShipper, _TracedRetry
+from src.utils import tracing
+
+
+class TestTracing(unittest.TestCase):
+    """
+    Test cases for the cycles trace spans
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.trace_path = os.path.join(self.tmp_dir.name, "trace.json")
+
+    def tearDown(self):
+        tracing.stop_tracing()
+        self.tmp_dir.cleanup()
+
+    def _read_events(self):
+        with open(self.trace_path) as trace_file:
+            return [event for event in json.load(trace_file) if event.get("ph") in ("X", "i")]
+
+    @responses.activate
+    def test_cycle_spans(self):
+        responses.add(responses.GET, "https://some/url", json={"data": [{"a": 1}, {"a": 2}]})
+        responses.add(responses.POST, "https://listener.logz.io:8071/?token=token", status=200)
+        api = ApiFetcher(name="traced", url="https://some/url", response_data_path="data")
+        api.outputs = [LogzioShipper(token="token")]
+
+        tracing.start_tracing(self.trace_path)
+        TaskManager()._run_api_task(api)
+        tracing.stop_tracing()
+
+        events = {event["name"]: event for event in self._read_events()}
+        self.assertTrue({"cycle", "fetch page", "extract data", "ship bulk", "gzip", "listener post"}.issubset(events))
+        self.assertEqual(events["cycle"]["args"], {"input": "traced"})
+        self.assertEqual(events["fetch page"]["args"]["status"], 200)
+        self.assertEqual(events["listener post"]["args"], {"logs": 2, "status": 200})
+
+        # The spans of the cycle are within the cycle span
+        cycle = events["cycle"]
+        for name in ("fetch page", "ship bulk"):
+            self.assertGreaterEqual(events[name]["ts"], cycle["ts"])
+            self.assertLessEqual(events[name]["ts"] + events[name]["dur"], cycle["ts"] + cycle["dur"])
+
+    def test_retry_events(self):
+        tracing.start_tracing(self.trace_path)
+        _TracedRetry(total=3).increment(method="POST", url="/", error=ConnectionError("refused"))
+        tracing.stop_tracing()
+
+        events = self._read_events()
+        self.assertEqual(events[0]["name"], "listener retry")
+        self.assertEqual(events[0]["args"], {"status": None, "error": "refused"})
+
+    def test_disabled(self):
+        with tracing.span("not traced") as span:
+            span.set(status=200)
+        tracing.instant("not traced")
+
+        self.assertFalse(tracing.is_enabled())
+        self.assertFalse(os.path.exists(self.trace_path))
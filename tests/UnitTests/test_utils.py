@@ -1,5 +1,8 @@
+import json
 import unittest
 
+from src.utils import json_codec
+from src.utils.LogPreview import LogPreview
 from src.utils.processing_functions import extract_vars, get_nested_value, replace_dots, break_key_name, substitute_vars
 
 
@@ -46,9 +49,21 @@ class TestUtilsFunctions(unittest.TestCase):
             result2 = get_nested_value(test_dic, ["not_existing_field"])
         self.assertIn("WARNING:src.utils.processing_functions:Failed to find the next key: '3' nested in [1, 2, 3]", log.output)
         self.assertIn("WARNING:src.utils.processing_functions:Key 'not_existing_field' does not exists in: {'field': 'hello', 'arr': [1, 2, 3], 'obj_arr': [{'f1': 123}, {'f1': 456, 'f2': 'abc'}], 'obj': {'nested': 'random value'}, 'none': None, 'dot.in.name': 'the value'}", log.output)
+        self.assertEqual(len(log.output), 2)
         self.assertEqual(result, None)
         self.assertEqual(result2, None)
 
+    def test_log_preview(self):
+        # Small values are formatted as is
+        self.assertEqual(str(LogPreview({"b": 1, "a": [1, 2]})), "{'b': 1, 'a': [1, 2]}")
+        self.assertEqual(str(LogPreview(b"raw text")), "raw text")
+
+        # Large values are capped
+        self.assertEqual(str(LogPreview("x" * 1500)), "x" * 1000 + "... (500 more characters)")
+        preview = str(LogPreview({"items": [{"id": i, "message": "y" * 1000} for i in range(10000)]}))
+        self.assertLessEqual(len(preview), 1003)
+        self.assertTrue(preview.startswith("{'items': [{'id': 0, 'message': 'yyy"))
+
     def test_replace_dots(self):
         # Test cases
         should_replace = "field\\.name"
@@ -99,3 +114,44 @@ class TestUtilsFunctions(unittest.TestCase):
         self.assertEqual(substitute_vars(no_vars, extract_vars(no_vars), test_dic), no_vars)
         self.assertEqual(substitute_vars(flattened_obj, extract_vars(flattened_obj), test_dic),
                          "{\"limit\": 100, \"start_time\": \"abc\"}")
+
+
+class TestJsonCodec(unittest.TestCase):
+    """
+    Test the JSON codec with each of the backends
+    """
+
+    def setUp(self):
+        self.org_backend = json_codec.get_backend()
+
+    def tearDown(self):
+        json_codec.set_backend(self.org_backend)
+
+    def test_invalid_backend(self):
+        with self.assertRaises(ValueError):
+            json_codec.set_backend("simplejson")
+
+    def test_codec(self):
+        obj = {"msg": "héllo", "num": 2 ** 70, "nested": {"b": 1, "a": [1.5, None, True]}}
+
+        for backend in (json_codec.ORJSON_BACKEND, json_codec.STDLIB_BACKEND):
+            json_codec.set_backend(backend)
+
+            # Decoding from both str and bytes
+            self.assertEqual(json_codec.loads('{"a": [1, "b"]}'), {"a": [1, "b"]})
+            self.assertEqual(json_codec.loads(b'{"a": [1, "b"]}'), {"a": [1, "b"]})
+            with self.assertRaises(json_codec.JSONDecodeError):
+                json_codec.loads(b"not json")
+
+            # Integers above 64 bit are decoded exactly
+            self.assertEqual(json_codec.loads(b'{"a": 123456789012345678901234567890}'),
+                             {"a": 123456789012345678901234567890})
+            self.assertEqual(json_codec.loads('{"a": -123456789012345678901234}'), {"a": -123456789012345678901234})
+
+            # The string encoding is ASCII, the bytes encoding is UTF-8
+            self.assertTrue(json_codec.dumps(obj).isascii())
+            self.assertEqual(json.loads(json_codec.dumps(obj)), obj)
+            self.assertIn("héllo".encode(), json_codec.dumps_bytes(obj))
+            self.assertEqual(json.loads(json_codec.dumps_bytes(obj)), obj)
+
+            self.assertEqual(json_codec.dumps({"b": 1, "a": 2}, sort_keys=True).replace(" ", ""), '{"a":2,"b":1}')
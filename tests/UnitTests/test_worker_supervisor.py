@@ -0,0 +1,99 @@
+from os.path import abspath, dirname
+import os
+import signal
+import sys
+from unittest.mock import patch
+import unittest
+
+from src.config.ConfigReader import ConfigReader
+from src.manager.WorkerSupervisor import WorkerSupervisor
+
+
+curr_path = abspath(dirname(dirname(__file__)))
+
+
+def _crashing_worker(*args):
+    sys.exit(1)
+
+
+def _self_terminating_worker(*args):
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+class TestWorkerSupervisor(unittest.TestCase):
+    """
+    Test cases for the multiple worker processes supervisor
+    """
+
+    def test_worker_inputs(self):
+        conf_path = f"{curr_path}/testConfigs/multiple_apis_conf.yaml"
+        workers = [ConfigReader(conf_path, worker_index=i, workers_count=2).api_instances for i in range(2)]
+
+        # Every worker creates only its own inputs, and every input runs in exactly one worker
+        self.assertEqual(sorted(api.name for worker in workers for api in worker), ["cloudflare test", "logz-api"])
+        self.assertEqual([len(worker) for worker in workers], [1, 1])
+        self.assertEqual(len(ConfigReader(conf_path, worker_index=0, workers_count=1).api_instances), 2)
+
+    def test_worker_inputs_balanced(self):
+        apis = [{"name": f"input-{i}"} for i in range(10)]
+
+        # N inputs on N workers run one input per worker
+        workers = [ConfigReader.filter_worker_inputs(apis, worker, 10) for worker in range(10)]
+        self.assertTrue(all(len(worker_apis) == 1 for worker_apis in workers))
+        self.assertEqual(sorted(api["name"] for worker_apis in workers for api in worker_apis),
+                         sorted(api["name"] for api in apis))
+
+        # The workers get the same amount of inputs (up to one more), in any config order
+        workers = [ConfigReader.filter_worker_inputs(apis[::-1], worker, 4) for worker in range(4)]
+        self.assertEqual([len(worker_apis) for worker_apis in workers], [3, 3, 2, 2])
+        self.assertEqual(workers, [ConfigReader.filter_worker_inputs(apis, worker, 4) for worker in range(4)])
+
+    def test_inputs_count(self):
+        supervisor = WorkerSupervisor(f"{curr_path}/testConfigs/multiple_apis_conf.yaml", 4)
+        self.assertEqual(supervisor._get_inputs_count(), 2)
+
+    def test_collect_stats(self):
+        supervisor = WorkerSupervisor("conf.yaml", 2)
+        supervisor.stats_queue.put((0, "api1", 10, 1.5, True))
+        supervisor.stats_queue.put((0, "api1", 5, 2.5, False))
+        supervisor.stats_queue.put((1, "api2", 3, 0.5, True))
+
+        # The queue sends the stats in the background, so they may be collected over several calls
+        for _ in range(10):
+            supervisor._collect_stats(timeout=0.1)
+            if sum(api_stats["runs"] for worker in supervisor.stats.values() for api_stats in worker.values()) == 3:
+                break
+
+        self.assertEqual(supervisor.stats[0]["api1"], {"runs": 2, "failed_runs": 1, "logs": 15, "last_duration": 2.5})
+        self.assertEqual(supervisor.stats[1]["api2"], {"runs": 1, "failed_runs": 0, "logs": 3, "last_duration": 0.5})
+
+    def test_restart_crashed_worker(self):
+        supervisor = WorkerSupervisor("conf.yaml", 1)
+
+        with patch("src.manager.WorkerSupervisor._run_worker", _crashing_worker):
+            supervisor._start_worker(0)
+            first_process = supervisor.workers[0]["process"]
+            first_process.join()
+
+            with self.assertLogs("src.manager.WorkerSupervisor", level="INFO") as log:
+                self.assertTrue(supervisor._check_workers())
+            supervisor.workers[0]["process"].join()
+
+        self.assertIn("exited with code 1. Restarting it in 0 seconds.", log.output[0])
+        self.assertEqual(supervisor.workers[0]["restarts"], 1)
+        self.assertIsNot(supervisor.workers[0]["process"], first_process)
+
+        # A worker that keeps crashing is restarted with a delay
+        supervisor._check_workers()
+        self.assertEqual(supervisor.workers[0]["restarts"], 1)
+        self.assertEqual(supervisor.workers[0]["crashes_in_row"], 2)
+
+    def test_self_terminated_worker(self):
+        supervisor = WorkerSupervisor("conf.yaml", 1)
+
+        with patch("src.manager.WorkerSupervisor._run_worker", _self_terminating_worker):
+            supervisor._start_worker(0)
+            supervisor.workers[0]["process"].join()
+
+        self.assertFalse(supervisor._check_workers())
+        self.assertEqual(supervisor.workers[0]["restarts"], 0)